@@ -1,253 +1,126 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Blueprint, Flask, Response, abort, current_app, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
 import json
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Dict, Iterator, List, Any, Optional
 import logging
+import asyncio
+import contextvars
+import threading
+import time
+from assets import AssetBundle
+from batch import LocalBatchBackend, build_batch_from_env, format_jsonl, parse_batch_items
+from cache import ResponseCache, build_cache_from_env, is_cacheable
+from limiter import Overloaded
+from metrics import (ERRORS, HTTP_DURATION, PARTIAL_RESPONSES, RECIPES_SALVAGED, REGISTRY, STAGE_DURATION,
+                     TOOL_DURATION, build_profiler_from_env)
+from models import Recipe, dumps, loads, validate_recipes
+from normalizer import clean_raw_response
+from nutrition import NutritionDatabase, NutritionReport, get_nutrition_database
+from pantry import PantryIndex, build_pantry_from_env
+from prompts import is_structured, is_truncated, output_mode_from_env, recipe_edit_request, recipe_request, response_text
+from router import IntentRouter, build_router_from_env
+from scheduler import client_key, current_priority, parse_client_keys, request_context
+from sessions import SESSION_ID_RE, SessionManager, build_sessions_from_env, find_recipe_reference, merge_patch, new_session_id
+from singleflight import SingleFlight, build_single_flight_from_env
+from streaming import IncrementalRecipeParser, aiter_stream_content, format_sse, iter_stream_content, salvage_recipes
+from substitutions import (Substitution, SubstitutionGraph, build_substitutions_from_env, detect_context, diet_tags,
+                           extract_ingredient, format_substitutions, parse_substitutions, substitution_request)
+from transport import (OpenAIClients, Transport, build_hedge_clients_from_env, build_openai_clients,
+                       build_transport_from_env, describe_error)
 
-# Configuration du logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Charger les variables d'environnement
-load_dotenv()
+class FastJSONProvider(DefaultJSONProvider):
+    """Sérialise les réponses avec orjson quand il est disponible"""
 
-# Vérifier si la clé API est présente
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("La clé API OpenAI n'est pas définie. Veuillez créer un fichier .env avec OPENAI_API_KEY=votre_clé_api")
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Flask passe separators=(",", ":") en mode compact ; les autres options
+        # (indentation en mode debug) restent gérées par le fournisseur par défaut
+        if kwargs.keys() - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
 
-app = Flask(__name__)
-CORS(app)
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return loads(s)
 
-# Initialiser le client OpenAI avec la clé API
-client = OpenAI(api_key=api_key)
+# Routes de l'application, enregistrées par create_app
+api = Blueprint('recipes', __name__)
 
-# JavaScript code
-JAVASCRIPT_CODE = """
-document.addEventListener('DOMContentLoaded', function() {
-    const sendButton = document.getElementById('sendButton');
-    const userInput = document.getElementById('userInput');
-    const response = document.getElementById('response');
-    const error = document.getElementById('error');
-    const question = document.getElementById('question');
-    
-    async function sendMessage() {
-        const message = userInput.value;
+# Nombre de recettes générées par défaut pour une demande
+DEFAULT_RECIPE_COUNT = 3
+MAX_RECIPE_COUNT = 10
 
-        if (!message) return;
+# Orientations données à chaque appel en mode fan-out pour que les recettes
+# générées en parallèle ne se ressemblent pas
+DIVERSITY_HINTS = [
+    "une recette classique et traditionnelle",
+    "une recette rapide et simple",
+    "une recette originale ou revisitée",
+    "une recette légère et équilibrée",
+    "une recette généreuse et réconfortante",
+    "une recette d'inspiration étrangère",
+]
 
-        // Afficher la question
-        question.textContent = 'Votre demande : ' + message;
-        
-        response.textContent = 'Chargement...';
-        response.className = 'loading';
-        error.textContent = '';
-        userInput.value = '';
-
-        try {
-            console.log('Envoi de la requête...');
-            console.log('Message:', message);
-            
-            const requestBody = JSON.stringify({ message: message });
-            console.log('Corps de la requête:', requestBody);
-            
-            const res = await fetch('/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
-                body: requestBody
-            });
-            
-            console.log('Réponse reçue:', res.status);
-            
-            if (!res.ok) {
-                throw new Error(`HTTP error! status: ${res.status}`);
-            }
-            
-            const data = await res.json();
-            console.log('Données reçues:', data);
-            
-            if (data.error) {
-                error.textContent = 'Erreur: ' + data.error;
-                response.textContent = '';
-                response.className = '';
-                return;
-            }
-            
-            if (data.type === 'recipes' && data.data && data.data.recipes && Array.isArray(data.data.recipes)) {
-                let formattedResponse = '';
-                data.data.recipes.forEach((recipe, index) => {
-                    if (!recipe) return;
-                    
-                    formattedResponse += `Recette ${index + 1}: ${recipe.title || 'Sans titre'}\\n`;
-                    formattedResponse += `Pour ${recipe.servings || '?'} personnes\\n`;
-                    formattedResponse += `Temps de préparation: ${recipe.prep_time || '?'}\\n`;
-                    formattedResponse += `Temps de cuisson: ${recipe.cook_time || '?'}\\n`;
-                    formattedResponse += `Difficulté: ${recipe.difficulty || '?'}\\n\\n`;
-                    
-                    if (recipe.ingredients && Array.isArray(recipe.ingredients)) {
-                        formattedResponse += 'Ingrédients:\\n';
-                        recipe.ingredients.forEach(ing => {
-                            if (ing) {
-                                formattedResponse += `- ${ing.quantity || '?'} ${ing.unit || ''} de ${ing.name || '?'}\\n`;
-                            }
-                        });
-                    }
-                    
-                    if (recipe.steps && Array.isArray(recipe.steps)) {
-                        formattedResponse += '\\nÉtapes:\\n';
-                        recipe.steps.forEach(step => {
-                            if (step) {
-                                formattedResponse += `${step.step_number || '?'}. ${step.description || '?'}\\n`;
-                            }
-                        });
-                    }
-                    
-                    if (recipe.tips && Array.isArray(recipe.tips)) {
-                        formattedResponse += '\\nConseils:\\n';
-                        recipe.tips.forEach(tip => {
-                            if (tip) {
-                                formattedResponse += `- ${tip}\\n`;
-                            }
-                        });
-                    }
-                    
-                    formattedResponse += '\\n' + '-'.repeat(50) + '\\n\\n';
-                });
-                response.textContent = formattedResponse;
-                response.className = '';
-            } else {
-                response.textContent = 'Format de réponse inattendu. Voici la réponse brute:\\n' + JSON.stringify(data, null, 2);
-                response.className = '';
-            }
-        } catch (error) {
-            console.error('Erreur complète:', error);
-            document.getElementById('error').textContent = 'Erreur: ' + error.message;
-            response.textContent = '';
-            response.className = '';
-        }
-    }
+def asset_response(path: str) -> Response:
+    static_assets = services().assets
+    asset = static_assets.lookup(path)
+    if asset is None:
+        abort(404)
+    status, headers, body = static_assets.respond(
+        asset, request.headers.get('Accept-Encoding', ''), request.headers.get('If-None-Match', ''))
+    return Response(body, status=status, headers=headers)
 
-    // Ajouter les écouteurs d'événements
-    sendButton.addEventListener('click', sendMessage);
-    userInput.addEventListener('keypress', function(e) {
-        if (e.key === 'Enter') {
-            sendMessage();
-        }
-    });
-});
-"""
-
-# Page d'accueil HTML
-HOME_PAGE = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Chatbot de Recettes</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            max-width: 800px;
-            margin: 0 auto;
-            padding: 20px;
-            background-color: #f5f5f5;
-        }}
-        .chat-container {{
-            border: 1px solid #ccc;
-            padding: 20px;
-            border-radius: 5px;
-            margin-bottom: 20px;
-            background-color: white;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }}
-        .input-container {{
-            display: flex;
-            gap: 10px;
-            margin-bottom: 20px;
-        }}
-        input[type="text"] {{
-            flex: 1;
-            padding: 10px;
-            border: 1px solid #ccc;
-            border-radius: 5px;
-            font-size: 16px;
-        }}
-        button {{
-            padding: 10px 20px;
-            background-color: #007bff;
-            color: white;
-            border: none;
-            border-radius: 5px;
-            cursor: pointer;
-            font-size: 16px;
-            transition: background-color 0.2s;
-        }}
-        button:hover {{
-            background-color: #0056b3;
-        }}
-        #response {{
-            margin-top: 20px;
-            white-space: pre-wrap;
-            line-height: 1.5;
-        }}
-        .error {{
-            color: #dc3545;
-            margin-top: 10px;
-            padding: 10px;
-            border-radius: 5px;
-            background-color: #f8d7da;
-            border: 1px solid #f5c6cb;
-        }}
-        .question {{
-            background-color: #e9ecef;
-            padding: 15px;
-            border-radius: 5px;
-            margin-bottom: 20px;
-            font-style: italic;
-            color: #495057;
-        }}
-        .loading {{
-            color: #6c757d;
-            font-style: italic;
-        }}
-    </style>
-</head>
-<body>
-    <h1>Chatbot de Recettes</h1>
-    <div class="chat-container">
-        <div class="question" id="question"></div>
-        <div class="input-container">
-            <input type="text" id="userInput" placeholder="Ex: Nous sommes 4 et nous voulons manger un plat italien...">
-            <button id="sendButton">Envoyer</button>
-        </div>
-        <div id="response"></div>
-        <div id="error" class="error"></div>
-    </div>
-
-    <script>
-    {JAVASCRIPT_CODE}
-    </script>
-</body>
-</html>
-"""
-
-@app.route('/')
+@api.route('/')
 def home():
-    return render_template_string(HOME_PAGE)
+    return asset_response('/')
+
+@api.route('/assets/<name>')
+def static_asset(name):
+    return asset_response(request.path)
 
 class RecipeAgent:
-    def __init__(self):
+    def __init__(self, cache: Optional[ResponseCache] = None, nutrition: Optional[NutritionDatabase] = None,
+                 router: Optional[IntentRouter] = None, flights: Optional[SingleFlight] = None,
+                 sessions: Optional[SessionManager] = None, pantry: Optional[PantryIndex] = None,
+                 substitutions: Optional[SubstitutionGraph] = None, transport: Optional[Transport] = None,
+                 fan_out: bool = False, fan_out_retries: int = 1, salvage: bool = True,
+                 output_mode: Optional[str] = None):
+        self.cache = cache
+        # Forme de la réponse du modèle (json ou tools), RECIPE_OUTPUT_MODE si None
+        self.output_mode = output_mode
+        # Appels au modèle (délais, nouvelles tentatives, quotas)
+        self.transport = transport
+        # Mode fan-out par défaut : une requête par recette, exécutées en parallèle
+        self.fan_out = fan_out
+        self.fan_out_retries = fan_out_retries
+        # Réponse tronquée ou mal formée : recettes complètes gardées, seules les manquantes sont redemandées
+        self.salvage = salvage
+        # Graphe local de substitutions, consulté avant le modèle
+        self.substitutions = substitutions
+        # Corpus local de recettes, consulté avant le modèle par analyze_ingredients
+        self.pantry = pantry
+        # Dernières recettes de chaque session, pour les retouches
+        self.sessions = sessions
+        # Regroupement des demandes identiques simultanées
+        self.flights = flights
+        self.router = router if router is not None else IntentRouter()
+        # Table nutritionnelle, chargée au premier calcul si elle n'est pas fournie
+        self.nutrition = nutrition
         self.tools = {
             "generate_recipes": self.generate_recipes,
             "analyze_ingredients": self.analyze_ingredients,
             "suggest_substitutions": self.suggest_substitutions,
             "calculate_nutrition": self.calculate_nutrition
         }
+        self.async_tools = {
+            "generate_recipes": self.agenerate_recipes,
+            "analyze_ingredients": self.aanalyze_ingredients,
+            "suggest_substitutions": self.asuggest_substitutions,
+            "calculate_nutrition": self.acalculate_nutrition
+        }
         
         self.system_prompt = """Tu es un agent IA expert en cuisine qui aide les utilisateurs à créer des recettes personnalisées.
         Tu as accès à plusieurs outils pour répondre aux demandes des utilisateurs :
@@ -258,301 +131,1087 @@ class RecipeAgent:
 
         Utilise ces outils de manière appropriée pour répondre aux demandes des utilisateurs."""
 
-    def generate_recipes(self, prompt: str) -> Dict[str, Any]:
+    @staticmethod
+    def _flight_key(tool: str, prompt: str) -> str:
+        # Les demandes ne sont regroupées qu'à priorité égale : une demande
+        # interactive n'attend pas un calcul mené au rang d'un lot
+        return f"{current_priority()}:{ResponseCache.make_key(tool, prompt)}"
+
+    def _cached(self, tool: str, prompt: str, compute) -> Dict[str, Any]:
+        """Passe par le cache de réponses s'il est configuré
+
+        Les demandes identiques simultanées de même priorité partagent un seul calcul.
+        """
+        if self.cache is not None:
+            fetch = lambda: self.cache.get_or_compute(tool, prompt, compute)
+        else:
+            fetch = compute
+        if self.flights is None:
+            return fetch()
+        return self.flights.do(self._flight_key(tool, prompt), fetch)
+
+    async def _acached(self, tool: str, prompt: str, compute) -> Dict[str, Any]:
+        """Version coroutine de _cached, compute étant une fabrique de coroutine
+
+        Le cache (SQLite, calcul d'embedding) est interrogé dans un thread pour
+        ne pas bloquer la boucle d'événements.
+        """
+        async def fetch() -> Dict[str, Any]:
+            if self.cache is not None:
+                cached = await asyncio.to_thread(self.cache.get, tool, prompt)
+                if cached is not None:
+                    return cached
+            result = await compute()
+            if self.cache is not None and is_cacheable(result):
+                await asyncio.to_thread(self.cache.set, tool, prompt, result)
+            return result
+
+        if self.flights is None:
+            return await fetch()
+        return await self.flights.ado(self._flight_key(tool, prompt), fetch)
+
+    @staticmethod
+    def _recipes_cache_key(count: int) -> str:
+        # Le nombre de recettes fait partie de la clé, pas le mode d'exécution
+        if count == DEFAULT_RECIPE_COUNT:
+            return "generate_recipes"
+        return f"generate_recipes/{count}"
+
+    def generate_recipes(self, prompt: str, count: int = DEFAULT_RECIPE_COUNT,
+                         fan_out: Optional[bool] = None) -> Dict[str, Any]:
         """Génère des recettes personnalisées basées sur le prompt de l'utilisateur"""
+        if fan_out is None:
+            fan_out = self.fan_out
+        if fan_out:
+            compute = lambda: self._fan_out_recipes(prompt, count)
+        else:
+            compute = lambda: self._generate_recipes(prompt, count)
+        return self._cached(self._recipes_cache_key(count), prompt, compute)
+
+    async def agenerate_recipes(self, prompt: str, count: int = DEFAULT_RECIPE_COUNT,
+                                fan_out: Optional[bool] = None) -> Dict[str, Any]:
+        """Version coroutine de generate_recipes"""
+        if fan_out is None:
+            fan_out = self.fan_out
+        if fan_out:
+            compute = lambda: self._afan_out_recipes(prompt, count)
+        else:
+            compute = lambda: self._agenerate_recipes(prompt, count)
+        return await self._acached(self._recipes_cache_key(count), prompt, compute)
+
+    async def _agenerate_recipes(self, prompt: str, count: int = DEFAULT_RECIPE_COUNT) -> Dict[str, Any]:
+        try:
+            logger.debug(f"Génération de recettes (async) pour le prompt: {prompt}")
+            with STAGE_DURATION.time(stage="llm"):
+                response = await self.transport.acreate("generate_recipes", accept=self._recipes_accepted(count),
+                                                        **self._recipe_request(prompt, count))
+            result = self._parse_message(response.choices[0].message, count)
+            if "error" in result and self.salvage:
+                recipes = self._salvage_response(response.choices[0], count, result)
+                if recipes:
+                    extra = await self._afetch_remainder(prompt, recipes, count)
+                    result = self._merge_remainder(recipes, extra, count)
+            return result
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération des recettes: {str(e)}")
+            return describe_error(e)
+
+    def _generate_single_recipe(self, prompt: str, index: int) -> Optional[Dict[str, Any]]:
+        """Génère une seule recette orientée par un indice de diversité"""
+        hint = DIVERSITY_HINTS[index % len(DIVERSITY_HINTS)]
+        try:
+            with STAGE_DURATION.time(stage="llm"):
+                response = self.transport.create("generate_recipe", accept=self._recipes_accepted(1),
+                                                 **self._recipe_request(prompt, 1, hint))
+            recipes = self._recipes_in(response.choices[0], 1)
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération de la recette {index + 1}: {str(e)}")
+            return None
+        if not recipes:
+            logger.error(f"Recette {index + 1} invalide")
+            return None
+        return recipes[0]
+
+    async def _agenerate_single_recipe(self, prompt: str, index: int) -> Optional[Dict[str, Any]]:
+        hint = DIVERSITY_HINTS[index % len(DIVERSITY_HINTS)]
+        try:
+            with STAGE_DURATION.time(stage="llm"):
+                response = await self.transport.acreate("generate_recipe", accept=self._recipes_accepted(1),
+                                                        **self._recipe_request(prompt, 1, hint))
+            recipes = self._recipes_in(response.choices[0], 1)
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération de la recette {index + 1}: {str(e)}")
+            return None
+        if not recipes:
+            logger.error(f"Recette {index + 1} invalide")
+            return None
+        return recipes[0]
+
+    def _fan_out_recipes(self, prompt: str, count: int) -> Dict[str, Any]:
+        """Génère chaque recette dans un appel distinct, en parallèle"""
+        logger.debug(f"Génération de {count} recettes en fan-out pour le prompt: {prompt}")
+        slots: List[Optional[Dict[str, Any]]] = [None] * count
+        pending = list(range(count))
+        for attempt in range(1 + self.fan_out_retries):
+            with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                # Chaque thread garde le client et la priorité de la requête (ordonnanceur)
+                futures = {pool.submit(contextvars.copy_context().run, self._generate_single_recipe, prompt, i): i
+                           for i in pending}
+                for future in as_completed(futures):
+                    slots[futures[future]] = future.result()
+            # Seules les recettes en échec sont redemandées
+            pending = [i for i in pending if slots[i] is None]
+            if not pending:
+                break
+            logger.warning(f"{len(pending)} recette(s) en échec après la tentative {attempt + 1}")
+        return self._merge_fan_out(slots)
+
+    async def _afan_out_recipes(self, prompt: str, count: int) -> Dict[str, Any]:
+        logger.debug(f"Génération de {count} recettes en fan-out (async) pour le prompt: {prompt}")
+        slots: List[Optional[Dict[str, Any]]] = [None] * count
+        pending = list(range(count))
+        for attempt in range(1 + self.fan_out_retries):
+            results = await asyncio.gather(*(self._agenerate_single_recipe(prompt, i) for i in pending))
+            for i, recipe in zip(pending, results):
+                slots[i] = recipe
+            pending = [i for i in pending if slots[i] is None]
+            if not pending:
+                break
+            logger.warning(f"{len(pending)} recette(s) en échec après la tentative {attempt + 1}")
+        return self._merge_fan_out(slots)
+
+    def _merge_fan_out(self, slots: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Assemble les recettes obtenues en fan-out"""
+        recipes = [recipe for recipe in slots if recipe is not None]
+        if not recipes:
+            return {"error": "Aucune recette générée"}
+        result: Dict[str, Any] = {"recipes": recipes}
+        if len(recipes) < len(slots):
+            # Réponse exploitable mais incomplète : elle n'est pas mise en cache
+            result["partial"] = True
+            result["missing"] = len(slots) - len(recipes)
+        return result
+
+    def stream_recipes(self, prompt: str, session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Génère les recettes en streaming, chacune étant restituée dès qu'elle est complète"""
+        if self.cache is not None:
+            cached = self.cache.get("generate_recipes", prompt)
+            if cached is not None:
+                yield from cached["recipes"]
+                self.remember(session_id, prompt, cached)
+                return
+
+        logger.debug(f"Génération de recettes en streaming pour le prompt: {prompt}")
+        stream = self.transport.create("stream_recipes", **self._recipe_request(prompt), stream=True)
+
+        parser = IncrementalRecipeParser()
+        recipes = []
+        for content in iter_stream_content(stream):
+            for recipe in parser.feed(content):
+                recipe = self._clean_recipe(recipe)
+                if recipe is not None:
+                    recipes.append(recipe)
+                    yield recipe
+
+        # Flux interrompu ou recettes invalides : seules les recettes manquantes sont demandées
+        if self.salvage and 0 < len(recipes) < DEFAULT_RECIPE_COUNT:
+            extra = self._fetch_remainder(prompt, recipes, DEFAULT_RECIPE_COUNT)
+            yield from extra
+            recipes = self._merge_remainder(recipes, extra, DEFAULT_RECIPE_COUNT)["recipes"]
+
+        # Même règle que generate_recipes : seule une réponse complète est mise en cache
+        if self.cache is not None and len(recipes) == DEFAULT_RECIPE_COUNT:
+            self.cache.set("generate_recipes", prompt, {"recipes": recipes})
+        self.remember(session_id, prompt, {"recipes": recipes})
+
+    async def astream_recipes(self, prompt: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Version coroutine de stream_recipes"""
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, "generate_recipes", prompt)
+            if cached is not None:
+                for recipe in cached["recipes"]:
+                    yield recipe
+                await asyncio.to_thread(self.remember, session_id, prompt, cached)
+                return
+
+        logger.debug(f"Génération de recettes en streaming (async) pour le prompt: {prompt}")
+        stream = await self.transport.acreate("stream_recipes", **self._recipe_request(prompt), stream=True)
+
+        parser = IncrementalRecipeParser()
+        recipes = []
+        async for content in aiter_stream_content(stream):
+            for recipe in parser.feed(content):
+                recipe = self._clean_recipe(recipe)
+                if recipe is not None:
+                    recipes.append(recipe)
+                    yield recipe
+
+        if self.salvage and 0 < len(recipes) < DEFAULT_RECIPE_COUNT:
+            extra = await self._afetch_remainder(prompt, recipes, DEFAULT_RECIPE_COUNT)
+            for recipe in extra:
+                yield recipe
+            recipes = self._merge_remainder(recipes, extra, DEFAULT_RECIPE_COUNT)["recipes"]
+
+        if self.cache is not None and len(recipes) == DEFAULT_RECIPE_COUNT:
+            await asyncio.to_thread(self.cache.set, "generate_recipes", prompt, {"recipes": recipes})
+        await asyncio.to_thread(self.remember, session_id, prompt, {"recipes": recipes})
+
+    def _recipe_request(self, prompt: str, count: int = DEFAULT_RECIPE_COUNT,
+                        hint: Optional[str] = None, exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Paramètres de l'appel au modèle pour générer des recettes"""
+        return {
+            "model": "gpt-4.1-nano",
+            "temperature": 0.7,
+            # Budget proportionnel au nombre de recettes (2000 tokens pour 3)
+            "max_tokens": 2000 * count // DEFAULT_RECIPE_COUNT,
+            # Préfixe stable (prompt système, outil) puis la demande
+            **recipe_request(prompt, count, hint, mode=self.output_mode, exclude=exclude)
+        }
+
+    def _generate_recipes(self, prompt: str, count: int = DEFAULT_RECIPE_COUNT) -> Dict[str, Any]:
+        """Appelle le modèle pour générer les recettes (sans cache)"""
         try:
             logger.debug(f"Génération de recettes pour le prompt: {prompt}")
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": """Tu es un chef cuisinier expert qui crée des recettes personnalisées.
-                    IMPORTANT: 
-                    1. Réponds en JSON valide
-                    2. Évite les caractères spéciaux et apostrophes
-                    3. Utilise des points au lieu des retours à la ligne
-                    4. Utilise uniquement des guillemets doubles
-                    5. Inclus tous les champs requis
-                    6. Ne duplique pas de contenu
-                    7. Sois concis dans les descriptions
-                    8. Génère EXACTEMENT 3 recettes différentes
-                    9. Chaque recette doit être unique et adaptée à la demande
-                    
-                    Format JSON requis:
-                    {
-                        "recipes": [
-                            {
-                                "title": "Titre",
-                                "servings": "Nombre",
-                                "prep_time": "Minutes",
-                                "cook_time": "Minutes",
-                                "difficulty": "Facile/Moyen/Difficile",
-                                "ingredients": [
-                                    {
-                                        "name": "Ingrédient",
-                                        "quantity": "Quantité",
-                                        "unit": "Unité"
-                                    }
-                                ],
-                                "steps": [
-                                    {
-                                        "step_number": 1,
-                                        "description": "Étape"
-                                    }
-                                ],
-                                "tips": ["Conseil"]
-                            }
-                        ]
-                    }"""},
-                    {"role": "user", "content": f"Génère 3 recettes différentes pour: {prompt}"}
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
-            
-            # Log de la réponse brute
-            raw_response = response.choices[0].message.content
-            logger.debug(f"Réponse brute de l'API: {raw_response}")
-            
+            with STAGE_DURATION.time(stage="llm"):
+                response = self.transport.create("generate_recipes", accept=self._recipes_accepted(count),
+                                                 **self._recipe_request(prompt, count))
+            result = self._parse_message(response.choices[0].message, count)
+            if "error" in result and self.salvage:
+                recipes = self._salvage_response(response.choices[0], count, result)
+                if recipes:
+                    result = self._merge_remainder(recipes, self._fetch_remainder(prompt, recipes, count), count)
+            return result
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération des recettes: {str(e)}")
+            return describe_error(e)
+
+    def _recipes_accepted(self, count: int):
+        """Critère de validité d'une réponse quand l'appel est doublé : des recettes valides"""
+        return lambda response: "error" not in self._parse_message(response.choices[0].message, count)
+
+    def _salvage(self, choice: Any, count: int) -> List[Dict[str, Any]]:
+        """Recettes complètes et valides d'une réponse tronquée ou mal formée (au plus count)"""
+        with STAGE_DURATION.time(stage="salvage"):
+            recipes = []
+            for item in salvage_recipes(response_text(choice.message)):
+                recipe = self._clean_recipe(item)
+                if recipe is not None:
+                    recipes.append(recipe)
+        return recipes[:count]
+
+    def _salvage_response(self, choice: Any, count: int, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Partie exploitable d'une réponse de generate_recipes rejetée par _parse_message"""
+        recipes = self._salvage(choice, count)
+        cause = "tronquée par la limite de tokens" if is_truncated(choice) else "invalide"
+        if not recipes:
+            PARTIAL_RESPONSES.inc(outcome="failed")
+            logger.error(f"Réponse {cause} ({result['error']}), aucune recette récupérable")
+            return recipes
+        RECIPES_SALVAGED.inc(len(recipes))
+        logger.warning(f"Réponse {cause} ({result['error']}) : {len(recipes)} recette(s) sur {count} récupérée(s)")
+        return recipes
+
+    def _recipes_in(self, choice: Any, count: int) -> List[Dict[str, Any]]:
+        """Recettes d'une réponse, récupérées une à une si elle est invalide"""
+        result = self._parse_message(choice.message, count)
+        if "error" not in result:
+            return result["recipes"]
+        return self._salvage(choice, count) if self.salvage else []
+
+    def _remainder_request(self, prompt: str, recipes: List[Dict[str, Any]], count: int) -> Dict[str, Any]:
+        """Demande des seules recettes manquantes, différentes de celles déjà obtenues"""
+        return self._recipe_request(prompt, count - len(recipes),
+                                    exclude=[recipe["title"] for recipe in recipes])
+
+    def _fetch_remainder(self, prompt: str, recipes: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+        """Génère les recettes qui manquent à une réponse partielle"""
+        missing = count - len(recipes)
+        if missing <= 0:
+            return []
+        logger.debug(f"Complément de {missing} recette(s) pour le prompt: {prompt}")
+        try:
+            with STAGE_DURATION.time(stage="llm"):
+                response = self.transport.create("complete_recipes", accept=self._recipes_accepted(missing),
+                                                 **self._remainder_request(prompt, recipes, count))
+            return self._recipes_in(response.choices[0], missing)
+        except Exception as e:
+            logger.error(f"Erreur lors du complément des recettes: {str(e)}")
+            return []
+
+    async def _afetch_remainder(self, prompt: str, recipes: List[Dict[str, Any]],
+                                count: int) -> List[Dict[str, Any]]:
+        missing = count - len(recipes)
+        if missing <= 0:
+            return []
+        logger.debug(f"Complément de {missing} recette(s) (async) pour le prompt: {prompt}")
+        try:
+            with STAGE_DURATION.time(stage="llm"):
+                response = await self.transport.acreate("complete_recipes", accept=self._recipes_accepted(missing),
+                                                        **self._remainder_request(prompt, recipes, count))
+            return self._recipes_in(response.choices[0], missing)
+        except Exception as e:
+            logger.error(f"Erreur lors du complément des recettes: {str(e)}")
+            return []
+
+    def _merge_remainder(self, recipes: List[Dict[str, Any]], extra: List[Dict[str, Any]],
+                         count: int) -> Dict[str, Any]:
+        """Assemble les recettes récupérées et leur complément"""
+        recipes = recipes + extra
+        if len(recipes) >= count:
+            PARTIAL_RESPONSES.inc(outcome="completed" if extra else "salvaged")
+            return {"recipes": recipes[:count]}
+        # Réponse exploitable mais incomplète : elle n'est pas mise en cache
+        PARTIAL_RESPONSES.inc(outcome="partial")
+        return {"recipes": recipes, "partial": True, "missing": count - len(recipes)}
+
+    def _parse_message(self, message: Any, count: int = DEFAULT_RECIPE_COUNT) -> Dict[str, Any]:
+        """Parse la réponse du modèle, appel de fonction ou contenu JSON"""
+        return self._parse_recipes(response_text(message), count, structured=is_structured(message))
+
+    def _parse_recipes(self, raw_response: str, count: int = DEFAULT_RECIPE_COUNT,
+                       structured: bool = False) -> Dict[str, Any]:
+        """Nettoie, parse et valide la réponse brute du modèle
+
+        Les arguments d'un appel de fonction (`structured`) sont du JSON sans
+        texte autour : le nettoyage préalable est inutile.
+        """
+        # Log de la réponse brute
+        logger.debug(f"Réponse brute de l'API: {raw_response}")
+        
+        if structured:
+            with STAGE_DURATION.time(stage="validate"):
+                return self._validate_recipes(raw_response, count)
+
+        with STAGE_DURATION.time(stage="clean"):
             # Nettoyage de la réponse
             cleaned_response = raw_response.strip()
-            
+
             # Suppression des marqueurs de code si présents
             if cleaned_response.startswith('```json'):
                 cleaned_response = cleaned_response[7:]
             if cleaned_response.endswith('```'):
                 cleaned_response = cleaned_response[:-3]
             cleaned_response = cleaned_response.strip()
-            
+
             # Log après nettoyage initial
             logger.debug(f"Réponse après nettoyage initial: {cleaned_response}")
-            
+
             # Vérification de la validité du JSON avant nettoyage
             if not cleaned_response.startswith('{') or not cleaned_response.endswith('}'):
                 logger.error("La réponse n'est pas un objet JSON valide")
                 logger.error(f"Contenu reçu: {cleaned_response}")
+                ERRORS.inc(stage="clean", type="format")
                 return {"error": "Format de réponse invalide"}
-            
+
             # Nettoyage des caractères spéciaux
-            cleaned_response = cleaned_response.replace('\n', ' ').replace('\r', ' ')
-            cleaned_response = cleaned_response.replace('"', '"').replace('"', '"')
-            cleaned_response = cleaned_response.replace(''', "'").replace(''', "'")
-            cleaned_response = cleaned_response.replace(''', "'").replace(''', "'")
-            
+            cleaned_response = clean_raw_response(cleaned_response)
+
             # Log après nettoyage des caractères spéciaux
             logger.debug(f"Réponse après nettoyage des caractères spéciaux: {cleaned_response}")
-            
+
+        with STAGE_DURATION.time(stage="validate"):
+            return self._validate_recipes(cleaned_response, count)
+
+    def _validate_recipes(self, text: str, count: int = DEFAULT_RECIPE_COUNT) -> Dict[str, Any]:
+        """Parse le JSON des recettes et valide leur structure"""
+        try:
+            # Tentative de parsing avec gestion des erreurs détaillée
             try:
-                # Tentative de parsing avec gestion des erreurs détaillée
-                try:
-                    result = json.loads(cleaned_response)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Erreur de parsing JSON à la position {e.pos}: {e.msg}")
-                    logger.error(f"Contexte autour de l'erreur: {cleaned_response[max(0, e.pos-50):min(len(cleaned_response), e.pos+50)]}")
-                    return {"error": f"Erreur de parsing JSON: {str(e)}"}
-                
-                logger.debug(f"Réponse parsée avec succès: {result}")
-                
-                # Vérification de la structure
-                if not isinstance(result, dict):
-                    logger.error("La réponse n'est pas un dictionnaire")
-                    return {"error": "Structure de réponse invalide"}
-                
-                if "recipes" not in result:
-                    logger.error("La clé 'recipes' est manquante")
-                    return {"error": "Structure de réponse invalide"}
-                
-                if not isinstance(result["recipes"], list):
-                    logger.error("La liste des recettes est invalide")
-                    return {"error": "Structure de réponse invalide"}
-                
-                if not result["recipes"]:
-                    logger.error("La liste des recettes est vide")
-                    return {"error": "Aucune recette générée"}
-                
-                # Vérification du nombre de recettes
-                if len(result["recipes"]) != 3:
-                    logger.error(f"Nombre de recettes incorrect: {len(result['recipes'])} au lieu de 3")
-                    return {"error": "Le nombre de recettes doit être exactement 3"}
-                
-                # Nettoyage et validation des données
-                cleaned_recipes = []
-                for recipe in result["recipes"]:
-                    if not isinstance(recipe, dict):
-                        logger.error(f"Recette invalide: {recipe}")
-                        continue
-                    
-                    # Vérification des champs requis
-                    required_fields = ["title", "servings", "prep_time", "cook_time", "difficulty", "ingredients", "steps", "tips"]
-                    for field in required_fields:
-                        if field not in recipe:
-                            logger.error(f"Champ manquant dans la recette: {field}")
-                            recipe[field] = "" if field != "ingredients" and field != "steps" and field != "tips" else []
-                    
-                    # Nettoyage des champs texte
-                    for field in ["title", "servings", "prep_time", "cook_time", "difficulty"]:
-                        if field in recipe and recipe[field]:
-                            recipe[field] = str(recipe[field]).strip()
-                            recipe[field] = recipe[field].replace('\n', ' ').replace('\r', ' ')
-                            recipe[field] = recipe[field].replace('"', '"').replace('"', '"')
-                            recipe[field] = recipe[field].replace(''', "'").replace(''', "'")
-                            recipe[field] = recipe[field].replace(''', "'").replace(''', "'")
-                    
-                    # Nettoyage des ingrédients
-                    if "ingredients" in recipe and isinstance(recipe["ingredients"], list):
-                        cleaned_ingredients = []
-                        for ing in recipe["ingredients"]:
-                            if isinstance(ing, dict):
-                                cleaned_ing = {}
-                                for field in ["name", "quantity", "unit"]:
-                                    if field in ing and ing[field]:
-                                        cleaned_ing[field] = str(ing[field]).strip()
-                                        cleaned_ing[field] = cleaned_ing[field].replace('\n', ' ').replace('\r', ' ')
-                                        cleaned_ing[field] = cleaned_ing[field].replace('"', '"').replace('"', '"')
-                                        cleaned_ing[field] = cleaned_ing[field].replace(''', "'").replace(''', "'")
-                                        cleaned_ing[field] = cleaned_ing[field].replace(''', "'").replace(''', "'")
-                                if cleaned_ing:
-                                    cleaned_ingredients.append(cleaned_ing)
-                        recipe["ingredients"] = cleaned_ingredients
-                    
-                    # Nettoyage des étapes
-                    if "steps" in recipe and isinstance(recipe["steps"], list):
-                        cleaned_steps = []
-                        for step in recipe["steps"]:
-                            if isinstance(step, dict) and "description" in step and step["description"]:
-                                cleaned_step = {
-                                    "step_number": step.get("step_number", len(cleaned_steps) + 1),
-                                    "description": str(step["description"]).strip()
-                                    .replace('\n', ' ')
-                                    .replace('\r', ' ')
-                                    .replace('"', '"')
-                                    .replace('"', '"')
-                                    .replace(''', "'")
-                                    .replace(''', "'")
-                                    .replace(''', "'")
-                                    .replace(''', "'")
-                                }
-                                cleaned_steps.append(cleaned_step)
-                        recipe["steps"] = cleaned_steps
-                    
-                    # Nettoyage des conseils
-                    if "tips" in recipe and isinstance(recipe["tips"], list):
-                        recipe["tips"] = [
-                            str(tip).strip()
-                            .replace('\n', ' ')
-                            .replace('\r', ' ')
-                            .replace('"', '"')
-                            .replace('"', '"')
-                            .replace(''', "'")
-                            .replace(''', "'")
-                            .replace(''', "'")
-                            .replace(''', "'")
-                            for tip in recipe["tips"] if tip
-                        ]
-                    
-                    cleaned_recipes.append(recipe)
-                
-                # Vérification finale du nombre de recettes
-                if len(cleaned_recipes) != 3:
-                    logger.error(f"Nombre de recettes incorrect après nettoyage: {len(cleaned_recipes)} au lieu de 3")
-                    return {"error": "Le nombre de recettes doit être exactement 3"}
-                
-                result["recipes"] = cleaned_recipes
-                return result
-            except Exception as e:
-                logger.error(f"Erreur lors du traitement de la réponse: {str(e)}")
-                return {"error": str(e)}
-                
+                result = loads(text)
+            except json.JSONDecodeError as e:
+                logger.error(f"Erreur de parsing JSON à la position {e.pos}: {e.msg}")
+                logger.error(f"Contexte autour de l'erreur: {text[max(0, e.pos-50):min(len(text), e.pos+50)]}")
+                ERRORS.inc(stage="validate", type="json")
+                return {"error": f"Erreur de parsing JSON: {str(e)}"}
+            
+            logger.debug(f"Réponse parsée avec succès: {result}")
+            
+            # Vérification de la structure
+            if not isinstance(result, dict) or not isinstance(result.get("recipes"), list):
+                logger.error("La réponse doit être un objet contenant la liste 'recipes'")
+                ERRORS.inc(stage="validate", type="structure")
+                return {"error": "Structure de réponse invalide"}
+            
+            if not result["recipes"]:
+                logger.error("La liste des recettes est vide")
+                ERRORS.inc(stage="validate", type="empty")
+                return {"error": "Aucune recette générée"}
+            
+            # Validation et nettoyage en une passe, toutes les erreurs sont remontées
+            recipes, errors = validate_recipes(result["recipes"], count)
+            for error in errors:
+                logger.error(error)
+            
+            if len(recipes) != count:
+                ERRORS.inc(stage="validate", type="count")
+                return {"error": f"Le nombre de recettes doit être exactement {count}"}
+            
+            result["recipes"] = [recipe.to_dict() for recipe in recipes]
+            return result
         except Exception as e:
-            logger.error(f"Erreur lors de la génération des recettes: {str(e)}")
+            logger.error(f"Erreur lors du traitement de la réponse: {str(e)}")
+            ERRORS.inc(stage="validate", type=type(e).__name__)
             return {"error": str(e)}
 
-    def analyze_ingredients(self, ingredients: List[str]) -> Dict[str, Any]:
-        """Analyse les ingrédients disponibles et suggère des recettes possibles"""
+    def _clean_recipe(self, recipe: Any) -> Optional[Dict[str, Any]]:
+        """Valide et nettoie une recette, retourne None si elle est inutilisable"""
+        errors: List[str] = []
+        validated = Recipe.from_dict(recipe, errors=errors)
+        for error in errors:
+            logger.error(error)
+        return validated.to_dict() if validated is not None else None
+
+    def edit_target(self, user_input: str, session_id: Optional[str]) -> Optional[int]:
+        """Indice de la recette de la session que la demande retouche, ou None"""
+        if self.sessions is None or not session_id:
+            return None
+        return find_recipe_reference(user_input, len(self.sessions.recipes(session_id)))
+
+    def remember(self, session_id: Optional[str], prompt: str, result: Dict[str, Any]) -> None:
+        """Garde les recettes générées pour les retouches de la session et dans le garde-manger"""
+        recipes = result.get("recipes")
+        if not recipes:
+            return
+        if self.pantry is not None:
+            # Les recettes déjà présentes (réponse en cache) sont ignorées
+            self.pantry.add_recipes(recipes, source="generated")
+        if self.sessions is not None and session_id:
+            self.sessions.remember(session_id, prompt, recipes)
+
+    def _edit_request(self, recipe: Dict[str, Any], instruction: str) -> Dict[str, Any]:
+        """Paramètres de l'appel au modèle pour retoucher une recette"""
+        return {
+            "model": "gpt-4.1-nano",
+            "temperature": 0.7,
+            # Le patch ne contient que les champs modifiés
+            "max_tokens": 800,
+            **recipe_edit_request(recipe, instruction)
+        }
+
+    def _patched_recipe(self, recipe: Dict[str, Any], content: str) -> Optional[Dict[str, Any]]:
+        """Applique le patch renvoyé par le modèle et valide la recette obtenue"""
+        try:
+            patch = loads(content)
+        except ValueError:
+            logger.error(f"Patch de recette invalide: {content}")
+            return None
+        if not isinstance(patch, dict):
+            logger.error(f"Patch de recette invalide: {content}")
+            return None
+        return self._clean_recipe(merge_patch(recipe, patch))
+
+    def edit_recipe(self, session_id: str, index: int, instruction: str) -> Dict[str, Any]:
+        """Retouche une recette de la session au lieu de régénérer toute la série"""
+        try:
+            recipe = self.sessions.recipes(session_id)[index]
+            logger.debug(f"Retouche de la recette {index + 1} de la session {session_id}: {instruction}")
+            with STAGE_DURATION.time(stage="llm"):
+                response = self.transport.create("edit_recipe", **self._edit_request(recipe, instruction))
+            return self._apply_edit(session_id, index, recipe, response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Erreur lors de la retouche de la recette: {str(e)}")
+            return describe_error(e)
+
+    async def aedit_recipe(self, session_id: str, index: int, instruction: str) -> Dict[str, Any]:
+        """Version coroutine de edit_recipe"""
+        try:
+            recipe = (await asyncio.to_thread(self.sessions.recipes, session_id))[index]
+            logger.debug(f"Retouche de la recette {index + 1} de la session {session_id} (async): {instruction}")
+            with STAGE_DURATION.time(stage="llm"):
+                response = await self.transport.acreate("edit_recipe", **self._edit_request(recipe, instruction))
+            return await asyncio.to_thread(self._apply_edit, session_id, index, recipe,
+                                           response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Erreur lors de la retouche de la recette: {str(e)}")
+            return describe_error(e)
+
+    def _apply_edit(self, session_id: str, index: int, recipe: Dict[str, Any], content: str) -> Dict[str, Any]:
+        with STAGE_DURATION.time(stage="validate"):
+            edited = self._patched_recipe(recipe, content)
+        if edited is None:
+            ERRORS.inc(stage="validate", type="patch")
+            return {"error": "Retouche de la recette invalide"}
+        return {"recipes": self.sessions.replace(session_id, index, edited), "edited_index": index}
+
+    def analyze_ingredients(self, ingredients: List[str], pantry: bool = True) -> Dict[str, Any]:
+        """Analyse les ingrédients disponibles et suggère des recettes possibles
+
+        Avec `pantry`, les recettes du garde-manger réalisables avec ces
+        ingrédients sont proposées sans appel au modèle ; il n'est sollicité
+        qu'à défaut.
+        """
+        local = self._pantry_suggestions(ingredients) if pantry else None
+        if local is not None:
+            return local
+        return self._cached("analyze_ingredients", ', '.join(ingredients),
+                            lambda: self._analyze_ingredients(ingredients))
+
+    async def aanalyze_ingredients(self, ingredients: List[str], pantry: bool = True) -> Dict[str, Any]:
+        """Version coroutine de analyze_ingredients"""
+        local = await asyncio.to_thread(self._pantry_suggestions, ingredients) if pantry else None
+        if local is not None:
+            return local
+        return await self._acached("analyze_ingredients", ', '.join(ingredients),
+                                   lambda: self._aanalyze_ingredients(ingredients))
+
+    def _pantry_suggestions(self, ingredients: List[str]) -> Optional[Dict[str, Any]]:
+        """Recettes du corpus local pour ces ingrédients, ou None"""
+        if self.pantry is None:
+            return None
+        with STAGE_DURATION.time(stage="pantry"):
+            return self.pantry.suggest(ingredients)
+
+    def _analysis_request(self, ingredients: List[str]) -> Dict[str, Any]:
+        """Paramètres de l'appel au modèle pour analyser des ingrédients"""
+        return {
+            "model": "gpt-4.1-nano",
+            "messages": [
+                {"role": "system", "content": "Analyse les ingrédients fournis et suggère des recettes possibles."},
+                {"role": "user", "content": f"Analyse ces ingrédients : {', '.join(ingredients)}"}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 500
+        }
+
+    def _analyze_ingredients(self, ingredients: List[str]) -> Dict[str, Any]:
+        """Appelle le modèle pour analyser les ingrédients (sans cache)"""
         try:
             logger.debug(f"Analyse des ingrédients: {ingredients}")
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": "Analyse les ingrédients fournis et suggère des recettes possibles."},
-                    {"role": "user", "content": f"Analyse ces ingrédients : {', '.join(ingredients)}"}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
+            response = self.transport.create("analyze_ingredients", **self._analysis_request(ingredients))
             return {"analysis": response.choices[0].message.content}
         except Exception as e:
             logger.error(f"Erreur lors de l'analyse des ingrédients: {str(e)}")
-            return {"error": str(e)}
+            return describe_error(e)
 
-    def suggest_substitutions(self, ingredient: str) -> Dict[str, Any]:
-        """Suggère des substitutions pour un ingrédient donné"""
+    async def _aanalyze_ingredients(self, ingredients: List[str]) -> Dict[str, Any]:
+        try:
+            logger.debug(f"Analyse des ingrédients (async): {ingredients}")
+            response = await self.transport.acreate("analyze_ingredients", **self._analysis_request(ingredients))
+            return {"analysis": response.choices[0].message.content}
+        except Exception as e:
+            logger.error(f"Erreur lors de l'analyse des ingrédients: {str(e)}")
+            return describe_error(e)
+
+    def suggest_substitutions(self, ingredient: str, context: Optional[str] = None,
+                              diet: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Suggère des substitutions pour un ingrédient donné
+
+        Le graphe local répond en priorité, filtré par contexte (pâtisserie,
+        sauce...) et par régime. Pour un ingrédient qu'il ne connaît pas, la
+        réponse structurée du modèle y est ajoutée avant d'être filtrée.
+        """
+        local = self._local_substitutions(ingredient, context, diet)
+        if local is not None:
+            return local
+        result = self._cached("suggest_substitutions", ingredient,
+                              lambda: self._suggest_substitutions(ingredient))
+        return self._learn_substitutions(ingredient, result, context, diet)
+
+    async def asuggest_substitutions(self, ingredient: str, context: Optional[str] = None,
+                                     diet: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Version coroutine de suggest_substitutions"""
+        local = await asyncio.to_thread(self._local_substitutions, ingredient, context, diet)
+        if local is not None:
+            return local
+        result = await self._acached("suggest_substitutions", ingredient,
+                                     lambda: self._asuggest_substitutions(ingredient))
+        return await asyncio.to_thread(self._learn_substitutions, ingredient, result, context, diet)
+
+    def _local_substitutions(self, ingredient: str, context: Optional[str],
+                             diet: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        """Substitutions tirées du graphe local, ou None"""
+        if self.substitutions is None:
+            return None
+        with STAGE_DURATION.time(stage="substitutions"):
+            return self.substitutions.answer(ingredient, context, diet_tags(diet))
+
+    def _learn_substitutions(self, ingredient: str, result: Dict[str, Any], context: Optional[str],
+                             diet: Optional[List[str]]) -> Dict[str, Any]:
+        """Ajoute la réponse du modèle au graphe et la filtre comme une réponse locale"""
+        if self.substitutions is None or not result.get("options"):
+            return result
+        self.substitutions.learn(result.get("ingredient") or ingredient, result["options"])
+        return self._local_substitutions(ingredient, context, diet) or result
+
+    def _substitution_result(self, ingredient: str, content: str) -> Dict[str, Any]:
+        """Substitutions structurées de la réponse, ou son texte brut si elle n'est pas exploitable"""
+        entries = parse_substitutions(content)
+        options = entries.get(ingredient) or next(iter(entries.values()), None)
+        substitutions = [s for s in (Substitution.from_dict(option) for option in options or ()) if s is not None]
+        if not substitutions:
+            return {"substitutions": content}
+        return format_substitutions(ingredient, substitutions)
+
+    def _suggest_substitutions(self, ingredient: str) -> Dict[str, Any]:
+        """Appelle le modèle pour suggérer des substitutions (sans cache)"""
         try:
             logger.debug(f"Suggestion de substitutions pour: {ingredient}")
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": "Suggère des substitutions possibles pour l'ingrédient fourni."},
-                    {"role": "user", "content": f"Quelles sont les meilleures substitutions pour {ingredient} ?"}
-                ],
-                temperature=0.7,
-                max_tokens=300
-            )
-            return {"substitutions": response.choices[0].message.content}
+            response = self.transport.create("suggest_substitutions", **substitution_request([ingredient]))
+            return self._substitution_result(ingredient, response.choices[0].message.content)
         except Exception as e:
             logger.error(f"Erreur lors de la suggestion de substitutions: {str(e)}")
-            return {"error": str(e)}
+            return describe_error(e)
+
+    async def _asuggest_substitutions(self, ingredient: str) -> Dict[str, Any]:
+        try:
+            logger.debug(f"Suggestion de substitutions (async) pour: {ingredient}")
+            response = await self.transport.acreate("suggest_substitutions", **substitution_request([ingredient]))
+            return self._substitution_result(ingredient, response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Erreur lors de la suggestion de substitutions: {str(e)}")
+            return describe_error(e)
+
+    def _nutrition_request(self, ingredients: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Paramètres de l'appel au modèle pour les ingrédients absents de la table locale"""
+        return {
+            "model": "gpt-4.1-nano",
+            "messages": [
+                {"role": "system", "content": """Estime les apports nutritionnels totaux des ingrédients fournis.
+                Réponds uniquement avec un objet JSON de la forme
+                {"calories": nombre, "proteins": nombre, "carbs": nombre, "fat": nombre}
+                (calories en kcal, le reste en grammes, pour l'ensemble des ingrédients)."""},
+                {"role": "user", "content": f"Ingrédients : {dumps(ingredients)}"}
+            ],
+            "temperature": 0,
+            "max_tokens": 200,
+            "response_format": {"type": "json_object"}
+        }
+
+    def _nutrition_report(self, recipe: Dict[str, Any]) -> NutritionReport:
+        database = self.nutrition or get_nutrition_database()
+        with STAGE_DURATION.time(stage="nutrition_local"):
+            report = database.analyze(recipe)
+        logger.debug(f"Calcul nutritionnel local: {len(report.resolved)} ingrédients résolus, {len(report.unresolved)} non résolus")
+        return report
+
+    def _unresolved_ingredients(self, report: NutritionReport) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in ingredient.items() if k != "reason"} for ingredient in report.unresolved]
+
+    def _merge_estimate(self, report: NutritionReport, content: str) -> Dict[str, Any]:
+        """Ajoute au rapport local l'estimation du modèle pour les ingrédients non résolus"""
+        try:
+            estimate = loads(content)
+        except ValueError:
+            logger.error(f"Estimation nutritionnelle invalide: {content}")
+            estimate = None
+        if isinstance(estimate, dict):
+            report.add(estimate)
+            report.source = "local+llm"
+        return {"nutrition": report.to_dict()}
 
     def calculate_nutrition(self, recipe: Dict[str, Any]) -> Dict[str, Any]:
-        """Calcule les informations nutritionnelles pour une recette"""
+        """Calcule les informations nutritionnelles pour une recette
+
+        Le calcul est local ; le modèle n'est appelé que pour les ingrédients
+        absents de la table.
+        """
         try:
-            logger.debug(f"Calcul nutritionnel pour la recette: {recipe}")
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": "Calcule les informations nutritionnelles pour la recette fournie."},
-                    {"role": "user", "content": f"Calcule les informations nutritionnelles pour cette recette : {json.dumps(recipe)}"}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            return {"nutrition": response.choices[0].message.content}
+            report = self._nutrition_report(recipe)
+            if not report.unresolved:
+                return {"nutrition": report.to_dict()}
+            response = self.transport.create("calculate_nutrition", **self._nutrition_request(self._unresolved_ingredients(report)))
+            return self._merge_estimate(report, response.choices[0].message.content)
         except Exception as e:
             logger.error(f"Erreur lors du calcul nutritionnel: {str(e)}")
-            return {"error": str(e)}
+            return describe_error(e)
+
+    async def acalculate_nutrition(self, recipe: Dict[str, Any]) -> Dict[str, Any]:
+        """Version coroutine de calculate_nutrition"""
+        try:
+            report = self._nutrition_report(recipe)
+            if not report.unresolved:
+                return {"nutrition": report.to_dict()}
+            response = await self.transport.acreate("calculate_nutrition", **self._nutrition_request(self._unresolved_ingredients(report)))
+            return self._merge_estimate(report, response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul nutritionnel: {str(e)}")
+            return describe_error(e)
 
-    def process_request(self, user_input: str) -> Dict[str, Any]:
-        """Traite la demande de l'utilisateur en utilisant les outils appropriés"""
+    def detect_intent(self, user_input: str) -> str:
+        """Détermine l'outil à utiliser pour la demande de l'utilisateur"""
+        with STAGE_DURATION.time(stage="route"):
+            decision = self.router.route(user_input)
+        logger.debug(f"Routage: {decision.to_dict()}")
+        return decision.intent
+
+    def _dispatch(self, user_input: str, **options):
+        """Retourne le type de réponse, l'outil et ses arguments pour la demande"""
+        intent = self.detect_intent(user_input)
+        if intent == "generate_recipes":
+            return "recipes", intent, (user_input,), options
+        # Les entités extraites remplacent le message complet dans les prompts courts
+        entities = self.router.extract_entities(user_input)
+        ingredients = entities.get("ingredients")
+        if intent == "suggest_substitutions":
+            kwargs = {"context": detect_context(user_input), "diet": entities.get("diet")}
+            if ingredients:
+                return "substitutions", intent, (ingredients[0],), kwargs
+            # Ingrédient absent du vocabulaire : d'après la formulation de la demande
+            ingredient = extract_ingredient(user_input) or user_input.split("substitution")[-1].strip()
+            return "substitutions", intent, (ingredient,), kwargs
+        # Le garde-manger ne répond pas aux questions nutritionnelles
+        pantry = not self.router.is_nutrition_question(user_input)
+        return "analysis", intent, (ingredients or [user_input],), {"pantry": pantry}
+
+    def cached_response(self, user_input: str, count: int = DEFAULT_RECIPE_COUNT,
+                        **options) -> Optional[Dict[str, Any]]:
+        """Réponse déjà en cache pour une demande de recettes, sans appel au modèle"""
+        if self.cache is None or self.detect_intent(user_input) != "generate_recipes":
+            return None
+        cached = self.cache.get(self._recipes_cache_key(count), user_input, count_miss=False)
+        if cached is None:
+            return None
+        return {"type": "recipes", "data": cached}
+
+    def process_request(self, user_input: str, session_id: Optional[str] = None, **options) -> Dict[str, Any]:
+        """Traite la demande de l'utilisateur en utilisant les outils appropriés
+
+        Les options (count, fan_out) sont transmises à generate_recipes. Avec
+        une session, une demande qui désigne une recette déjà générée la
+        retouche au lieu d'en générer de nouvelles.
+        """
         try:
             logger.debug(f"Traitement de la demande: {user_input}")
-            
-            # Si la demande contient des ingrédients ou une demande de recette, utiliser generate_recipes
-            if any(keyword in user_input.lower() for keyword in ["recette", "cuisiner", "préparer", "faire", "ingrédients"]):
-                recipes = self.generate_recipes(user_input)
-                return {
-                    "type": "recipes",
-                    "data": recipes
-                }
-            elif "substitution" in user_input.lower():
-                # Extraction de l'ingrédient à substituer
-                ingredient = user_input.split("substitution")[-1].strip()
-                return {
-                    "type": "substitutions",
-                    "data": self.suggest_substitutions(ingredient)
-                }
+            edit_index = self.edit_target(user_input, session_id)
+            if edit_index is not None:
+                response_type, tool, args, kwargs = "recipes", "edit_recipe", (session_id, edit_index, user_input), {}
+                function = self.edit_recipe
             else:
-                return {
-                    "type": "analysis",
-                    "data": self.analyze_ingredients([user_input])
-                }
+                response_type, tool, args, kwargs = self._dispatch(user_input, **options)
+                function = self.tools[tool]
+            with TOOL_DURATION.time(tool=tool, outcome="ok") as timer:
+                data = function(*args, **kwargs)
+                if "error" in data:
+                    timer.set(outcome="error")
+            if tool == "generate_recipes":
+                self.remember(session_id, user_input, data)
+            return {
+                "type": response_type,
+                "data": data
+            }
         except Exception as e:
             logger.error(f"Erreur lors du traitement de la demande: {str(e)}")
             return {"error": str(e)}
 
-# Créer une instance de l'agent
-recipe_agent = RecipeAgent()
+    async def aprocess_request(self, user_input: str, session_id: Optional[str] = None, **options) -> Dict[str, Any]:
+        """Version coroutine de process_request"""
+        try:
+            logger.debug(f"Traitement de la demande (async): {user_input}")
+            # Stockage des sessions et cache peuvent être sur disque : hors de la boucle d'événements
+            edit_index = await asyncio.to_thread(self.edit_target, user_input, session_id)
+            if edit_index is not None:
+                response_type, tool, args, kwargs = "recipes", "edit_recipe", (session_id, edit_index, user_input), {}
+                function = self.aedit_recipe
+            else:
+                response_type, tool, args, kwargs = self._dispatch(user_input, **options)
+                function = self.async_tools[tool]
+            with TOOL_DURATION.time(tool=tool, outcome="ok") as timer:
+                data = await function(*args, **kwargs)
+                if "error" in data:
+                    timer.set(outcome="error")
+            if tool == "generate_recipes":
+                await asyncio.to_thread(self.remember, session_id, user_input, data)
+            return {
+                "type": response_type,
+                "data": data
+            }
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement de la demande: {str(e)}")
+            return {"error": str(e)}
+
+def parse_session_id(data: Dict[str, Any], sessions: Optional[SessionManager]):
+    """Identifiant de session de la requête, ou un nouveau si les sessions sont activées"""
+    if sessions is None:
+        return None, None
+    session_id = data.get('session_id')
+    if session_id is None:
+        return new_session_id(), None
+    if not isinstance(session_id, str) or not SESSION_ID_RE.match(session_id):
+        return None, "session_id doit contenir de 1 à 64 caractères alphanumériques, - ou _"
+    return session_id, None
+
+def request_client() -> str:
+    """Client de la requête, pour les quotas : clé d'API reconnue (X-API-Key) ou adresse IP"""
+    return client_key(request.headers.get('X-API-Key'), request.remote_addr,
+                      services().config['RECIPE_CLIENT_API_KEYS'])
+
+def overloaded_response(error: Overloaded):
+    logger.warning(f"Requête refusée ({error.status}): {error.message}")
+    return jsonify({"error": error.message}), error.status, {"Retry-After": str(error.retry_after)}
+
+def parse_recipe_options(data: Dict[str, Any]):
+    """Extrait les options de génération (recipe_count, fan_out) du corps de la requête"""
+    options: Dict[str, Any] = {}
+    if 'recipe_count' in data:
+        count = data['recipe_count']
+        if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_RECIPE_COUNT:
+            return None, f"recipe_count doit être un entier entre 1 et {MAX_RECIPE_COUNT}"
+        options['count'] = count
+    if 'fan_out' in data:
+        if not isinstance(data['fan_out'], bool):
+            return None, "fan_out doit être un booléen"
+        options['fan_out'] = data['fan_out']
+    return options, None
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+class RecipeServices:
+    """Composants de l'application, construits à leur première utilisation
+
+    Ni l'import du module ni create_app ne chargent de données ou ne créent de
+    client. preload() charge d'avance les données en lecture seule (table
+    nutritionnelle, routeur, garde-manger, substitutions, page d'accueil) :
+    chargées avant le fork des workers, elles sont partagées entre eux. Les
+    clients OpenAI et les connexions SQLite sont toujours créés dans le worker.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.clients = OpenAIClients(lambda: build_openai_clients(config.get('OPENAI_API_KEY')))
+        # Profileur des requêtes lentes, activé par RECIPE_PROFILE_SLOW_MS
+        self.profiler = build_profiler_from_env()
+        self._components: Dict[str, Any] = {}
+        self._lock = threading.RLock()
 
-@app.route('/api/chat', methods=['POST'])
+    def _component(self, name: str, build):
+        if name in self._components:
+            return self._components[name]
+        with self._lock:
+            if name not in self._components:
+                start = time.perf_counter()
+                self._components[name] = build()
+                logger.debug(f"Composant {name} construit en {(time.perf_counter() - start) * 1000:.0f} ms")
+            return self._components[name]
+
+    @property
+    def nutrition(self) -> NutritionDatabase:
+        return self._component('nutrition', get_nutrition_database)
+
+    @property
+    def router(self) -> IntentRouter:
+        return self._component('router', lambda: build_router_from_env(self.nutrition.vocabulary()))
+
+    @property
+    def pantry(self) -> Optional[PantryIndex]:
+        return self._component('pantry', lambda: build_pantry_from_env(self.nutrition))
+
+    @property
+    def substitutions(self) -> Optional[SubstitutionGraph]:
+        return self._component('substitutions', lambda: build_substitutions_from_env(self.nutrition))
+
+    @property
+    def assets(self) -> AssetBundle:
+        # Page d'accueil et fichiers statiques (web/), minifiés et compressés une fois pour toutes
+        return self._component('assets', AssetBundle)
+
+    @property
+    def transport(self) -> Transport:
+        # Délais par outil, nouvelles tentatives, disjoncteur et quotas
+        return self._component('transport', lambda: build_transport_from_env(
+            self.clients, build_hedge_clients_from_env(self.config.get('OPENAI_API_KEY'))))
+
+    @property
+    def agent(self) -> RecipeAgent:
+        return self._component('agent', lambda: RecipeAgent(
+            cache=build_cache_from_env(self.clients),
+            router=self.router,
+            flights=build_single_flight_from_env(),
+            sessions=build_sessions_from_env(),
+            pantry=self.pantry,
+            substitutions=self.substitutions,
+            transport=self.transport,
+            fan_out=self.config['RECIPE_FAN_OUT'],
+            fan_out_retries=self.config['RECIPE_FAN_OUT_RETRIES'],
+            salvage=self.config['RECIPE_SALVAGE'],
+            output_mode=self.config['RECIPE_OUTPUT_MODE'],
+        ))
+
+    @property
+    def batch(self) -> LocalBatchBackend:
+        return self._component('batch', lambda: build_batch_from_env(self.agent))
+
+    def preload(self) -> None:
+        """Charge les données en lecture seule, sans client ni connexion"""
+        start = time.perf_counter()
+        self.router, self.pantry, self.substitutions, self.assets
+        logger.info(f"Données préchargées en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def admit(self, client: str) -> None:
+        """Lève Overloaded si le client a épuisé son quota de tokens"""
+        scheduler = self.transport.scheduler
+        if scheduler is not None:
+            scheduler.admit(client)
+
+    async def aadmit(self, client: str) -> None:
+        """Version coroutine de admit"""
+        scheduler = self.transport.scheduler
+        if scheduler is not None:
+            await scheduler.aadmit(client)
+
+    def collect_metrics(self):
+        """Séries lues au moment de l'export : cache, regroupement d'appels, transport
+
+        Les composants pas encore construits sont ignorés plutôt que construits.
+        """
+        agent = self._components.get('agent')
+        if agent is not None:
+            yield from self._agent_metrics(agent)
+        transport = self._components.get('transport')
+        if transport is not None:
+            yield from self._transport_metrics(transport)
+
+    @staticmethod
+    def _agent_metrics(agent: RecipeAgent):
+        if agent.cache is not None:
+            stats = agent.cache.stats()
+            yield ("recipe_cache_lookups_total", "counter", "Consultations du cache de réponses",
+                   [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])])
+            yield ("recipe_cache_semantic_hits_total", "counter", "Hits du cache par similarité",
+                   [({}, stats["semantic_hits"])])
+            yield ("recipe_cache_entries", "gauge", "Entrées du cache de réponses", [({}, stats["entries"])])
+        if agent.flights is not None:
+            stats = agent.flights.stats()
+            yield ("recipe_single_flight_calls_total", "counter", "Appels menés ou regroupés",
+                   [({"role": "leader"}, stats["leaders"]), ({"role": "coalesced"}, stats["coalesced"])])
+        if agent.sessions is not None:
+            stats = agent.sessions.stats()
+            yield ("recipe_sessions", "gauge", "Sessions conservées", [({}, stats["sessions"])])
+            yield ("recipe_session_turns_total", "counter", "Séries de recettes générées et retouches",
+                   [({"kind": "generation"}, stats["generations"]), ({"kind": "edit"}, stats["edits"])])
+        if agent.pantry is not None:
+            stats = agent.pantry.stats()
+            yield ("recipe_pantry_recipes", "gauge", "Recettes du garde-manger", [({}, stats["recipes"])])
+            yield ("recipe_pantry_searches_total", "counter", "Recherches dans le garde-manger",
+                   [({"result": "local"}, stats["matched"]),
+                    ({"result": "llm"}, stats["searches"] - stats["matched"])])
+        if agent.substitutions is not None:
+            stats = agent.substitutions.stats()
+            yield ("recipe_substitution_ingredients", "gauge", "Ingrédients du graphe de substitutions",
+                   [({}, stats["ingredients"])])
+            yield ("recipe_substitution_lookups_total", "counter", "Consultations du graphe de substitutions",
+                   [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])])
+            yield ("recipe_substitution_learned_total", "counter", "Substitutions apprises du modèle",
+                   [({}, stats["learned"])])
+
+    @staticmethod
+    def _transport_metrics(transport: Transport):
+        stats = transport.stats()
+        yield ("recipe_llm_retries_total", "counter", "Nouvelles tentatives d'appel au modèle", [({}, stats["retries"])])
+        if stats["scheduler"] is not None:
+            scheduler = stats["scheduler"]
+            yield ("recipe_scheduler_requests_total", "counter", "Requêtes admises ou refusées faute de quota",
+                   [({"result": "admitted"}, scheduler["admitted"]), ({"result": "rejected"}, scheduler["rejected"])])
+            yield ("recipe_scheduler_throttled_total", "counter", "Appels retardés par un quota de tokens",
+                   [({"priority": priority}, count) for priority, count in scheduler["throttled"].items()])
+            yield ("recipe_llm_slots_active", "gauge", "Appels au modèle en cours",
+                   [({"priority": priority}, count) for priority, count in scheduler["slots"]["active"].items()])
+            yield ("recipe_llm_slots_waiting", "gauge", "Appels en attente d'une place",
+                   [({"priority": priority}, count) for priority, count in scheduler["slots"]["waiting"].items()])
+        yield ("recipe_circuit_state", "gauge", "État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert)",
+               [({}, CIRCUIT_STATES[stats["circuit"]["state"]])])
+
+# Services de la dernière application créée, exportés par /metrics
+_exported_services: Optional[RecipeServices] = None
+
+def collect_component_metrics():
+    if _exported_services is not None:
+        yield from _exported_services.collect_metrics()
+
+REGISTRY.add_collector(collect_component_metrics)
+
+def services() -> RecipeServices:
+    """Composants de l'application qui traite la requête"""
+    return current_app.extensions['recipe']
+
+def load_config() -> Dict[str, Any]:
+    """Configuration lue dans l'environnement (et le fichier .env)"""
+    return {
+        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
+        # Mode fan-out : une requête par recette, exécutées en parallèle
+        'RECIPE_FAN_OUT': os.getenv('RECIPE_FAN_OUT', '0') == '1',
+        'RECIPE_FAN_OUT_RETRIES': int(os.getenv('RECIPE_FAN_OUT_RETRIES', '1')),
+        # Réponse tronquée ou mal formée : recettes complètes gardées, manquantes redemandées
+        'RECIPE_SALVAGE': os.getenv('RECIPE_SALVAGE', '1') == '1',
+        # Forme de la réponse du modèle : mode JSON ou appel de fonction forcé
+        'RECIPE_OUTPUT_MODE': output_mode_from_env(),
+        # Traitement par lots : taille maximale d'un lot, et au-delà de quelle taille il devient un job
+        'RECIPE_BATCH_MAX_ITEMS': int(os.getenv('RECIPE_BATCH_MAX_ITEMS', '5000')),
+        'RECIPE_BATCH_SYNC_LIMIT': int(os.getenv('RECIPE_BATCH_SYNC_LIMIT', '50')),
+        # Chargement des données au démarrage plutôt qu'à la première requête
+        'RECIPE_PRELOAD': os.getenv('RECIPE_PRELOAD', '0') == '1',
+        'RECIPE_LOG_LEVEL': os.getenv('RECIPE_LOG_LEVEL'),
+        # Clés d'API (X-API-Key) qui ont leur propre quota ; les autres clients sont identifiés par leur adresse
+        'RECIPE_CLIENT_API_KEYS': parse_client_keys(os.getenv('RECIPE_CLIENT_API_KEYS')),
+    }
+
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """Crée l'application Flask
+
+    `config` complète ou remplace la configuration lue dans l'environnement
+    (clés de load_config, plus LOAD_DOTENV=False pour ignorer le fichier .env).
+    La clé API n'est vérifiée qu'au premier appel au modèle.
+    """
+    config = config or {}
+    if config.get('LOAD_DOTENV', True):
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config)
+    if app.config['RECIPE_LOG_LEVEL']:
+        logging.basicConfig(level=app.config['RECIPE_LOG_LEVEL'].upper())
+    app.json = FastJSONProvider(app)
+    CORS(app)
+
+    if not app.config['OPENAI_API_KEY']:
+        logger.warning("OPENAI_API_KEY n'est pas définie : les appels au modèle échoueront")
+
+    global _exported_services
+    recipe_services = RecipeServices(app.config)
+    app.extensions['recipe'] = recipe_services
+    app.register_blueprint(api)
+    _exported_services = recipe_services
+    if app.config['RECIPE_PRELOAD']:
+        recipe_services.preload()
+    return app
+
+_default_app_lock = threading.Lock()
+
+def __getattr__(name: str) -> Any:
+    # `app` : application par défaut, créée au premier accès (gunicorn app:app, flask --app app run)
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
+
+@api.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    profiler = services().profiler
+    if profiler is not None:
+        profiler.start(f"{request.method} {request.path}")
+
+@api.after_app_request
+def record_request_duration(response):
+    # Pour les réponses en streaming, la durée s'arrête à l'envoi des en-têtes
+    start = g.get('request_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_DURATION.observe(time.perf_counter() - start, method=request.method,
+                              endpoint=endpoint, status=response.status_code)
+    return response
+
+@api.teardown_app_request
+def stop_request_profiler(error=None):
+    # Appelé après la fin du flux pour les réponses en streaming
+    profiler = services().profiler
+    if profiler is not None:
+        profiler.stop()
+
+@api.route('/api/chat', methods=['POST'])
 def chat():
     try:
         data = request.json
@@ -562,13 +1221,166 @@ def chat():
         if not user_input:
             return jsonify({"error": "Le message est requis"}), 400
         
-        response = recipe_agent.process_request(user_input)
-        print(response)
+        options, error = parse_recipe_options(data)
+        if error:
+            return jsonify({"error": error}), 400
+        recipe_agent = services().agent
+        session_id, error = parse_session_id(data, recipe_agent.sessions)
+        if error:
+            return jsonify({"error": error}), 400
+        client = request_client()
+        services().admit(client)
+        
+        with request_context(client):
+            response = recipe_agent.process_request(user_input, session_id=session_id, **options)
+        if session_id is not None:
+            response["session_id"] = session_id
         logger.debug(f"Réponse générée: {response}")
-        return jsonify(response)
+        with STAGE_DURATION.time(stage="serialize"):
+            return jsonify(response)
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Erreur dans la route /api/chat: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@api.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json or {}
+    logger.debug(f"Données reçues (stream): {data}")
+    user_input = data.get('message', '')
+
+    if not user_input:
+        return jsonify({"error": "Le message est requis"}), 400
+    recipe_agent = services().agent
+    session_id, error = parse_session_id(data, recipe_agent.sessions)
+    if error:
+        return jsonify({"error": error}), 400
+    client = request_client()
+    try:
+        services().admit(client)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    def events():
+        # Le générateur s'exécute après le retour de la vue : le client y est associé ici
+        with request_context(client):
+            try:
+                if session_id is not None:
+                    yield format_sse("session", {"session_id": session_id})
+                if (recipe_agent.edit_target(user_input, session_id) is None
+                        and recipe_agent.detect_intent(user_input) == "generate_recipes"):
+                    count = 0
+                    for recipe in recipe_agent.stream_recipes(user_input, session_id):
+                        yield format_sse("recipe", {"index": count, "recipe": recipe})
+                        count += 1
+                    if count == 0:
+                        yield format_sse("error", {"error": "Aucune recette générée"})
+                else:
+                    yield format_sse("result", recipe_agent.process_request(user_input, session_id=session_id))
+                yield format_sse("done", {})
+            except Exception as e:
+                logger.error(f"Erreur dans la route /api/chat/stream: {str(e)}")
+                yield format_sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    recipe_agent = services().agent
+    flights = recipe_agent.flights.stats() if recipe_agent.flights is not None else None
+    if recipe_agent.cache is None:
+        return jsonify({"enabled": False, "single_flight": flights})
+    return jsonify({"enabled": True, **recipe_agent.cache.stats(), "single_flight": flights})
+
+@api.route('/api/pantry/stats', methods=['GET'])
+def pantry_stats():
+    pantry = services().pantry
+    if pantry is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **pantry.stats()})
+
+@api.route('/api/substitutions/stats', methods=['GET'])
+def substitutions_stats():
+    substitutions = services().substitutions
+    if substitutions is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **substitutions.stats()})
+
+@api.route('/api/transport/stats', methods=['GET'])
+def transport_stats():
+    return jsonify(services().transport.stats())
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/metrics/profiles', methods=['GET'])
+def slow_request_profiles():
+    profiler = services().profiler
+    if profiler is None:
+        return jsonify({"enabled": False, "profiles": []})
+    return jsonify({"enabled": True, "threshold": profiler.threshold, "profiles": list(profiler.profiles)})
+
+def jsonl_response(results) -> Response:
+    return Response(
+        stream_with_context(format_jsonl(result) for result in results),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/batch', methods=['POST'])
+def batch():
+    data = request.json or {}
+    items, error = parse_batch_items(data.get('items'), parse_recipe_options,
+                                     current_app.config['RECIPE_BATCH_MAX_ITEMS'])
+    if error:
+        return jsonify({"error": error}), 400
+
+    mode = data.get('mode') or ('sync' if len(items) <= current_app.config['RECIPE_BATCH_SYNC_LIMIT'] else 'job')
+    logger.debug(f"Lot reçu: {len(items)} éléments, mode {mode}")
+    if mode not in ('sync', 'job'):
+        return jsonify({"error": "mode doit valoir 'sync' ou 'job'"}), 400
+    client = request_client()
+    batch_backend = services().batch
+    try:
+        services().admit(client)
+    except Overloaded as e:
+        return overloaded_response(e)
+    if mode == 'job':
+        return jsonify(batch_backend.submit(items, client).to_dict()), 202
+
+    # En JSON Lines, chaque résultat est envoyé dès qu'il est prêt
+    if 'application/x-ndjson' in request.headers.get('Accept', ''):
+        return jsonl_response(batch_backend.runner.run(items, client=client))
+    return jsonify(batch_backend.runner.run_all(items, client))
+
+@api.route('/api/batch/<job_id>', methods=['GET'])
+def batch_status(job_id):
+    job = services().batch.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(job.to_dict())
+
+@api.route('/api/batch/<job_id>/results', methods=['GET'])
+def batch_results(job_id):
+    job = services().batch.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    follow = request.args.get('follow', '1') not in ('0', 'false')
+    return jsonl_response(job.iter_results(follow=follow))
+
+@api.route('/api/batch/<job_id>/cancel', methods=['POST'])
+def batch_cancel(job_id):
+    job = services().batch.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable"}), 404
+    return jsonify(job.to_dict())
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    logging.basicConfig(level=logging.DEBUG)
+    create_app().run(debug=True, port=5000) 
\ No newline at end of file
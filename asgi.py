@@ -0,0 +1,279 @@
+"""Point d'entrée ASGI : sert les routes de chat sans bloquer de thread.
+
+Les routes /api/chat et /api/chat/stream sont servies nativement en
+asynchrone avec le client AsyncOpenAI ; les accès bloquants (cache et
+sessions SQLite, embeddings, seaux partagés de l'ordonnanceur) passent par
+des threads. La page d'accueil et les fichiers statiques sont servis
+directement depuis leurs variantes précompressées ; toutes les autres
+routes sont déléguées à l'application Flask.
+
+Les routes natives sont mesurées comme celles de Flask : durée jusqu'aux
+en-têtes dans HTTP_DURATION et profileur des requêtes lentes.
+
+Lancement :
+    uvicorn --factory asgi:create_asgi_app --port 5000
+    uvicorn asgi:application --port 5000
+
+L'import du module ne crée pas l'application : `application` est construite
+au premier accès.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import RecipeServices, create_app, parse_recipe_options, parse_session_id
+from limiter import ConcurrencyLimiter, Overloaded, build_limiter_from_env
+from metrics import HTTP_DURATION
+from models import dumps_bytes, loads
+from scheduler import client_key, request_context
+from streaming import format_sse
+
+logger = logging.getLogger(__name__)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+async def read_body(receive) -> bytes:
+    """Lit le corps complet de la requête HTTP"""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_json(send, status: int, payload: Dict[str, Any], headers: Headers = None) -> None:
+    """Envoie une réponse JSON complète"""
+    body = dumps_bytes(payload)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+        ] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def scope_client(scope, known_keys: Collection[str] = ()) -> str:
+    """Client de la requête, pour les quotas : clé d'API reconnue (X-API-Key) ou adresse IP"""
+    headers = dict(scope.get("headers") or [])
+    api_key = headers.get(b"x-api-key", b"").decode("latin-1")
+    address = scope["client"][0] if scope.get("client") else None
+    return client_key(api_key, address, known_keys)
+
+
+async def send_overloaded(send, error: Overloaded) -> None:
+    await send_json(
+        send, error.status, {"error": error.message},
+        headers=[(b"retry-after", str(error.retry_after).encode())],
+    )
+
+
+class RecipeASGIApp:
+    """Application ASGI servant le chat en asynchrone et déléguant le reste à Flask
+
+    Les composants (agent, fichiers statiques) sont ceux de l'application
+    Flask, construits à la première requête qui en a besoin.
+    """
+
+    def __init__(self, services: RecipeServices, limiter: ConcurrencyLimiter, fallback):
+        self.services = services
+        self.limiter = limiter
+        self.fallback = fallback
+        self.routes = {
+            ("POST", "/api/chat"): self.chat,
+            ("POST", "/api/chat/stream"): self.chat_stream,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        if scope["type"] == "http" and scope.get("method") in ("GET", "HEAD"):
+            asset = self.services.assets.lookup(scope.get("path", ""))
+            if asset is not None:
+                await self.static(scope, send, asset)
+                return
+
+        handler = self.routes.get((scope.get("method"), scope.get("path")))
+        if scope["type"] != "http" or handler is None:
+            await self.fallback(scope, receive, send)
+            return
+        await self.timed(scope, receive, send, handler)
+
+    async def timed(self, scope, receive, send, handler) -> None:
+        """Sert une route native avec les mesures des hooks de Flask (voir app.start_request_timer)"""
+        start = time.perf_counter()
+        method, path = scope["method"], scope["path"]
+        profiler = self.services.profiler
+        key = object()
+        if profiler is not None:
+            profiler.start(f"{method} {path}", key=key)
+        recorded = False
+
+        async def timed_send(message):
+            nonlocal recorded
+            # Pour le streaming, la durée s'arrête à l'envoi des en-têtes
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                HTTP_DURATION.observe(time.perf_counter() - start, method=method, endpoint=path,
+                                      status=message["status"])
+            await send(message)
+
+        try:
+            await handler(scope, receive, timed_send)
+        finally:
+            if not recorded:
+                HTTP_DURATION.observe(time.perf_counter() - start, method=method, endpoint=path, status=500)
+            if profiler is not None:
+                profiler.stop(key=key)
+
+    async def static(self, scope, send, asset) -> None:
+        """Sert une variante déjà compressée de la page ou d'un fichier statique"""
+        request_headers = dict(scope.get("headers") or [])
+        status, headers, body = self.services.assets.respond(
+            asset,
+            request_headers.get(b"accept-encoding", b"").decode("latin-1"),
+            request_headers.get(b"if-none-match", b"").decode("latin-1"),
+        )
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_json(self, receive) -> Dict[str, Any]:
+        try:
+            data = loads(await read_body(receive) or b"{}")
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    async def chat(self, scope, receive, send):
+        data = await self._read_json(receive)
+        user_input = data.get("message", "")
+        if not user_input:
+            await send_json(send, 400, {"error": "Le message est requis"})
+            return
+
+        options, error = parse_recipe_options(data)
+        if error:
+            await send_json(send, 400, {"error": error})
+            return
+        agent = self.services.agent
+        session_id, error = parse_session_id(data, agent.sessions)
+        if error:
+            await send_json(send, 400, {"error": error})
+            return
+
+        client = scope_client(scope, self.services.config['RECIPE_CLIENT_API_KEYS'])
+        try:
+            await self.services.aadmit(client)
+            async with self.limiter:
+                with request_context(client):
+                    response = await agent.aprocess_request(user_input, session_id=session_id, **options)
+                if session_id is not None:
+                    response["session_id"] = session_id
+        except Overloaded as e:
+            logger.warning(f"Requête refusée ({e.status}): {e.message}")
+            await send_overloaded(send, e)
+            return
+        except Exception as e:
+            logger.error(f"Erreur dans la route /api/chat (async): {str(e)}")
+            await send_json(send, 500, {"error": str(e)})
+            return
+
+        logger.debug(f"Réponse générée: {response}")
+        await send_json(send, 200, response)
+
+    async def chat_stream(self, scope, receive, send):
+        data = await self._read_json(receive)
+        user_input = data.get("message", "")
+        if not user_input:
+            await send_json(send, 400, {"error": "Le message est requis"})
+            return
+        session_id, error = parse_session_id(data, self.services.agent.sessions)
+        if error:
+            await send_json(send, 400, {"error": error})
+            return
+
+        client = scope_client(scope, self.services.config['RECIPE_CLIENT_API_KEYS'])
+        try:
+            await self.services.aadmit(client)
+            async with self.limiter:
+                await send({
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/event-stream; charset=utf-8"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no"),
+                        (b"access-control-allow-origin", b"*"),
+                    ],
+                })
+                with request_context(client):
+                    async for event in self._events(user_input, session_id):
+                        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+        except Overloaded as e:
+            logger.warning(f"Requête refusée ({e.status}): {e.message}")
+            await send_overloaded(send, e)
+
+    async def _events(self, user_input: str, session_id: Optional[str] = None):
+        agent = self.services.agent
+        try:
+            if session_id is not None:
+                yield format_sse("session", {"session_id": session_id})
+            edit_index = await asyncio.to_thread(agent.edit_target, user_input, session_id)
+            if edit_index is None and agent.detect_intent(user_input) == "generate_recipes":
+                count = 0
+                async for recipe in agent.astream_recipes(user_input, session_id):
+                    yield format_sse("recipe", {"index": count, "recipe": recipe})
+                    count += 1
+                if count == 0:
+                    yield format_sse("error", {"error": "Aucune recette générée"})
+            else:
+                yield format_sse("result", await agent.aprocess_request(user_input, session_id=session_id))
+            yield format_sse("done", {})
+        except Exception as e:
+            logger.error(f"Erreur dans la route /api/chat/stream (async): {str(e)}")
+            yield format_sse("error", {"error": str(e)})
+
+
+def create_asgi_app(config: Optional[Dict[str, Any]] = None) -> RecipeASGIApp:
+    """Crée l'application ASGI autour d'une application Flask (voir app.create_app)"""
+    flask_app = create_app(config)
+    return RecipeASGIApp(flask_app.extensions["recipe"], build_limiter_from_env(), WsgiToAsgi(flask_app))
+
+
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name: str) -> Any:
+    # `application` : créée au premier accès (uvicorn asgi:application), pas à l'import du module
+    if name != "application":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if "application" not in globals():
+            globals()["application"] = create_asgi_app()
+    return globals()["application"]
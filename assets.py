@@ -0,0 +1,199 @@
+"""Page d'accueil et fichiers statiques, construits une seule fois au démarrage.
+
+Les sources de `web/` (page HTML, script et feuille de style) sont
+minifiées, nommées d'après leur contenu (`app.3f2a9c1e.js`) et compressées
+à l'avance en gzip, et en brotli si le paquet `brotli` est installé. Servir
+une requête revient alors à choisir une variante déjà prête :
+
+- les fichiers nommés par contenu sont servis avec
+  `Cache-Control: public, max-age=31536000, immutable` ;
+- la page d'accueil, qui référence ces noms, doit être revalidée
+  (`no-cache`) mais répond 304 grâce à son ETag fort.
+
+`AssetBundle.respond` ne dépend d'aucun framework : il est utilisé par la
+route Flask et par le point d'entrée ASGI.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # dépendance facultative
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+ASSET_PREFIX = "/assets/"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+
+Headers = List[Tuple[str, str]]
+
+# Chaînes et commentaires JavaScript, pour ne jamais minifier l'intérieur d'une chaîne
+_JS_TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+""", re.VERBOSE | re.DOTALL)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_SPACES_RE = re.compile(r"\s*([{}:;,>])\s*")
+_HTML_SPACES_RE = re.compile(r">\s+<")
+
+
+def minify_js(source: str) -> str:
+    """Retire commentaires, indentation et lignes vides
+
+    Les retours à la ligne sont conservés : l'insertion automatique des
+    points-virgules continue de s'appliquer comme dans la source.
+    """
+    def replace(match: re.Match) -> str:
+        return match.group("string") or ""
+
+    code = _JS_TOKEN_RE.sub(replace, source)
+    lines = (line.strip() for line in code.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def minify_css(source: str) -> str:
+    code = _CSS_COMMENT_RE.sub("", source)
+    code = _CSS_SPACES_RE.sub(r"\1", " ".join(code.split()))
+    return code.replace(";}", "}")
+
+
+def minify_html(source: str) -> str:
+    return _HTML_SPACES_RE.sub("><", source.strip())
+
+
+class Asset:
+    """Fichier prêt à servir, avec ses variantes compressées"""
+
+    __slots__ = ("name", "content_type", "cache_control", "digest", "bodies")
+
+    def __init__(self, name: str, body: bytes, cache_control: str):
+        self.name = name
+        self.content_type = CONTENT_TYPES[os.path.splitext(name)[1]]
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        # Encodage -> corps ; une variante compressée n'est gardée que si elle est plus petite
+        self.bodies: Dict[str, bytes] = {"identity": body}
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            self.bodies["gzip"] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.bodies["br"] = compressed
+
+    def etag(self, encoding: str) -> str:
+        # ETag fort, distinct pour chaque encodage
+        if encoding == "identity":
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+    def sizes(self) -> Dict[str, int]:
+        return {encoding: len(body) for encoding, body in self.bodies.items()}
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Encodages acceptés par le client (Accept-Encoding), sans ceux à q=0"""
+    encodings = []
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name, params = name.strip(), params.replace(" ", "")
+        if name and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.append(name.lower())
+    return encodings
+
+
+def _etag_matches(if_none_match: str, etags: Tuple[str, ...]) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in etags:
+            return True
+    return False
+
+
+class AssetBundle:
+    """Page d'accueil et fichiers statiques construits en mémoire"""
+
+    def __init__(self, source_dir: str = DEFAULT_SOURCE_DIR):
+        self.source_dir = source_dir
+        self.assets: Dict[str, Asset] = {}
+        self.page: Optional[Asset] = None
+        self.build()
+
+    def _read(self, name: str) -> str:
+        with open(os.path.join(self.source_dir, name), encoding="utf-8") as f:
+            return f.read()
+
+    def build(self) -> None:
+        """Minifie, nomme par contenu et compresse les sources"""
+        assets = {}
+        html = self._read("index.html")
+        for source, minify in (("app.js", minify_js), ("app.css", minify_css)):
+            body = minify(self._read(source)).encode("utf-8")
+            digest = hashlib.sha256(body).hexdigest()[:8]
+            stem, extension = os.path.splitext(source)
+            asset = Asset(f"{stem}.{digest}{extension}", body, IMMUTABLE)
+            assets[asset.name] = asset
+            # La page référence le nom versionné : un nouveau contenu change l'URL
+            html = html.replace(f'"{source}"', f'"{ASSET_PREFIX}{asset.name}"')
+        self.assets = assets
+        self.page = Asset("index.html", minify_html(html).encode("utf-8"), REVALIDATE)
+        logger.info(f"Fichiers statiques construits: {', '.join(sorted(assets))} "
+                    f"(brotli {'activé' if brotli is not None else 'indisponible'})")
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        """Fichier correspondant au chemin de la requête, ou None"""
+        if path == "/":
+            return self.page
+        if path.startswith(ASSET_PREFIX):
+            return self.assets.get(path[len(ASSET_PREFIX):])
+        return None
+
+    def respond(self, asset: Asset, accept_encoding: str = "",
+                if_none_match: str = "") -> Tuple[int, Headers, bytes]:
+        """Statut, en-têtes et corps de la réponse, 304 si le client a déjà la variante"""
+        encoding = "identity"
+        accepted = accepted_encodings(accept_encoding)
+        for candidate in ("br", "gzip"):
+            if candidate in asset.bodies and candidate in accepted:
+                encoding = candidate
+                break
+
+        etag = asset.etag(encoding)
+        headers: Headers = [
+            ("ETag", etag),
+            ("Cache-Control", asset.cache_control),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if if_none_match and _etag_matches(if_none_match, (etag,)):
+            return 304, headers, b""
+
+        body = asset.bodies[encoding]
+        headers.append(("Content-Type", asset.content_type))
+        headers.append(("Content-Length", str(len(body))))
+        if encoding != "identity":
+            headers.append(("Content-Encoding", encoding))
+        return 200, headers, body
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Taille de chaque fichier par encodage, en octets"""
+        result = {name: asset.sizes() for name, asset in self.assets.items()}
+        result["index.html"] = self.page.sizes()
+        return result
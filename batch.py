@@ -0,0 +1,324 @@
+"""Traitement par lots des demandes (menus de la semaine, catalogues...).
+
+Un lot contient des messages (comme pour /api/chat) et/ou des recettes dont
+on veut le calcul nutritionnel. Les éléments identiques sont dédoublonnés,
+les recettes déjà en cache sont servies sans appel au modèle et le reste
+passe par un pool de workers borné partagé par tous les lots : le débit
+dépend alors de la limite du fournisseur, pas du nombre d'allers-retours
+HTTP du client. Chaque lot soumet au plus autant d'éléments que le pool a
+de workers, les suivants à mesure que les premiers se terminent.
+
+Les gros lots sont soumis comme des jobs asynchrones sur le modèle de l'API
+Batch d'OpenAI (statuts validating, in_progress, completed, failed,
+cancelled). `LocalBatchBackend` exécute ces jobs dans le processus.
+
+Les appels au modèle des lots passent après les demandes interactives et
+sont décomptés du quota du client qui a soumis le lot (scheduler.py).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from cache import ResponseCache
+from models import dumps
+from scheduler import BATCH, request_context
+
+logger = logging.getLogger(__name__)
+
+# Statuts de job, repris de l'API Batch d'OpenAI
+VALIDATING = "validating"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+
+class BatchItem:
+    """Élément de lot : un message ou une recette pour le calcul nutritionnel"""
+
+    __slots__ = ("kind", "payload", "options", "key")
+
+    def __init__(self, kind: str, payload: Any, options: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.payload = payload
+        self.options = options or {}
+        if kind == "chat":
+            # Même normalisation que le cache : "pâtes, tomates" et "Tomates et pâtes" sont confondus
+            tool = f"chat/{dumps(sorted(self.options.items()))}"
+            self.key = ResponseCache.make_key(tool, payload)
+        else:
+            self.key = "nutrition:" + hashlib.sha1(dumps(payload).encode("utf-8")).hexdigest()
+
+
+def parse_batch_items(items: Any, parse_options: Callable[[Dict[str, Any]], Tuple[Any, Optional[str]]],
+                      max_items: int) -> Tuple[List[BatchItem], Optional[str]]:
+    """Valide la liste "items" d'un lot
+
+    Chaque élément est un message (chaîne ou {"message": ..., options}) ou
+    une recette ({"recipe": {...}}). Retourne les éléments et une erreur.
+    """
+    if not isinstance(items, list) or not items:
+        return [], "items doit être une liste non vide"
+    if len(items) > max_items:
+        return [], f"Un lot ne peut pas dépasser {max_items} éléments"
+
+    parsed = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"message": item}
+        if not isinstance(item, dict):
+            return [], f"items[{i}]: élément invalide"
+        if isinstance(item.get("recipe"), dict):
+            parsed.append(BatchItem("nutrition", item["recipe"]))
+            continue
+        message = item.get("message")
+        if not isinstance(message, str) or not message.strip():
+            return [], f"items[{i}]: message ou recipe requis"
+        options, error = parse_options(item)
+        if error:
+            return [], f"items[{i}]: {error}"
+        parsed.append(BatchItem("chat", message, options))
+    return parsed, None
+
+
+class BatchRunner:
+    """Exécute les éléments de lot sur un pool de workers partagé"""
+
+    def __init__(self, agent, max_workers: int = 16):
+        self.agent = agent
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+
+    def _execute(self, item: BatchItem, client: Optional[str] = None) -> Dict[str, Any]:
+        with request_context(client, BATCH):
+            if item.kind == "nutrition":
+                return {"type": "nutrition", "data": self.agent.calculate_nutrition(item.payload)}
+            return self.agent.process_request(item.payload, **item.options)
+
+    def run(self, items: List[BatchItem], cancelled: Optional[threading.Event] = None,
+            client: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Produit le résultat de chaque élément, dans l'ordre de fin d'exécution"""
+        groups: "OrderedDict[str, List[int]]" = OrderedDict()
+        for index, item in enumerate(items):
+            groups.setdefault(item.key, []).append(index)
+
+        queued: "deque[List[int]]" = deque()
+        for indexes in groups.values():
+            item = items[indexes[0]]
+            cached = self.agent.cached_response(item.payload, **item.options) if item.kind == "chat" else None
+            if cached is not None:
+                yield from _results(indexes, cached, cached=True)
+            else:
+                queued.append(indexes)
+
+        # Au plus max_workers éléments du lot soumis à la fois : un gros lot ne
+        # remplit pas la file du pool partagé devant les lots soumis après lui
+        futures: Dict[Future, List[int]] = {}
+        try:
+            while queued or futures:
+                if cancelled is not None and cancelled.is_set():
+                    while queued:
+                        yield from _results(queued.popleft(), {"error": "Élément annulé"}, status=CANCELLED)
+                    for future in futures:
+                        future.cancel()
+                while queued and len(futures) < self.max_workers:
+                    indexes = queued.popleft()
+                    futures[self._executor.submit(self._execute, items[indexes[0]], client)] = indexes
+                # Délai court pour pouvoir réagir à une annulation du job
+                done, _ = wait(futures, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    indexes = futures.pop(future)
+                    if future.cancelled():
+                        yield from _results(indexes, {"error": "Élément annulé"}, status=CANCELLED)
+                        continue
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        logger.error(f"Erreur lors du traitement d'un élément de lot: {str(e)}")
+                        response = {"error": str(e)}
+                    yield from _results(indexes, response)
+        finally:
+            # Lot abandonné (client déconnecté) : les éléments pas encore démarrés sont annulés
+            for future in futures:
+                future.cancel()
+
+    def run_all(self, items: List[BatchItem], client: Optional[str] = None) -> Dict[str, Any]:
+        """Exécute un lot et retourne tous les résultats dans l'ordre des éléments"""
+        results = sorted(self.run(items, client=client), key=lambda result: result["index"])
+        return {"results": results, "request_counts": count_results(results, len(items))}
+
+
+def _failed(response: Dict[str, Any]) -> bool:
+    # process_request place les erreurs des outils dans "data"
+    data = response.get("data")
+    return "error" in response or isinstance(data, dict) and "error" in data
+
+
+def _results(indexes: List[int], response: Dict[str, Any], cached: bool = False,
+             status: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    if status is None:
+        status = "error" if _failed(response) else "ok"
+    for position, index in enumerate(indexes):
+        yield {
+            "index": index,
+            "status": status,
+            "cached": cached,
+            # Les doublons réutilisent la réponse du premier élément identique
+            "duplicate_of": indexes[0] if position else None,
+            "response": response,
+        }
+
+
+def count_results(results: List[Dict[str, Any]], total: int) -> Dict[str, int]:
+    failed = sum(1 for result in results if result["status"] == "error")
+    cancelled = sum(1 for result in results if result["status"] == CANCELLED)
+    return {
+        "total": total,
+        "completed": len(results) - failed - cancelled,
+        "failed": failed,
+        "cancelled": cancelled,
+        "cached": sum(1 for result in results if result["cached"]),
+        "deduplicated": sum(1 for result in results if result["duplicate_of"] is not None),
+    }
+
+
+def format_jsonl(result: Dict[str, Any]) -> str:
+    """Sérialise un résultat en une ligne JSON Lines"""
+    return dumps(result) + "\n"
+
+
+class BatchJob:
+    """Job de traitement par lots, interrogeable pendant son exécution"""
+
+    def __init__(self, items: List[BatchItem], client: Optional[str] = None):
+        self.id = f"batch_{uuid.uuid4().hex}"
+        self.items = items
+        # Client dont le quota est décompté
+        self.client = client
+        self.status = VALIDATING
+        self.created_at = time.time()
+        self.in_progress_at: Optional[float] = None
+        self.completed_at: Optional[float] = None
+        self.error: Optional[str] = None
+        # Résultats dans l'ordre de fin d'exécution
+        self.results: List[Dict[str, Any]] = []
+        self.cancel_event = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        with self._changed:
+            self.status = status
+            if status == IN_PROGRESS:
+                self.in_progress_at = time.time()
+            elif status in FINAL_STATUSES:
+                self.completed_at = time.time()
+            self.error = error
+            self._changed.notify_all()
+
+    def _append(self, result: Dict[str, Any]) -> None:
+        with self._changed:
+            self.results.append(result)
+            self._changed.notify_all()
+
+    def iter_results(self, follow: bool = True) -> Iterator[Dict[str, Any]]:
+        """Produit les résultats disponibles, puis ceux à venir si `follow`"""
+        position = 0
+        while True:
+            with self._changed:
+                while follow and position >= len(self.results) and not self.finished:
+                    self._changed.wait()
+                new_results = self.results[position:]
+                done = self.finished or not follow
+            yield from new_results
+            position += len(new_results)
+            if done and position >= len(self.results):
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._changed:
+            results = list(self.results)
+        return {
+            "id": self.id,
+            "object": "batch",
+            "status": self.status,
+            "created_at": self.created_at,
+            "in_progress_at": self.in_progress_at,
+            "completed_at": self.completed_at,
+            "error": self.error,
+            "request_counts": count_results(results, len(self.items)),
+        }
+
+
+class LocalBatchBackend:
+    """Exécute les jobs dans le processus, en remplacement local de l'API Batch"""
+
+    def __init__(self, runner: BatchRunner, max_jobs: int = 100):
+        self.runner = runner
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, items: List[BatchItem], client: Optional[str] = None) -> BatchJob:
+        """Crée un job et lance son exécution en arrière-plan"""
+        job = BatchJob(items, client)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        threading.Thread(target=self._run, args=(job,), name=job.id, daemon=True).start()
+        logger.info(f"Job {job.id} soumis ({len(items)} éléments)")
+        return job
+
+    def _evict(self) -> None:
+        # Seuls les jobs terminés sont oubliés, les plus anciens d'abord
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                return
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
+
+    def _run(self, job: BatchJob) -> None:
+        job._set_status(IN_PROGRESS)
+        try:
+            for result in self.runner.run(job.items, job.cancel_event, job.client):
+                job._append(result)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'exécution du job {job.id}: {str(e)}")
+            job._set_status(FAILED, str(e))
+            return
+        job._set_status(CANCELLED if job.cancel_event.is_set() else COMPLETED)
+        logger.info(f"Job {job.id} terminé: {job.status}")
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[BatchJob]:
+        """Demande l'annulation d'un job ; les éléments déjà lancés se terminent"""
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel_event.set()
+        return job
+
+    def list(self) -> List[BatchJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+
+def build_batch_from_env(agent) -> LocalBatchBackend:
+    """Construit le backend de lots à partir des variables d'environnement RECIPE_BATCH_*"""
+    backend_name = os.getenv("RECIPE_BATCH_BACKEND", "local").lower()
+    if backend_name != "local":
+        raise ValueError(f"Backend de lots inconnu: {backend_name}")
+    runner = BatchRunner(agent, max_workers=int(os.getenv("RECIPE_BATCH_WORKERS", "16")))
+    return LocalBatchBackend(runner, max_jobs=int(os.getenv("RECIPE_BATCH_MAX_JOBS", "100")))
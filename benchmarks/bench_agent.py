@@ -0,0 +1,68 @@
+"""Micro-benchmarks de RecipeAgent, sans appel au modèle.
+
+- post-traitement de generate_recipes : nettoyage, parsing et validation
+  d'une réponse propre, en bloc de code, entourée de texte, et des arguments
+  d'un appel de fonction ;
+- process_request : routage et dispatch, les outils étant remplacés par des
+  fonctions vides.
+
+Usage :
+    python -m benchmarks.bench_agent [--repeat 2000]
+"""
+import argparse
+import logging
+import time
+import types
+from typing import Callable
+
+from app import DEFAULT_RECIPE_COUNT, RecipeAgent
+from benchmarks.mock_openai import malformed, recipe_payload
+from benchmarks.load_test import MESSAGES
+from nutrition import get_nutrition_database
+from router import build_router_from_env
+
+
+def timeit(fn: Callable[[], object], repeat: int) -> float:
+    """Durée moyenne d'un appel, en microsecondes"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def tool_call_message(arguments: str):
+    call = types.SimpleNamespace(function=types.SimpleNamespace(name="submit_recipes", arguments=arguments))
+    return types.SimpleNamespace(content=None, tool_calls=[call])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    # Les logs de debug de l'application fausseraient les mesures
+    logging.disable(logging.CRITICAL)
+
+    agent = RecipeAgent(router=build_router_from_env(get_nutrition_database().vocabulary()))
+    payload = recipe_payload(DEFAULT_RECIPE_COUNT)
+    content = types.SimpleNamespace(content=payload, tool_calls=None)
+    cases = {
+        "contenu JSON": lambda: agent._parse_message(content),
+        "bloc de code": lambda: agent._parse_recipes(malformed(payload, "fenced")),
+        "texte autour (rejeté)": lambda: agent._parse_recipes(malformed(payload, "prose")),
+        "appel de fonction": lambda: agent._parse_message(tool_call_message(payload)),
+    }
+    print(f"Post-traitement d'une réponse de {DEFAULT_RECIPE_COUNT} recettes ({len(payload)} caractères) :")
+    for name, fn in cases.items():
+        print(f"  {name:<28} {timeit(fn, args.repeat):>9.1f} µs")
+
+    # Outils factices : seul le coût du routage et du dispatch est mesuré
+    agent.tools = {name: (lambda *a, **k: {}) for name in agent.tools}
+    print("\nprocess_request (routage et dispatch) :")
+    for message in MESSAGES:
+        elapsed = timeit(lambda: agent.process_request(message), args.repeat)
+        print(f"  {message[:48]:<50} {elapsed:>9.1f} µs  -> {agent.detect_intent(message)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Doublement d'appels : latence de queue et surcoût, contre le serveur factice.
+
+Le serveur factice (benchmarks/mock_openai.py) répond en général vite mais
+bloque une petite partie des appels pendant plusieurs secondes. Les mêmes
+demandes de recettes passent par Transport sans doublement, puis avec
+doublement au centile --percentile des latences récentes, vers le même
+modèle et vers un second modèle (--hedge-model, de latence --hedge-latency).
+Sont comparés les centiles de latence, la proportion d'appels doublés, les
+appels gagnés par le doublement, les appels abandonnés et les tokens perdus
+(réponses reçues mais écartées ; en asynchrone, le perdant est annulé).
+
+Usage :
+    python -m benchmarks.bench_hedging [--requests 400] [--concurrency 16] [--latency stall:0.3:0.3:0.05:4] [--sync]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from benchmarks.load_test import percentile
+from benchmarks.mock_openai import MockBehavior, serve
+from transport import HedgePolicy, OpenAIClients, Transport, build_openai_clients
+
+MODEL = "gpt-4.1-nano"
+
+
+def request(index: int) -> Dict[str, object]:
+    return {
+        "model": MODEL,
+        "messages": [{"role": "user", "content": f"Génère 3 recettes de pâtes (demande {index})"}],
+        "max_tokens": 2000,
+    }
+
+
+def run_sync(transport: Transport, requests: int, concurrency: int) -> List[float]:
+    def call(index: int) -> float:
+        start = time.perf_counter()
+        transport.create("generate_recipes", **request(index))
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(call, range(requests)))
+
+
+async def run_async(transport: Transport, requests: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(index: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await transport.acreate("generate_recipes", **request(index))
+            return time.perf_counter() - start
+
+    return list(await asyncio.gather(*(call(i) for i in range(requests))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", default="stall:0.3:0.3:0.05:4", help="latence du modèle principal")
+    parser.add_argument("--hedge-model", default="gpt-4.1-mini")
+    parser.add_argument("--hedge-latency", default="lognormal:0.4:0.3", help="latence du second modèle")
+    parser.add_argument("--percentile", type=float, default=90.0)
+    parser.add_argument("--budget", type=float, default=0.15)
+    parser.add_argument("--sync", action="store_true", help="appels synchrones (le perdant n'est pas annulé)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    modes: Dict[str, Optional[Dict[str, object]]] = {
+        "sans doublement": None,
+        f"doublement (p{args.percentile:g})": {},
+        f"doublement vers {args.hedge_model}": {"model": args.hedge_model},
+    }
+    print(f"{args.requests} demandes, {args.concurrency} simultanées, latence {args.latency} ; "
+          f"appels {'synchrones' if args.sync else 'asynchrones'}")
+    print(f"{'':<32} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}   {'doublés':>11} "
+          f"{'gagnés':>7} {'abandonnés':>10} {'tokens perdus':>13}")
+    for name, hedge in modes.items():
+        behavior = MockBehavior(args.latency, seed=args.seed, model_latency={args.hedge_model: args.hedge_latency})
+        server = serve(behavior)
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+        hedging = None
+        if hedge is not None:
+            hedging = HedgePolicy(percentile=args.percentile, initial_delay=1.0, budget=args.budget, **hedge)
+        transport = Transport(OpenAIClients(lambda: build_openai_clients("bench", base_url)), hedging=hedging)
+        if args.sync:
+            latencies = run_sync(transport, args.requests, args.concurrency)
+        else:
+            latencies = asyncio.run(run_async(transport, args.requests, args.concurrency))
+        server.shutdown()
+        stats = hedging.stats() if hedging is not None else {}
+        print(f"{name:<32} " + " ".join(f"{percentile(latencies, p) * 1000:>5.0f} ms" for p in (50, 95, 99))
+              + f" {max(latencies) * 1000:>5.0f} ms   {stats.get('hedge_rate', 0.0):>10.1%} "
+              f"{stats.get('hedge_won', 0):>7} {stats.get('abandoned', 0):>10} {stats.get('wasted_tokens', 0):>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Micro-benchmark du nettoyage des recettes.
+
+Compare l'ancien nettoyage (appels `str.replace` chaînés champ par champ) au
+chemin actuel, sur un gros volume synthétique : `clean_raw_response` pour la
+réponse brute, `clean_recipes` (parcours unique piloté par le schéma, utilisé
+pour les imports) et `validate_recipes` (qui construit en plus le modèle typé)
+pour les recettes parsées. Une table `str.translate` et un `re.sub` en une
+passe sont mesurés aussi : ils sont plus lents que les `str.replace` sur du
+texte non ASCII, d'où le choix du module normalizer.
+
+Usage :
+    python -m benchmarks.bench_normalizer [--recipes 100] [--ingredients 50] [--repeat 5]
+"""
+import argparse
+import copy
+import json
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from models import validate_recipes
+from normalizer import RAW_REPLACEMENTS, clean_raw_response, clean_recipes
+
+LEFT_DQ, RIGHT_DQ, LEFT_SQ, RIGHT_SQ = "\u201c", "\u201d", "\u2018", "\u2019"
+
+
+def legacy_clean_value(value: Any) -> str:
+    """Nettoyage d'un champ tel qu'il était fait dans generate_recipes"""
+    return (str(value).strip()
+            .replace('\n', ' ').replace('\r', ' ')
+            .replace(LEFT_DQ, '"').replace(RIGHT_DQ, '"')
+            .replace(LEFT_SQ, "'").replace(RIGHT_SQ, "'"))
+
+
+def legacy_clean_raw(text: str) -> str:
+    return (text.replace('\n', ' ').replace('\r', ' ')
+            .replace(LEFT_SQ, "'").replace(RIGHT_SQ, "'"))
+
+
+RAW_TABLE = str.maketrans(dict(RAW_REPLACEMENTS))
+RAW_PATTERN = re.compile("|".join(re.escape(old) for old, _ in RAW_REPLACEMENTS))
+RAW_MAP = dict(RAW_REPLACEMENTS)
+
+
+def translate_clean_raw(text: str) -> str:
+    return text.translate(RAW_TABLE)
+
+
+def regex_clean_raw(text: str) -> str:
+    return RAW_PATTERN.sub(lambda match: RAW_MAP[match.group()], text)
+
+
+def legacy_clean_recipes(recipes: List[Any]) -> List[Dict[str, Any]]:
+    cleaned_recipes = []
+    for recipe in recipes:
+        if not isinstance(recipe, dict):
+            continue
+        for field in ["title", "servings", "prep_time", "cook_time", "difficulty", "ingredients", "steps", "tips"]:
+            if field not in recipe:
+                recipe[field] = "" if field not in ("ingredients", "steps", "tips") else []
+        for field in ["title", "servings", "prep_time", "cook_time", "difficulty"]:
+            if field in recipe and recipe[field]:
+                recipe[field] = legacy_clean_value(recipe[field])
+        if isinstance(recipe["ingredients"], list):
+            cleaned_ingredients = []
+            for ing in recipe["ingredients"]:
+                if isinstance(ing, dict):
+                    cleaned_ing = {}
+                    for field in ["name", "quantity", "unit"]:
+                        if field in ing and ing[field]:
+                            cleaned_ing[field] = legacy_clean_value(ing[field])
+                    if cleaned_ing:
+                        cleaned_ingredients.append(cleaned_ing)
+            recipe["ingredients"] = cleaned_ingredients
+        if isinstance(recipe["steps"], list):
+            cleaned_steps = []
+            for step in recipe["steps"]:
+                if isinstance(step, dict) and step.get("description"):
+                    cleaned_steps.append({
+                        "step_number": step.get("step_number", len(cleaned_steps) + 1),
+                        "description": legacy_clean_value(step["description"]),
+                    })
+            recipe["steps"] = cleaned_steps
+        if isinstance(recipe["tips"], list):
+            recipe["tips"] = [legacy_clean_value(tip) for tip in recipe["tips"] if tip]
+        cleaned_recipes.append(recipe)
+    return cleaned_recipes
+
+
+def make_payload(n_recipes: int, n_ingredients: int) -> Dict[str, Any]:
+    """Construit un lot synthétique de recettes avec des caractères à nettoyer"""
+    recipes = []
+    for r in range(n_recipes):
+        recipes.append({
+            "title": f"  Recette {LEFT_SQ}maison{RIGHT_SQ} n{r}\n",
+            "servings": "4",
+            "prep_time": "20 minutes",
+            "cook_time": "35 minutes",
+            "difficulty": "Moyen",
+            "ingredients": [
+                {"name": f"ingr{LEFT_SQ}dient {i}\r\n", "quantity": str(i * 10), "unit": "g"}
+                for i in range(n_ingredients)
+            ],
+            "steps": [
+                {"step_number": s + 1, "description": f"Mélanger {LEFT_DQ}doucement{RIGHT_DQ}\navant l{RIGHT_SQ}étape {s + 2}."}
+                for s in range(10)
+            ],
+            "tips": [f"Conseil {LEFT_SQ}{t}{RIGHT_SQ}\n" for t in range(5)],
+        })
+    return {"recipes": recipes}
+
+
+def bench(label: str, func: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{label:<34} meilleur: {best * 1000:8.2f} ms   moyen: {sum(timings) / len(timings) * 1000:8.2f} ms")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=100)
+    parser.add_argument("--ingredients", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = make_payload(args.recipes, args.ingredients)
+    raw = json.dumps(payload, ensure_ascii=False, indent=2)
+    print(f"{args.recipes} recettes x {args.ingredients} ingrédients, JSON brut de {len(raw) / 1024:.0f} Ko\n")
+
+    # L'ancien nettoyage modifie les recettes en place : chaque tour travaille sur une copie
+    copies = [copy.deepcopy(payload["recipes"]) for _ in range(3 * args.repeat)]
+    legacy_copies = iter(copies[:args.repeat])
+    walker_copies = iter(copies[args.repeat:2 * args.repeat])
+    model_copies = iter(copies[2 * args.repeat:])
+
+    legacy_raw = bench("réponse brute (replace chaînés)", lambda: legacy_clean_raw(raw), args.repeat)
+    bench("réponse brute (str.translate)", lambda: translate_clean_raw(raw), args.repeat)
+    bench("réponse brute (re.sub)", lambda: regex_clean_raw(raw), args.repeat)
+    new_raw = bench("réponse brute (normalizer)", lambda: clean_raw_response(raw), args.repeat)
+    legacy_tree = bench("recettes (replace chaînés)", lambda: legacy_clean_recipes(next(legacy_copies)), args.repeat)
+    walker_tree = bench("recettes (clean_recipes)", lambda: clean_recipes(next(walker_copies)), args.repeat)
+    model_tree = bench("recettes (validate_recipes)", lambda: validate_recipes(next(model_copies)), args.repeat)
+
+    expected = legacy_clean_recipes(copy.deepcopy(payload["recipes"]))
+    assert translate_clean_raw(raw) == regex_clean_raw(raw) == clean_raw_response(raw) == legacy_clean_raw(raw)
+    assert clean_recipes(copy.deepcopy(payload["recipes"])) == expected
+    recipes, _ = validate_recipes(copy.deepcopy(payload["recipes"]))
+    assert [recipe.to_dict() for recipe in recipes] == expected
+    print(f"\nAccélération : réponse brute x{legacy_raw / new_raw:.1f}, "
+          f"recettes x{legacy_tree / walker_tree:.1f} (clean_recipes), x{legacy_tree / model_tree:.1f} (validate_recipes)")
+
+
+if __name__ == "__main__":
+    main()
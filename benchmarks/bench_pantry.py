@@ -0,0 +1,110 @@
+"""Garde-manger : construction, chargement et recherche sur un corpus synthétique.
+
+Les recettes sont tirées au hasard parmi les ingrédients de la table
+nutritionnelle (4 à 12 chacune). Sont mesurés :
+
+- l'import dans le corpus (fichier JSON Lines) et la compaction de l'index ;
+- le démarrage : index compacté chargé par mmap, contre relecture du corpus ;
+- la recherche « que faire avec ces ingrédients », contre un parcours de
+  toutes les recettes comparant des ensembles.
+
+Usage :
+    python -m benchmarks.bench_pantry [--recipes 100000] [--queries 200]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.load_test import percentile
+from nutrition import get_nutrition_database
+from pantry import PantryIndex
+
+
+def synthetic_recipes(count: int, names: List[str], rng: random.Random) -> List[Dict[str, Any]]:
+    # Distribution inégale, comme dans un vrai corpus : quelques ingrédients très fréquents
+    weights = [1 / (rank + 1) for rank in range(len(names))]
+    recipes = []
+    for i in range(count):
+        chosen = set(rng.choices(names, weights, k=rng.randint(4, 12)))
+        recipes.append({"title": f"Recette {i}", "ingredients": [{"name": name} for name in chosen]})
+    return recipes
+
+
+def scan(records: List[Any], pantry: set, max_missing: int, limit: int) -> List[Tuple[int, float]]:
+    """Référence : parcours de toutes les recettes"""
+    ranked = []
+    for terms in records:
+        found = len(terms & pantry)
+        missing = len(terms) - found
+        if found and missing <= max_missing:
+            ranked.append((missing, -found / len(terms)))
+    ranked.sort()
+    return ranked[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    database = get_nutrition_database()
+    names = list(database.names)
+    rng.shuffle(names)
+    recipes = synthetic_recipes(args.recipes, names, rng)
+    directory = tempfile.mkdtemp(prefix="pantry-bench-")
+    path = os.path.join(directory, "corpus.jsonl")
+    print(f"{args.recipes} recettes, {len(names)} ingrédients possibles")
+
+    try:
+        start = time.perf_counter()
+        pantry = PantryIndex(path, database, compact_threshold=args.recipes + 1)
+        for i in range(0, len(recipes), 5000):
+            pantry.add_recipes(recipes[i:i + 5000], source="import")
+        print(f"  import           {time.perf_counter() - start:>9.2f} s  "
+              f"({os.path.getsize(path) / 1e6:.1f} Mo de corpus)")
+        start = time.perf_counter()
+        pantry.compact()
+        print(f"  compaction       {time.perf_counter() - start:>9.2f} s  "
+              f"({os.path.getsize(path + '.idx') / 1e6:.1f} Mo d'index)")
+
+        start = time.perf_counter()
+        pantry = PantryIndex(path, database)
+        print(f"  chargement mmap  {(time.perf_counter() - start) * 1000:>9.1f} ms")
+        os.rename(path + ".idx", path + ".idx.bak")
+        start = time.perf_counter()
+        PantryIndex(path, database, compact_threshold=args.recipes + 1)
+        print(f"  relecture        {(time.perf_counter() - start) * 1000:>9.1f} ms  (sans index compacté)")
+        os.rename(path + ".idx.bak", path + ".idx")
+
+        records = [set(pantry.recipe_terms(recipe)) for recipe in recipes]
+        queries = [rng.sample(names[:40], rng.randint(3, 6)) for _ in range(args.queries)]
+        indexed, scanned = [], []
+        for query in queries:
+            start = time.perf_counter()
+            matches = pantry.search(query)
+            indexed.append(time.perf_counter() - start)
+            terms = set(pantry.parse_pantry(query))
+            start = time.perf_counter()
+            expected = scan(records, terms, pantry.max_missing, pantry.limit)
+            scanned.append(time.perf_counter() - start)
+            # Même classement ; parmi les ex æquo, les recettes retenues peuvent différer
+            assert [(len(match.missing), -match.coverage) for match in matches] == expected, query
+
+        print(f"\nRecherche ({args.queries} requêtes de 3 à 6 ingrédients, p50 / p95) :")
+        for name, values in (("index inversé", indexed), ("parcours complet", scanned)):
+            print(f"  {name:<17} {percentile(values, 50) * 1000:>8.2f} ms {percentile(values, 95) * 1000:>8.2f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
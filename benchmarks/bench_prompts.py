@@ -0,0 +1,149 @@
+"""Taille des prompts de generate_recipes et coût de validation des réponses.
+
+Compare l'ancien prompt système (règles et schéma JSON indenté) aux modes
+`json` (schéma minifié) et `tools` (appel de fonction forcé) de prompts.py.
+Les tokens sont comptés avec tiktoken s'il est installé, sinon estimés ; la
+définition d'outil est comptée sous sa forme JSON, alors que le fournisseur
+la réécrit dans son propre format. Les compteurs réels par outil sont
+exposés sur /api/transport/stats.
+
+Usage :
+    python -m benchmarks.bench_prompts [--repeat 2000]
+"""
+import argparse
+import re
+import time
+from typing import Any, Callable, Dict
+
+from models import dumps, loads, validate_recipes
+from normalizer import clean_raw_response
+from prompts import recipe_request
+
+try:
+    import tiktoken
+except ImportError:  # dépendance facultative
+    tiktoken = None
+
+LEGACY_SYSTEM_PROMPT = """Tu es un chef cuisinier expert qui crée des recettes personnalisées.
+                    IMPORTANT: 
+                    1. Réponds en JSON valide
+                    2. Évite les caractères spéciaux et apostrophes
+                    3. Utilise des points au lieu des retours à la ligne
+                    4. Utilise uniquement des guillemets doubles
+                    5. Inclus tous les champs requis
+                    6. Ne duplique pas de contenu
+                    7. Sois concis dans les descriptions
+                    8. Génère EXACTEMENT le nombre de recettes demandé, toutes différentes
+                    9. Chaque recette doit être unique et adaptée à la demande
+                    
+                    Format JSON requis:
+                    {
+                        "recipes": [
+                            {
+                                "title": "Titre",
+                                "servings": "Nombre",
+                                "prep_time": "Minutes",
+                                "cook_time": "Minutes",
+                                "difficulty": "Facile/Moyen/Difficile",
+                                "ingredients": [
+                                    {
+                                        "name": "Ingrédient",
+                                        "quantity": "Quantité",
+                                        "unit": "Unité"
+                                    }
+                                ],
+                                "steps": [
+                                    {
+                                        "step_number": 1,
+                                        "description": "Étape"
+                                    }
+                                ],
+                                "tips": ["Conseil"]
+                            }
+                        ]
+                    }"""
+
+PROMPT = "Nous sommes 4 et nous voulons manger un plat italien avec de la sauce tomate"
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]|\n\s*")
+
+
+def count_tokens(text: str) -> int:
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    # Estimation : un token par mot, signe ou indentation, les mots longs comptant double
+    return sum(2 if len(token) > 6 else 1 for token in _WORD_RE.findall(text))
+
+
+def request_tokens(request: Dict[str, Any]) -> int:
+    """Tokens envoyés : messages et définition des outils"""
+    total = sum(count_tokens(message["content"]) + 4 for message in request["messages"])
+    if "tools" in request:
+        total += count_tokens(dumps(request["tools"]))
+    return total
+
+
+def legacy_request(prompt: str, count: int) -> Dict[str, Any]:
+    return {"messages": [
+        {"role": "system", "content": LEGACY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Génère {count} recettes différentes pour: {prompt}"},
+    ]}
+
+
+def legacy_validate(raw: str, count: int) -> Any:
+    """Chemin de validation d'une réponse en contenu libre"""
+    text = raw.strip()
+    if text.startswith('```json'):
+        text = text[7:]
+    if text.endswith('```'):
+        text = text[:-3]
+    text = clean_raw_response(text.strip())
+    return validate_recipes(loads(text)["recipes"], count)
+
+
+def structured_validate(raw: str, count: int) -> Any:
+    return validate_recipes(loads(raw)["recipes"], count)
+
+
+def bench(label: str, func: Callable[[], Any], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<34} {elapsed * 1e6:8.1f} µs")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    method = "tiktoken (o200k_base)" if tiktoken is not None else "estimation sans tiktoken"
+    print(f"Tokens d'entrée par appel, 3 recettes ({method}) :")
+    legacy = request_tokens(legacy_request(PROMPT, 3))
+    for label, request in (("ancien prompt", legacy_request(PROMPT, 3)),
+                           ("mode json (schéma minifié)", recipe_request(PROMPT, 3, mode="json")),
+                           ("mode tools (appel de fonction)", recipe_request(PROMPT, 3, mode="tools"))):
+        tokens = request_tokens(request)
+        print(f"  {label:<32} {tokens:5d}  ({(tokens - legacy) / legacy:+.0%})")
+
+    recipe = {
+        "title": "Pâtes à la sauce tomate", "servings": "4", "prep_time": "10", "cook_time": "15",
+        "difficulty": "Facile",
+        "ingredients": [{"name": f"ingrédient {i}", "quantity": "100", "unit": "g"} for i in range(10)],
+        "steps": [{"step_number": i + 1, "description": f"Étape {i + 1} de la préparation."} for i in range(6)],
+        "tips": ["Servir chaud."],
+    }
+    structured = dumps({"recipes": [recipe] * 3})
+    # Réponse libre typique : JSON indenté entouré de marqueurs de code
+    free_form = "```json\n" + dumps({"recipes": [recipe] * 3}).replace("},", "},\n  ") + "\n```"
+
+    print("\nValidation d'une réponse de 3 recettes :")
+    before = bench("  contenu libre", lambda: legacy_validate(free_form, 3), args.repeat)
+    after = bench("  arguments d'appel de fonction", lambda: structured_validate(structured, 3), args.repeat)
+    print(f"  accélération x{before / after:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark du routage des demandes sur des exemples annotés.
+
+Compare l'ancien balayage de mots-clés de RecipeAgent, le niveau mots-clés du
+routeur seul, puis mots-clés + classifieur. Le classifieur n'est jamais testé
+sur ses propres exemples d'entraînement :
+
+- sur les exemples d'entraînement (data/intents.csv), en validation croisée
+  (k plis) ;
+- sur un jeu d'évaluation distinct (data/intents_eval.csv), qui ne sert ni à
+  l'entraînement ni au réglage des mots-clés, avec le classifieur entraîné
+  sur tous les exemples comme en production.
+
+Usage :
+    python -m benchmarks.bench_router [--samples data/intents.csv] [--eval data/intents_eval.csv]
+                                      [--folds 5] [--repeat 200]
+"""
+import argparse
+import os
+import time
+from collections import Counter
+from typing import Callable, List, Sequence, Tuple
+
+from router import DEFAULT_SAMPLES_PATH, IntentRouter, TfidfLinearClassifier, load_samples
+
+DEFAULT_EVAL_PATH = os.path.join(os.path.dirname(DEFAULT_SAMPLES_PATH), "intents_eval.csv")
+
+
+def legacy_detect_intent(user_input: str) -> str:
+    """Routage tel qu'il était fait dans RecipeAgent.detect_intent"""
+    if any(keyword in user_input.lower() for keyword in ["recette", "cuisiner", "préparer", "faire", "ingrédients"]):
+        return "generate_recipes"
+    if "substitution" in user_input.lower():
+        return "suggest_substitutions"
+    return "analyze_ingredients"
+
+
+def evaluate(label: str, route: Callable[[str], str], samples: Sequence[Tuple[str, str]], repeat: int) -> None:
+    errors: Counter = Counter()
+    correct = 0
+    for text, expected in samples:
+        predicted = route(text)
+        if predicted == expected:
+            correct += 1
+        else:
+            errors[f"{expected} -> {predicted}"] += 1
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text, _ in samples:
+            route(text)
+    cost = (time.perf_counter() - start) / (repeat * len(samples))
+
+    print(f"{label:<32} précision: {correct / len(samples):6.1%}   coût: {cost * 1e6:7.1f} µs/demande")
+    for confusion, count in errors.most_common(3):
+        print(f"{'':<34}{count:3d} x {confusion}")
+
+
+def folds(samples: Sequence[Tuple[str, str]], k: int) -> List[Tuple[list, list]]:
+    # Répartition déterministe : l'exemple i va dans le pli i % k
+    return [
+        ([s for i, s in enumerate(samples) if i % k != fold], [s for i, s in enumerate(samples) if i % k == fold])
+        for fold in range(k)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES_PATH)
+    parser.add_argument("--eval", default=DEFAULT_EVAL_PATH)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    held_out = load_samples(args.eval)
+    # Un exemple présent dans les deux jeux fausserait l'évaluation
+    assert not {text for text, _ in samples} & {text for text, _ in held_out}
+    print(f"{len(samples)} exemples annotés, {dict(Counter(intent for _, intent in samples))}\n")
+
+    print("Exemples d'entraînement (validation croisée pour le classifieur) :")
+    evaluate("ancien balayage de mots-clés", legacy_detect_intent, samples, args.repeat)
+    keyword_router = IntentRouter()
+    evaluate("routeur, mots-clés seuls", lambda text: keyword_router.route(text).intent, samples, args.repeat)
+
+    # Validation croisée : chaque exemple est routé par un classifieur qui ne l'a pas vu
+    start = time.perf_counter()
+    routed = {}
+    for train, test in folds(samples, args.folds):
+        router = IntentRouter(classifier=TfidfLinearClassifier().fit(train))
+        for text, _ in test:
+            routed[text] = router
+    training = (time.perf_counter() - start) / args.folds
+    evaluate("routeur, mots-clés + classifieur", lambda text: routed[text].route(text).intent, samples, args.repeat)
+
+    print(f"\nJeu d'évaluation distinct ({len(held_out)} exemples, {args.eval}) :")
+    evaluate("ancien balayage de mots-clés", legacy_detect_intent, held_out, args.repeat)
+    evaluate("routeur, mots-clés seuls", lambda text: keyword_router.route(text).intent, held_out, args.repeat)
+    full_router = IntentRouter(classifier=TfidfLinearClassifier().fit(samples))
+    evaluate("routeur, mots-clés + classifieur", lambda text: full_router.route(text).intent, held_out, args.repeat)
+    print(f"\nEntraînement du classifieur : {training * 1000:.0f} ms par pli")
+
+
+if __name__ == "__main__":
+    main()
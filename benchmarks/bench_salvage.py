@@ -0,0 +1,94 @@
+"""Réponses tronquées ou mal formées : récupération partielle contre nouvel essai complet.
+
+Le serveur factice (benchmarks/mock_openai.py) dégrade une proportion
+--malformed-rate des réponses (JSON tronqué, virgule en double, tabulation
+brute, texte autour...) et met un temps proportionnel au nombre de tokens
+générés. Les mêmes demandes de 3 recettes passent par `RecipeAgent` :
+
+- sans récupération : une réponse invalide est une erreur, l'utilisateur
+  relance toute la génération (au plus --attempts essais) ;
+- avec récupération : les recettes complètes sont gardées et seules les
+  manquantes sont redemandées ; une réponse encore incomplète est rendue
+  telle quelle (`partial`).
+
+Sont comparés les réponses complètes, partielles et en échec, le nombre
+d'appels et de tokens de réponse par demande et les centiles de latence.
+
+Usage :
+    python -m benchmarks.bench_salvage [--requests 300] [--malformed-rate 0.3] [--malformed-kinds truncated]
+"""
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from app import DEFAULT_RECIPE_COUNT, RecipeAgent
+from benchmarks.load_test import percentile
+from benchmarks.mock_openai import MALFORMED_KINDS, MockBehavior, serve
+from router import IntentRouter
+from transport import OpenAIClients, Transport, build_openai_clients
+
+
+def run(agent: RecipeAgent, requests: int, concurrency: int, attempts: int) -> Tuple[List[float], Dict[str, int]]:
+    """Latences de bout en bout (nouveaux essais compris) et issues des demandes"""
+    outcomes = {"complète": 0, "partielle": 0, "échec": 0}
+    lock = threading.Lock()
+
+    def call(index: int) -> float:
+        start = time.perf_counter()
+        for _ in range(attempts):
+            result = agent._generate_recipes(f"pâtes rapides (demande {index})", DEFAULT_RECIPE_COUNT)
+            if "error" not in result:
+                break
+        if "error" in result:
+            outcome = "échec"
+        else:
+            outcome = "partielle" if result.get("partial") else "complète"
+        with lock:
+            outcomes[outcome] += 1
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, range(requests)))
+    return latencies, outcomes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", default="lognormal:0.3:0.2", help="latence avant le premier token")
+    parser.add_argument("--token-latency", type=float, default=0.004, help="secondes par token de réponse")
+    parser.add_argument("--malformed-rate", type=float, default=0.3)
+    parser.add_argument("--malformed-kinds", default=",".join(MALFORMED_KINDS))
+    parser.add_argument("--attempts", type=int, default=3, help="essais de l'utilisateur par demande")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{args.requests} demandes de {DEFAULT_RECIPE_COUNT} recettes, {args.malformed_rate:.0%} de réponses "
+          f"mal formées ({args.malformed_kinds}), au plus {args.attempts} essais")
+    print(f"{'':<22} {'complètes':>9} {'partielles':>10} {'échecs':>7}   {'appels':>6} {'tokens':>7}   "
+          f"{'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, salvage in (("sans récupération", False), ("avec récupération", True)):
+        behavior = MockBehavior(args.latency, malformed_rate=args.malformed_rate, seed=args.seed,
+                                malformed_kinds=tuple(args.malformed_kinds.split(",")),
+                                token_latency=args.token_latency)
+        server = serve(behavior)
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+        transport = Transport(OpenAIClients(lambda: build_openai_clients("bench", base_url)))
+        agent = RecipeAgent(router=IntentRouter(), transport=transport, salvage=salvage)
+        latencies, outcomes = run(agent, args.requests, args.concurrency, args.attempts)
+        server.shutdown()
+        usage = transport.usage.stats().values()
+        calls = sum(tool["calls"] for tool in usage)
+        tokens = sum(tool["completion_tokens"] for tool in usage)
+        print(f"{name:<22} {outcomes['complète']:>9} {outcomes['partielle']:>10} {outcomes['échec']:>7}   "
+              f"{calls / args.requests:>6.2f} {tokens / args.requests:>7.0f}   "
+              + " ".join(f"{percentile(latencies, p) * 1000:>5.0f} ms" for p in (50, 95, 99)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Latence des demandes interactives pendant un pic de lots, avec et sans ordonnanceur.
+
+Un fournisseur simulé traite au plus --capacity appels à la fois (les
+autres attendent leur tour) avec une latence fixe. Pendant qu'un lot envoie
+des générations de recettes depuis --batch-threads threads, des demandes
+interactives (substitutions) arrivent à intervalle régulier. Sont comparés
+les appels directs et les appels passés par `LLMScheduler`, limité à la
+capacité du fournisseur.
+
+Usage :
+    python -m benchmarks.bench_scheduler [--capacity 8] [--batch-threads 48] [--interactive 60] [--batch-share 0.75]
+"""
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+from benchmarks.load_test import percentile
+from scheduler import BATCH, LLMScheduler, MemoryBucketStore, PrioritySlots, request_context
+from transport import OpenAIClients, Transport
+
+
+class SimulatedProvider:
+    """Client OpenAI minimal : capacité bornée et latence fixe"""
+
+    def __init__(self, capacity: int, latency: float):
+        self.latency = latency
+        # File d'attente dans l'ordre d'arrivée, comme chez le fournisseur
+        self._executor = ThreadPoolExecutor(max_workers=capacity)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout: Optional[float] = None, **kwargs):
+        self._executor.submit(time.sleep, self.latency).result()
+        message = SimpleNamespace(content="{}", tool_calls=None)
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=200)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def run(transport: Transport, batch_threads: int, interactive: int, interval: float) -> Tuple[List[float], float]:
+    """Latences des demandes interactives pendant le pic de lots, et débit du lot (appels/s)"""
+    stop = threading.Event()
+    batch_calls = [0]
+
+    def batch_worker() -> None:
+        with request_context("lot", BATCH):
+            while not stop.is_set():
+                transport.create("generate_recipes", model="bench", messages=[])
+                batch_calls[0] += 1
+
+    workers = [threading.Thread(target=batch_worker, daemon=True) for _ in range(batch_threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(interval * 5)
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def interactive_call() -> None:
+        with request_context("utilisateur"):
+            start = time.perf_counter()
+            transport.create("suggest_substitutions", model="bench", messages=[])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    callers = []
+    for _ in range(interactive):
+        caller = threading.Thread(target=interactive_call)
+        caller.start()
+        callers.append(caller)
+        time.sleep(interval)
+    for caller in callers:
+        caller.join()
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return latencies, batch_calls[0] / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--batch-threads", type=int, default=48)
+    parser.add_argument("--interactive", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--batch-share", type=float, default=0.75)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"Fournisseur : {args.capacity} appels simultanés, {args.latency * 1000:.0f} ms par appel ; "
+          f"{args.batch_threads} threads de lot")
+    print(f"{'':<22} {'p50':>9} {'p95':>9} {'max':>9}   {'débit du lot':>12}")
+    for name, scheduler in (
+        ("sans ordonnanceur", None),
+        ("avec ordonnanceur", LLMScheduler(MemoryBucketStore(), slots=PrioritySlots(args.capacity, args.batch_share))),
+    ):
+        provider = SimulatedProvider(args.capacity, args.latency)
+        transport = Transport(OpenAIClients.of(provider), scheduler=scheduler)
+        latencies, throughput = run(transport, args.batch_threads, args.interactive, args.interval)
+        print(f"{name:<22} {percentile(latencies, 50) * 1000:>6.0f} ms {percentile(latencies, 95) * 1000:>6.0f} ms "
+              f"{max(latencies) * 1000:>6.0f} ms   {throughput:>8.0f} /s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Démarrage à froid : import, création de l'application et premières requêtes.
+
+Chaque mesure est faite dans un processus neuf (médiane de --repeat
+processus), pour trois configurations :
+
+- paresseuse (défaut) : les composants sont construits à la première requête
+  qui en a besoin ;
+- préchargée (RECIPE_PRELOAD=1) : les données en lecture seule sont chargées
+  par create_app, avant le fork des workers ;
+- tout construit : agent et clients OpenAI créés au démarrage, comme lorsque
+  l'import de app.py construisait tout.
+
+La première demande de chat est une substitution servie par le graphe local :
+aucun appel au modèle n'est fait.
+
+Usage :
+    python -m benchmarks.bench_startup [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+timings = {"import": time.perf_counter() - start}
+mark = time.perf_counter()
+flask_app = app.create_app({"LOAD_DOTENV": False})
+if sys.argv[1] == "eager":
+    services = flask_app.extensions["recipe"]
+    services.preload()
+    services.agent, services.clients.client
+timings["create_app"] = time.perf_counter() - mark
+client = flask_app.test_client()
+mark = time.perf_counter()
+client.get("/")
+timings["GET /"] = time.perf_counter() - mark
+mark = time.perf_counter()
+client.post("/api/chat", json={"message": "Par quoi remplacer le beurre dans un gâteau"})
+timings["POST /api/chat"] = time.perf_counter() - mark
+timings["total"] = time.perf_counter() - start
+timings["openai"] = "openai" in sys.modules
+print(json.dumps(timings))
+"""
+
+MODES = {
+    "paresseuse": ("lazy", {}),
+    "préchargée": ("lazy", {"RECIPE_PRELOAD": "1"}),
+    "tout construit": ("eager", {}),
+}
+
+
+def measure(mode: str, extra_env: Dict[str, str]) -> Dict[str, float]:
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "bench"), **extra_env)
+    output = subprocess.run([sys.executable, "-c", CHILD, mode], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    steps = ["import", "create_app", "GET /", "POST /api/chat", "total"]
+    print(f"Médiane de {args.repeat} processus, en ms")
+    print(f"{'':<16}" + "".join(f"{step:>16}" for step in steps) + f"{'openai importé':>16}")
+    for name, (mode, extra_env) in MODES.items():
+        runs: List[Dict[str, float]] = [measure(mode, extra_env) for _ in range(args.repeat)]
+        medians = [statistics.median(run[step] for run in runs) * 1000 for step in steps]
+        print(f"{name:<16}" + "".join(f"{value:>16.1f}" for value in medians)
+              + f"{'oui' if runs[-1]['openai'] else 'non':>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Graphe de substitutions : couverture et temps de réponse, sans appel au modèle.
+
+Les demandes de substitution de `data/intents.csv` passent par l'extraction
+d'entités du routeur puis par le graphe, comme dans `process_request`. Sont
+mesurés :
+
+- la part des demandes résolues en local (les autres iraient au modèle) ;
+- le chargement du graphe ;
+- le temps de réponse, premier appel (rapprochement du nom) puis appels
+  suivants (nom déjà rapproché).
+
+Usage :
+    python -m benchmarks.bench_substitutions [--samples data/intents.csv] [--repeat 2000]
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.load_test import percentile
+from nutrition import get_nutrition_database
+from router import DEFAULT_SAMPLES_PATH, IntentRouter, load_samples
+from substitutions import DEFAULT_GRAPH_PATH, SubstitutionGraph, detect_context, diet_tags
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES_PATH)
+    parser.add_argument("--graph", default=DEFAULT_GRAPH_PATH)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    database = get_nutrition_database()
+    router = IntentRouter(vocabulary=database.vocabulary())
+    start = time.perf_counter()
+    graph = SubstitutionGraph.load(args.graph, database)
+    load_time = time.perf_counter() - start
+    stats = graph.stats()
+    print(f"{stats['ingredients']} ingrédients, {stats['substitutions']} substitutions, "
+          f"chargés en {load_time * 1000:.1f} ms")
+
+    requests = []
+    for text, intent in load_samples(args.samples):
+        if intent != "suggest_substitutions":
+            continue
+        entities = router.extract_entities(text)
+        ingredients = entities.get("ingredients")
+        if ingredients:
+            requests.append((text, ingredients[0], detect_context(text), diet_tags(entities.get("diet"))))
+        else:
+            print(f"  sans ingrédient reconnu : {text}")
+
+    first, resolved, missed = [], 0, []
+    for text, ingredient, context, diets in requests:
+        start = time.perf_counter()
+        answer = graph.answer(ingredient, context, diets)
+        first.append(time.perf_counter() - start)
+        if answer is not None:
+            resolved += 1
+        else:
+            missed.append(ingredient)
+    total = len(requests)
+    print(f"\nRésolues en local : {resolved}/{total} ({resolved / max(total, 1):.0%})")
+    if missed:
+        print(f"  vers le modèle : {', '.join(missed)}")
+
+    repeated = []
+    for _ in range(args.repeat // max(total, 1) + 1):
+        for text, ingredient, context, diets in requests:
+            start = time.perf_counter()
+            graph.answer(ingredient, context, diets)
+            repeated.append(time.perf_counter() - start)
+    print("\nRéponse (p50 / p95) :")
+    for name, values in (("premier appel", first), ("appels suivants", repeated)):
+        print(f"  {name:<16} {percentile(values, 50) * 1e6:>8.1f} µs {percentile(values, 95) * 1e6:>8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Test de charge de /api/chat contre le serveur OpenAI factice.
+
+Démarre le serveur factice (benchmarks/mock_openai.py) et l'application
+(uvicorn --factory asgi:create_asgi_app par défaut, ou le serveur Flask), envoie les
+demandes à la concurrence voulue puis affiche le débit, les latences p50,
+p95 et p99, les erreurs et le temps CPU et la mémoire du serveur par
+requête (lus dans /proc, Linux uniquement).
+
+Les seuils --max-p95 et --max-error-rate font échouer la commande (code 1)
+pour bloquer un déploiement en cas de régression.
+
+Usage :
+    python -m benchmarks.load_test --concurrency 32 --requests 500 --latency lognormal:0.8:0.4
+    python -m benchmarks.load_test --target http://127.0.0.1:5000 --server-pid 1234
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, List, Optional
+
+from benchmarks.mock_openai import add_behavior_arguments, behavior_from_args, serve
+
+MESSAGES = (
+    "Une recette de pâtes à la tomate pour 4 personnes",
+    "Je veux un plat végétarien avec des courgettes et du riz",
+    "Idée de dessert au chocolat pour 6",
+    "Un curry de lentilles rapide",
+    "Nous sommes 2 et voulons un plat italien",
+    "Par quoi remplacer le beurre dans un gâteau",
+    "Qu'est-ce que je peux faire avec des poireaux, des pommes de terre et du lait",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(server: str, port: int, mock_url: str, extra_env: Dict[str, str]) -> subprocess.Popen:
+    env = dict(os.environ, OPENAI_API_KEY="mock", OPENAI_BASE_URL=mock_url, **extra_env)
+    if server == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "--factory", "asgi:create_asgi_app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port)]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url: str, timeout: float = 60.0) -> None:
+    parsed = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=2)
+            conn.request("GET", "/api/transport/stats")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"L'application ne répond pas sur {url}")
+
+
+class ProcessSampler:
+    """Temps CPU et mémoire d'un processus, d'après /proc"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.available = pid is not None and os.path.exists(f"/proc/{pid}/stat")
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime et stime (champs 14 et 15), en tops d'horloge
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def memory_kb(self) -> Dict[str, int]:
+        values = {}
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = int(value.split()[0])
+        return values
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_load(url: str, concurrency: int, total: int, distinct_prompts: int, options: Dict[str, Any],
+             label: str = "variante") -> Dict[str, Any]:
+    """Envoie `total` demandes à /api/chat avec `concurrency` clients en parallèle"""
+    parsed = urllib.parse.urlsplit(url)
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+
+    def worker():
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=120)
+        while True:
+            i = next(counter)
+            if i >= total:
+                break
+            variant = i % distinct_prompts if distinct_prompts else i
+            message = f"{MESSAGES[variant % len(MESSAGES)]} ({label} {variant})"
+            body = json.dumps({"message": message, **options})
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/api/chat", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                payload = response.read()
+                if response.status != 200:
+                    outcome = f"http_{response.status}"
+                else:
+                    data = json.loads(payload)
+                    # Les erreurs des outils sont renvoyées avec un statut 200
+                    failed = "error" in data or isinstance(data.get("data"), dict) and "error" in data["data"]
+                    outcome = "tool_error" if failed else "ok"
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                outcome = type(e).__name__
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=120)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    errors = total - outcomes.get("ok", 0)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "duration": round(duration, 3),
+        "throughput": round(total / duration, 2),
+        "latency": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies), 4),
+        },
+        "outcomes": outcomes,
+        "error_rate": round(errors / total, 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--prompts", type=int, default=0,
+                        help="nombre de messages distincts (0 : tous différents, sans hit de cache)")
+    parser.add_argument("--recipe-count", type=int, default=None)
+    parser.add_argument("--fan-out", action="store_true")
+    parser.add_argument("--server", choices=("uvicorn", "flask"), default="uvicorn")
+    parser.add_argument("--target", help="URL d'une application déjà lancée (pas de serveur factice)")
+    parser.add_argument("--server-pid", type=int, help="processus à mesurer avec --target")
+    parser.add_argument("--output-mode", choices=("json", "tools"), help="RECIPE_OUTPUT_MODE de l'application")
+    parser.add_argument("--json", action="store_true", help="affiche le rapport en JSON")
+    parser.add_argument("--max-p95", type=float, help="p95 maximal en secondes")
+    parser.add_argument("--max-error-rate", type=float, help="proportion d'erreurs maximale")
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    options: Dict[str, Any] = {}
+    if args.recipe_count is not None:
+        options["recipe_count"] = args.recipe_count
+    if args.fan_out:
+        options["fan_out"] = True
+
+    mock = None
+    process = None
+    if args.target:
+        url, pid = args.target, args.server_pid
+    else:
+        mock = serve(behavior_from_args(args))
+        port = free_port()
+        extra_env = {"RECIPE_OUTPUT_MODE": args.output_mode} if args.output_mode else {}
+        # Toutes les demandes viennent de la même adresse : pas de quota par client
+        extra_env.setdefault("RECIPE_CLIENT_TOKENS_PER_MINUTE", os.getenv("RECIPE_CLIENT_TOKENS_PER_MINUTE", "0"))
+        process = start_app(args.server, port, f"http://127.0.0.1:{mock.server_port}/v1", extra_env)
+        url, pid = f"http://127.0.0.1:{port}", process.pid
+
+    try:
+        wait_ready(url)
+        if args.warmup:
+            run_load(url, min(args.concurrency, args.warmup), args.warmup, 0, options, label="échauffement")
+
+        sampler = ProcessSampler(pid)
+        cpu_before = sampler.cpu_seconds() if sampler.available else None
+        rss_before = sampler.memory_kb().get("VmRSS") if sampler.available else None
+        report = run_load(url, args.concurrency, args.requests, args.prompts, options)
+        if sampler.available:
+            memory = sampler.memory_kb()
+            report["server"] = {
+                "cpu_ms_per_request": round((sampler.cpu_seconds() - cpu_before) * 1000 / args.requests, 3),
+                "rss_mb": round(memory.get("VmRSS", 0) / 1024, 1),
+                "rss_growth_kb_per_request": round((memory.get("VmRSS", 0) - rss_before) / args.requests, 2),
+                "peak_rss_mb": round(memory.get("VmHWM", 0) / 1024, 1),
+            }
+        if mock is not None:
+            report["mock"] = dict(mock.behavior.counts)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if mock is not None:
+            mock.shutdown()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failures = []
+    if args.max_p95 is not None and report["latency"]["p95"] > args.max_p95:
+        failures.append(f"p95 {report['latency']['p95']} s > {args.max_p95} s")
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        failures.append(f"taux d'erreurs {report['error_rate']} > {args.max_error_rate}")
+    if failures:
+        print("Seuils dépassés : " + ", ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    print(f"{report['requests']} demandes, concurrence {report['concurrency']}, {report['duration']} s")
+    print(f"  débit      {report['throughput']:>10} req/s")
+    for name in ("p50", "p95", "p99", "max"):
+        print(f"  {name:<10} {latency[name] * 1000:>10.1f} ms")
+    print(f"  erreurs    {report['error_rate']:>10.2%}  {report['outcomes']}")
+    server = report.get("server")
+    if server:
+        print(f"  CPU        {server['cpu_ms_per_request']:>10} ms/req")
+        print(f"  mémoire    {server['rss_mb']:>10} Mo (pic {server['peak_rss_mb']} Mo, "
+              f"{server['rss_growth_kb_per_request']} Ko/req)")
+    if "mock" in report:
+        print(f"  serveur factice : {report['mock']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""Serveur local compatible OpenAI pour les benchmarks, sans consommer de tokens.
+
+Répond à POST /v1/chat/completions (streaming compris) avec des recettes
+factices, au format attendu par le mode `json` ou `tools` de prompts.py :
+
+- latence configurable : `fixed:0.5`, `uniform:0.2:1.5`, `lognormal:0.8:0.4`
+  (médiane et sigma) ou `stall:0.8:0.4:0.05:6` (lognormale, plus 6 s de
+  blocage pour 5 % des appels), en secondes, éventuellement
+  différente par modèle (`--model-latency gpt-4.1-mini=fixed:0.3`), plus
+  éventuellement un temps de génération par token de réponse
+  (`--token-latency 0.005`) ;
+- taux d'erreurs 500, éventuellement par modèle (`--model-error-rate
+  gpt-4.1-nano=1`), et limite de débit (429 avec retry-after-ms) ;
+- proportion de réponses mal formées (bloc de code, virgule en trop,
+  texte autour, JSON tronqué avec `finish_reason` à `length`, virgule en
+  double entre deux recettes, tabulation brute dans une chaîne) pour exercer
+  le nettoyage et la récupération des réponses partielles, éventuellement
+  limitée à certains types (`--malformed-kinds truncated,stray`).
+
+GET /stats retourne les compteurs de réponses par type, dont les requêtes
+abandonnées par le client avant la réponse (`disconnected`).
+
+Usage :
+    python -m benchmarks.mock_openai --port 8001 --latency lognormal:0.8:0.4 --error-rate 0.01
+puis lancer l'application avec OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MALFORMED_KINDS = ("fenced", "trailing_comma", "prose", "truncated", "stray", "control_char")
+
+_COUNT_RE = re.compile(r"Génère (\d+) recette")
+
+_DISHES = ("Pâtes à la tomate", "Risotto aux champignons", "Curry de lentilles", "Tarte aux poireaux",
+           "Salade de quinoa", "Gratin de courgettes", "Poulet rôti au citron", "Soupe de potiron")
+
+
+def recipe(index: int) -> Dict[str, Any]:
+    """Recette factice complète, valide pour models.validate_recipes"""
+    return {
+        "title": f"{_DISHES[index % len(_DISHES)]} {index + 1}",
+        "servings": "4",
+        "prep_time": "15",
+        "cook_time": "25",
+        "difficulty": ("Facile", "Moyen", "Difficile")[index % 3],
+        "ingredients": [
+            {"name": "pâtes", "quantity": "400", "unit": "g"},
+            {"name": "tomates", "quantity": "4", "unit": "pièces"},
+            {"name": "huile d'olive", "quantity": "2", "unit": "cuillères à soupe"},
+            {"name": "ail", "quantity": "2", "unit": "gousses"},
+            {"name": "basilic", "quantity": "1", "unit": "bouquet"},
+        ],
+        "steps": [
+            {"step_number": 1, "description": "Faire chauffer l'huile et dorer l'ail émincé."},
+            {"step_number": 2, "description": "Ajouter les tomates coupées et laisser mijoter 15 minutes."},
+            {"step_number": 3, "description": "Cuire les pâtes, les égoutter et les mélanger à la sauce."},
+        ],
+        "tips": ["Garder un peu d'eau de cuisson pour lier la sauce."],
+    }
+
+
+def recipe_payload(count: int) -> str:
+    return json.dumps({"recipes": [recipe(i) for i in range(count)]}, ensure_ascii=False)
+
+
+def malformed(text: str, kind: str) -> str:
+    """Dégrade une réponse JSON comme le font parfois les modèles"""
+    if kind == "fenced":
+        return f"```json\n{text}\n```"
+    if kind == "trailing_comma":
+        return text.replace("]}", "],}", 1)
+    if kind == "prose":
+        return f"Voici vos recettes :\n{text}\nBon appétit !"
+    if kind == "stray":
+        return text.replace('}, {"title"', '}, , {"title"', 1)
+    if kind == "control_char":
+        return text.replace(" et ", "\tet ", 1)
+    return text[:len(text) * 2 // 3]
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Distribution de latence : `fixed:s`, `uniform:min:max`, `lognormal:médiane:sigma`
+    ou `stall:médiane:sigma:proportion:blocage`"""
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(":") if value]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "stall" and len(values) == 4:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) + (values[3] if random.random() < values[2] else 0.0)
+    raise ValueError(f"Latence invalide: {spec}")
+
+
+class TokenBucket:
+    """Limite de débit du serveur factice, en requêtes par seconde"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> Optional[float]:
+        """Consomme un jeton ; retourne l'attente conseillée si le seau est vide"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate
+
+
+class MockBehavior:
+    """Comportement configurable du serveur factice"""
+
+    def __init__(self, latency: str = "fixed:0.5", error_rate: float = 0.0, malformed_rate: float = 0.0,
+                 rate_limit: float = 0.0, seed: Optional[int] = None,
+                 model_latency: Optional[Dict[str, str]] = None, model_error_rate: Optional[Dict[str, float]] = None,
+                 malformed_kinds: Tuple[str, ...] = MALFORMED_KINDS, token_latency: float = 0.0):
+        self.latency = parse_latency(latency)
+        self.model_latency = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+        self.model_error_rate = dict(model_error_rate or {})
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.malformed_kinds = malformed_kinds
+        self.token_latency = token_latency
+        self.bucket = TokenBucket(rate_limit) if rate_limit > 0 else None
+        self.random = random.Random(seed)
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def latency_for(self, model: Optional[str]) -> float:
+        return self.model_latency.get(model, self.latency)()
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def content(self, body: Dict[str, Any]) -> Tuple[str, bool, str]:
+        """Texte de la réponse, indicateur d'appel de fonction et finish_reason"""
+        messages = body.get("messages") or [{}]
+        user = str(messages[-1].get("content", ""))
+        tools = body.get("tools") or []
+        match = _COUNT_RE.search(user)
+        if tools or match:
+            text = recipe_payload(int(match.group(1)) if match else 1)
+            finish_reason = "tool_calls" if tools else "stop"
+            if self.random.random() < self.malformed_rate:
+                kind = self.random.choice(self.malformed_kinds)
+                self.count(f"malformed_{kind}")
+                text = malformed(text, kind)
+                if kind == "truncated":
+                    finish_reason = "length"
+            return text, bool(tools), finish_reason
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"calories": 250, "proteins": 8.5, "carbs": 30.0, "fat": 9.0}), False, "stop"
+        return "Ces ingrédients se prêtent bien à une poêlée, une soupe ou un gratin.", False, "stop"
+
+
+def _usage(body: Dict[str, Any], text: str) -> Dict[str, int]:
+    # Estimation grossière : un token pour quatre caractères
+    prompt = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+    completion = len(text) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def completion(body: Dict[str, Any], text: str, tool_call: bool, finish_reason: str = "stop") -> Dict[str, Any]:
+    if tool_call:
+        message = {"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+            "function": {"name": body["tools"][0]["function"]["name"], "arguments": text},
+        }]}
+    else:
+        message = {"role": "assistant", "content": text}
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": _usage(body, text),
+    }
+
+
+def stream_chunks(body: Dict[str, Any], text: str, tool_call: bool, size: int = 40) -> List[Dict[str, Any]]:
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    chunks = []
+    for i in range(0, len(text), size):
+        part = text[i:i + size]
+        if tool_call:
+            delta = {"tool_calls": [{"index": 0, "function": {"arguments": part}}]}
+        else:
+            delta = {"content": part}
+        chunks.append({
+            "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        })
+    return chunks
+
+
+def make_handler(behavior: MockBehavior):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send_json(200, dict(behavior.counts))
+            else:
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+
+            if behavior.bucket is not None:
+                wait = behavior.bucket.take()
+                if wait is not None:
+                    behavior.count("rate_limited")
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                    {"retry-after-ms": str(int(wait * 1000))})
+                    return
+
+            latency = behavior.latency_for(body.get("model"))
+            error_rate = behavior.model_error_rate.get(body.get("model"), behavior.error_rate)
+            if behavior.random.random() < error_rate:
+                time.sleep(latency / 4)
+                behavior.count("error")
+                self._send_json(500, {"error": {"message": "Mock server error", "type": "server_error"}})
+                return
+
+            text, tool_call, finish_reason = behavior.content(body)
+            latency += _usage(body, text)["completion_tokens"] * behavior.token_latency
+            if not body.get("stream"):
+                time.sleep(latency)
+                try:
+                    self._send_json(200, completion(body, text, tool_call, finish_reason))
+                except (BrokenPipeError, ConnectionResetError):
+                    behavior.count("disconnected")
+                    self.close_connection = True
+                    return
+                behavior.count("ok")
+                return
+
+            # Streaming : premier fragment après 30 % de la latence, le reste réparti
+            chunks = stream_chunks(body, text, tool_call)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            time.sleep(latency * 0.3)
+            gap = latency * 0.7 / max(len(chunks), 1)
+            for chunk in chunks:
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(gap)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            behavior.count("ok_stream")
+
+    return MockHandler
+
+
+def serve(behavior: MockBehavior, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Démarre le serveur factice dans un thread ; port 0 choisit un port libre"""
+    server = ThreadingHTTPServer((host, port), make_handler(behavior))
+    server.daemon_threads = True
+    server.behavior = behavior
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def add_behavior_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal:0.8:0.4",
+                        help="fixed:s, uniform:min:max, lognormal:médiane:sigma ou "
+                             "stall:médiane:sigma:proportion:blocage (secondes)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="proportion de réponses 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="proportion de recettes mal formées")
+    parser.add_argument("--malformed-kinds", default=",".join(MALFORMED_KINDS),
+                        help="types de défauts, séparés par des virgules")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="temps de génération par token de réponse, ajouté à la latence (secondes)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requêtes par seconde avant 429 (0 : aucune)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODÈLE=LATENCE",
+                        help="latence propre à un modèle, par exemple gpt-4.1-mini=fixed:0.3")
+    parser.add_argument("--model-error-rate", action="append", default=[], metavar="MODÈLE=TAUX",
+                        help="proportion de réponses 500 propre à un modèle")
+
+
+def behavior_from_args(args: argparse.Namespace) -> MockBehavior:
+    model_latency = dict(spec.split("=", 1) for spec in args.model_latency)
+    model_error_rate = {model: float(rate) for model, rate in (spec.split("=", 1) for spec in args.model_error_rate)}
+    return MockBehavior(args.latency, args.error_rate, args.malformed_rate, args.rate_limit, args.seed,
+                        model_latency, model_error_rate, tuple(args.malformed_kinds.split(",")), args.token_latency)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(behavior_from_args(args), args.host, args.port)
+    print(f"Serveur OpenAI factice sur http://{args.host}:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""Cache de réponses pour les outils de RecipeAgent.
+
+Les prompts sont normalisés (casse, accents, mots de remplissage, nombres,
+pluriels) avant d'être utilisés comme clé, afin que des formulations quasi
+identiques comme "4 personnes plat italien" et "plat italien pour quatre"
+partagent la même entrée : le nombre de convives est placé en tête de la clé.
+L'ordre des autres mots et les négations sont conservés : "poulet sans
+fromage" et "fromage sans poulet", ou "je ne veux pas de poisson" et "je
+veux du poisson", restent distincts.
+
+Une recherche par similarité d'embeddings peut être activée en complément.
+Elle ne compare que les entrées récentes de même nombre de convives, avec des
+embeddings normés stockés en float32.
+"""
+import array
+import hashlib
+import json
+import logging
+import math
+import operator
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from models import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Mots de remplissage, sans valeur discriminante pour la demande
+STOPWORDS = {
+    "a", "au", "aux", "avec", "c", "ce", "ces", "cette", "d", "de", "des", "du",
+    "en", "et", "est", "etre", "faire", "il", "j", "je", "l", "la", "le", "les",
+    "leur", "ma", "me", "mes", "moi", "mon", "nos", "notre", "nous", "on",
+    "par", "pour", "qu", "que", "qui", "sa", "se", "ses", "si",
+    "son", "sommes", "sur", "ta", "te", "tes", "toi", "ton", "tu", "un", "une",
+    "vos", "votre", "vous", "voudrais", "voulons", "veux", "veut", "souhaite",
+    "souhaitons", "aimerais", "aimerions", "manger", "svp", "merci", "bonjour",
+    "personne", "personnes", "pers", "gens", "convives",
+}
+
+# Négations et exclusions : elles changent le sens de la demande et ne sont
+# jamais retirées
+NEGATIONS = {"ne", "n", "pas", "sans", "aucun", "aucune", "ni", "jamais", "sauf", "hors", "excepte"}
+
+# Nombres écrits en toutes lettres
+NUMBER_WORDS = {
+    "un": "1", "une": "1", "deux": "2", "trois": "3", "quatre": "4", "cinq": "5",
+    "six": "6", "sept": "7", "huit": "8", "neuf": "9", "dix": "10", "onze": "11",
+    "douze": "12", "quinze": "15", "vingt": "20",
+}
+
+# Mots qui comptent des convives ("4 personnes") ou les annoncent ("pour 4", "nous sommes 4")
+SERVING_WORDS = {"personne", "personnes", "pers", "gens", "convives", "couverts", "portions"}
+SERVING_INTRODUCERS = {"pour", "sommes"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def strip_accents(text: str) -> str:
+    """Supprime les accents d'une chaîne"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _number(token: str) -> Optional[str]:
+    if token.isdigit():
+        return str(int(token))
+    return NUMBER_WORDS.get(token)
+
+
+def _servings_at(words: List[str], i: int) -> Optional[Tuple[str, int]]:
+    """Nombre de convives annoncé à la position i, et nombre de mots qu'il occupe"""
+    number = _number(words[i])
+    following = words[i + 1] if i + 1 < len(words) else None
+    if number is not None and following in SERVING_WORDS:
+        return number, 2
+    if words[i] in SERVING_INTRODUCERS and following is not None:
+        number = _number(following)
+        counted = i + 2 < len(words) and words[i + 2] in SERVING_WORDS
+        # "pour un anniversaire" : l'article ne compte des convives que devant "personne"
+        if number is not None and (counted or following not in ("un", "une")):
+            return number, 3 if counted else 2
+    return None
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalise un prompt pour en faire une clé de cache stable
+
+    Seuls les mots de remplissage sont retirés ; l'ordre des mots restants est
+    conservé, car "poulet sans fromage" n'est pas "fromage sans poulet". Le
+    nombre de convives, où qu'il soit dans la phrase ("4 personnes", "pour
+    quatre", "pour une personne"), est placé en tête sous la forme "n=4".
+    """
+    words = _TOKEN_RE.findall(strip_accents(prompt.lower()))
+    servings = None
+    tokens = []
+    i = 0
+    while i < len(words):
+        if servings is None:
+            found = _servings_at(words, i)
+            if found is not None:
+                servings, size = found
+                i += size
+                continue
+        token = words[i]
+        i += 1
+        # "4" et "quatre" doivent donner la même clé, mais "une" seul reste un article
+        if token in NUMBER_WORDS and token not in ("un", "une"):
+            tokens.append(NUMBER_WORDS[token])
+            continue
+        if token in STOPWORDS:
+            continue
+        if token.isdigit():
+            tokens.append(str(int(token)))
+            continue
+        # Pluriel simple : "tomates" -> "tomate"
+        if len(token) > 3 and token[-1] in "sx" and token not in NEGATIONS:
+            token = token[:-1]
+        tokens.append(token)
+    if servings is not None:
+        tokens.insert(0, f"n={servings}")
+    return " ".join(tokens)
+
+
+def unit_vector(vector: Sequence[float]) -> array.array:
+    """Vecteur normé (float32) : la similarité cosinus devient un simple produit scalaire"""
+    norm = math.sqrt(sum(map(operator.mul, vector, vector)))
+    return array.array("f", (x / norm for x in vector) if norm else vector)
+
+
+def _servings_segment(normalized: str) -> str:
+    # Les clés d'un même nombre de convives partagent un préfixe : la recherche
+    # par similarité ne compare que celles-là
+    head = normalized.split(" ", 1)[0]
+    return head if head.startswith("n=") else "n=?"
+
+
+def is_cacheable(result: Any) -> bool:
+    """Indique si la réponse d'un outil peut être mise en cache"""
+    return isinstance(result, dict) and "error" not in result and not result.get("partial")
+
+
+# Une entrée de cache : (valeur JSON, date de création, embedding normé éventuel)
+Entry = Tuple[str, float, Optional[Sequence[float]]]
+
+# Embeddings mémorisés par ResponseCache entre un get et le set qui le suit
+EMBEDDING_MEMO_SIZE = 256
+
+
+class MemoryBackend:
+    """Stockage en mémoire du processus avec éviction LRU"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Entry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def items(self, prefix: str = "", limit: Optional[int] = None) -> List[Tuple[str, Entry]]:
+        """Entrées dont la clé commence par `prefix`, les plus récentes d'abord"""
+        with self._lock:
+            result = []
+            for k, v in reversed(self._entries.items()):
+                if k.startswith(prefix):
+                    result.append((k, v))
+                    if limit is not None and len(result) >= limit:
+                        break
+            return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _encode_embedding(embedding: Optional[Sequence[float]]) -> Optional[bytes]:
+    if not embedding:
+        return None
+    return array.array("f", embedding).tobytes()
+
+
+def _decode_embedding(data: Any) -> Optional[Sequence[float]]:
+    """Embedding stocké en float32 binaire, ou en JSON par les versions précédentes"""
+    if not data:
+        return None
+    if isinstance(data, str):
+        return unit_vector(json.loads(data))
+    embedding = array.array("f")
+    embedding.frombytes(data)
+    return embedding
+
+
+class SQLiteBackend:
+    """Stockage sur disque (SQLite) partagé entre processus, avec éviction LRU"""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, embedding TEXT, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Une connexion par thread : sqlite3 interdit le partage par défaut
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Entry]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, created, embedding FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0], row[1], _decode_embedding(row[2])
+
+    def set(self, key: str, entry: Entry) -> None:
+        value, created, embedding = entry
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, embedding, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, _encode_embedding(embedding), created, time.time()),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    def delete(self, key: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def items(self, prefix: str = "", limit: Optional[int] = None) -> List[Tuple[str, Entry]]:
+        """Entrées dont la clé commence par `prefix`, les plus récentes d'abord"""
+        rows = self._connect().execute(
+            "SELECT key, value, created, embedding FROM cache WHERE key LIKE ? "
+            "ORDER BY accessed DESC LIMIT ?",
+            (prefix + "%", -1 if limit is None else limit),
+        ).fetchall()
+        return [(row[0], (row[1], row[2], _decode_embedding(row[3]))) for row in rows]
+
+    def clear(self) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ResponseCache:
+    """Cache des réponses des outils, indexé sur le prompt normalisé"""
+
+    def __init__(self, backend=None, ttl: float = 3600,
+                 embedder: Optional[Callable[[str], List[float]]] = None,
+                 similarity_threshold: float = 0.92, semantic_scan: int = 200):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        # Nombre d'entrées récentes comparées par la recherche par similarité
+        self.semantic_scan = semantic_scan
+        # Derniers embeddings calculés : un get manqué puis le set du même prompt
+        # n'appellent le modèle d'embedding qu'une fois
+        self._embeddings: "OrderedDict[str, Sequence[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def make_key(tool: str, prompt: str) -> str:
+        """Construit la clé de cache d'un outil pour un prompt"""
+        normalized = normalize_prompt(prompt)
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"{tool}:{_servings_segment(normalized)}:{digest}"
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _embed(self, prompt: str) -> Optional[Sequence[float]]:
+        if self.embedder is None:
+            return None
+        text = normalize_prompt(prompt) or prompt
+        with self._lock:
+            embedding = self._embeddings.get(text)
+            if embedding is not None:
+                self._embeddings.move_to_end(text)
+                return embedding
+        try:
+            embedding = unit_vector(self.embedder(text))
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul de l'embedding: {str(e)}")
+            return None
+        with self._lock:
+            self._embeddings[text] = embedding
+            while len(self._embeddings) > EMBEDDING_MEMO_SIZE:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def _semantic_lookup(self, tool: str, prompt: str, embedding: Sequence[float]) -> Optional[str]:
+        """Entrée la plus proche parmi les plus récentes de même nombre de convives
+
+        Les embeddings sont normés à l'enregistrement : la similarité est un
+        produit scalaire, calculé par map(operator.mul) sans boucle Python.
+        """
+        best_value, best_score = None, self.similarity_threshold
+        prefix = f"{tool}:{_servings_segment(normalize_prompt(prompt))}:"
+        for key, (value, created, other) in self.backend.items(prefix=prefix, limit=self.semantic_scan):
+            if other is None or self._expired(created) or len(other) != len(embedding):
+                continue
+            score = sum(map(operator.mul, embedding, other))
+            if score >= best_score:
+                best_value, best_score = value, score
+        return best_value
+
+    def get(self, tool: str, prompt: str, count_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """Retourne la réponse en cache pour ce prompt, ou None
+
+        `count_miss=False` permet de consulter le cache sans fausser les
+        statistiques quand l'appel sera suivi d'un get_or_compute.
+        """
+        key = self.make_key(tool, prompt)
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, created, _ = entry
+            if not self._expired(created):
+                self._count("hits")
+                return loads(value)
+            self.backend.delete(key)
+
+        embedding = self._embed(prompt)
+        if embedding is not None:
+            value = self._semantic_lookup(tool, prompt, embedding)
+            if value is not None:
+                self._count("hits")
+                self._count("semantic_hits")
+                return loads(value)
+
+        if count_miss:
+            self._count("misses")
+        return None
+
+    def set(self, tool: str, prompt: str, value: Dict[str, Any]) -> None:
+        """Enregistre la réponse d'un outil pour ce prompt"""
+        key = self.make_key(tool, prompt)
+        entry = (dumps(value), time.time(), self._embed(prompt))
+        self.backend.set(key, entry)
+        self._count("stores")
+
+    def get_or_compute(self, tool: str, prompt: str,
+                       compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Retourne la réponse en cache ou la calcule puis la met en cache"""
+        cached = self.get(tool, prompt)
+        if cached is not None:
+            logger.debug(f"Cache hit pour {tool}: {prompt}")
+            return cached
+        result = compute()
+        # Les erreurs et les réponses partielles ne sont jamais mises en cache
+        if is_cacheable(result):
+            self.set(tool, prompt, result)
+        return result
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs de hits/misses du cache"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def make_openai_embedder(clients, model: str = "text-embedding-3-small") -> Callable[[str], List[float]]:
+    """Crée une fonction d'embedding basée sur l'API OpenAI (clients : transport.OpenAIClients)"""
+    def embed(text: str) -> List[float]:
+        response = clients.client.embeddings.create(model=model, input=text)
+        return response.data[0].embedding
+    return embed
+
+
+def build_cache_from_env(clients=None) -> Optional[ResponseCache]:
+    """Construit le cache à partir des variables d'environnement RECIPE_CACHE_*"""
+    backend_name = os.getenv("RECIPE_CACHE_BACKEND", "memory").lower()
+    if backend_name in ("", "none", "off", "0"):
+        return None
+
+    max_entries = int(os.getenv("RECIPE_CACHE_MAX_ENTRIES", "1000"))
+    if backend_name == "sqlite":
+        path = os.getenv("RECIPE_CACHE_PATH", "recipe_cache.sqlite3")
+        backend = SQLiteBackend(path, max_entries=max_entries)
+    elif backend_name == "memory":
+        backend = MemoryBackend(max_entries=max_entries)
+    else:
+        raise ValueError(f"Backend de cache inconnu: {backend_name}")
+
+    embedder = None
+    if clients is not None and os.getenv("RECIPE_CACHE_SEMANTIC", "0") == "1":
+        embedder = make_openai_embedder(
+            clients, os.getenv("RECIPE_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+        )
+
+    return ResponseCache(
+        backend=backend,
+        ttl=float(os.getenv("RECIPE_CACHE_TTL", "3600")),
+        embedder=embedder,
+        similarity_threshold=float(os.getenv("RECIPE_CACHE_SIMILARITY", "0.92")),
+        semantic_scan=int(os.getenv("RECIPE_CACHE_SEMANTIC_SCAN", "200")),
+    )
@@ -0,0 +1,89 @@
+"""Limiteur de concurrence avec contre-pression pour le mode asynchrone.
+
+Au-delà de `max_concurrent` appels en cours, les requêtes attendent une place
+dans une file bornée. Si la file est pleine, la requête est refusée tout de
+suite (429) ; si l'attente dépasse `wait_timeout`, elle est refusée (503).
+Dans les deux cas le client reçoit un en-tête Retry-After plutôt que
+d'attendre indéfiniment.
+"""
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+
+class Overloaded(Exception):
+    """Levée quand le serveur refuse une requête faute de capacité"""
+
+    def __init__(self, status: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+
+class ConcurrencyLimiter:
+    """Borne le nombre d'appels simultanés et la taille de la file d'attente"""
+
+    def __init__(self, max_concurrent: int = 200, max_waiting: int = 100,
+                 wait_timeout: float = 5.0, retry_after: int = 1):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Créé paresseusement pour être lié à la boucle d'événements du serveur
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        semaphore = self._get_semaphore()
+        if not semaphore.locked():
+            # Place libre : l'acquisition ne suspend pas la coroutine
+            await semaphore.acquire()
+        else:
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(429, self.retry_after, "Trop de requêtes en attente, réessayez plus tard")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise Overloaded(503, self.retry_after, "Service surchargé, réessayez plus tard")
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.active -= 1
+        self._get_semaphore().release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+def build_limiter_from_env() -> ConcurrencyLimiter:
+    """Construit le limiteur à partir des variables d'environnement RECIPE_*"""
+    return ConcurrencyLimiter(
+        max_concurrent=int(os.getenv("RECIPE_MAX_CONCURRENCY", "200")),
+        max_waiting=int(os.getenv("RECIPE_MAX_WAITING", "100")),
+        wait_timeout=float(os.getenv("RECIPE_WAIT_TIMEOUT", "5")),
+        retry_after=int(os.getenv("RECIPE_RETRY_AFTER", "1")),
+    )
@@ -0,0 +1,336 @@
+"""Mesures de performance et endpoint /metrics au format Prometheus.
+
+- histogrammes de durée : requêtes HTTP, outils de RecipeAgent, étapes de la
+  génération (appel au modèle, nettoyage, validation, sérialisation) et
+  chaque tentative d'appel au modèle ;
+- histogramme des tokens consommés par appel ;
+- compteur d'erreurs par étape et par type ;
+- collecteurs lus au moment de l'export (cache, regroupement d'appels,
+  disjoncteur).
+
+Les mesures sont propres à chaque processus : avec plusieurs workers,
+Prometheus interroge chacun d'eux ou agrège les séries.
+
+`SlowRequestProfiler` est un profileur par échantillonnage facultatif
+(RECIPE_PROFILE_SLOW_MS) : il relève périodiquement la pile des threads qui
+traitent une requête et journalise les piles les plus fréquentes des
+requêtes plus lentes que le seuil.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes, en secondes et en tokens
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+
+def _format_labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Compteur monotone, par combinaison d'étiquettes"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Histogram(_Metric):
+    """Histogramme à bornes fixes (cumulées à l'export, comme Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par étiquettes : [effectifs par borne (+Inf en dernier), somme, nombre]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels: Any) -> "Timer":
+        """Chronomètre un bloc : `with HISTOGRAM.time(tool="x") as timer: ...`"""
+        return Timer(self, labels)
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Timer:
+    """Mesure la durée d'un bloc ; les étiquettes peuvent être complétées pendant le bloc"""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def set(self, **labels: Any) -> None:
+        self.labels.update(labels)
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and "outcome" in self.histogram.labelnames:
+            self.labels["outcome"] = exc_type.__name__
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """Ensemble des mesures exportées sur /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DURATION_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """Ajoute une fonction qui retourne des séries (nom, type, aide, échantillons) à l'export"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Export au format texte de Prometheus (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Erreur d'un collecteur de mesures: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_DURATION = REGISTRY.histogram(
+    "recipe_http_request_duration_seconds", "Durée des requêtes HTTP (jusqu'aux en-têtes pour le streaming)",
+    ("method", "endpoint", "status"))
+TOOL_DURATION = REGISTRY.histogram(
+    "recipe_tool_duration_seconds", "Durée des outils de l'agent, cache compris", ("tool", "outcome"))
+STAGE_DURATION = REGISTRY.histogram(
+    "recipe_stage_duration_seconds", "Durée des étapes de traitement d'une réponse", ("stage",))
+LLM_DURATION = REGISTRY.histogram(
+    "recipe_llm_request_duration_seconds", "Durée de chaque tentative d'appel au modèle", ("tool", "outcome"))
+QUEUE_DURATION = REGISTRY.histogram(
+    "recipe_llm_queue_seconds", "Attente d'un quota et d'une place avant l'appel au modèle", ("priority",))
+LLM_TOKENS = REGISTRY.histogram(
+    "recipe_llm_tokens", "Tokens consommés par appel au modèle", ("tool", "kind"), TOKEN_BUCKETS)
+LLM_HEDGES = REGISTRY.counter(
+    "recipe_llm_hedges_total", "Appels doublés après un délai, par issue", ("tool", "outcome"))
+LLM_HEDGE_WASTED_TOKENS = REGISTRY.counter(
+    "recipe_llm_hedge_wasted_tokens_total", "Tokens des réponses écartées par le doublement d'appels", ("tool",))
+PARTIAL_RESPONSES = REGISTRY.counter(
+    "recipe_partial_responses_total", "Réponses de recettes invalides ou incomplètes, par issue de la récupération",
+    ("outcome",))
+RECIPES_SALVAGED = REGISTRY.counter(
+    "recipe_recipes_salvaged_total", "Recettes complètes récupérées dans des réponses invalides ou tronquées")
+ERRORS = REGISTRY.counter(
+    "recipe_errors_total", "Erreurs par étape et par type", ("stage", "type"))
+
+
+class _Profile:
+    __slots__ = ("label", "ident", "start", "samples")
+
+    def __init__(self, label: str, ident: int):
+        self.label = label
+        self.ident = ident
+        self.start = time.perf_counter()
+        self.samples: _Counter = _Counter()
+
+
+class SlowRequestProfiler:
+    """Profileur par échantillonnage des requêtes lentes
+
+    Un thread relève toutes les `interval` secondes la pile des threads qui
+    traitent une requête. À la fin d'une requête plus longue que `threshold`,
+    les piles les plus fréquentes (format « replié » des flame graphs) sont
+    journalisées et conservées dans `profiles`.
+
+    Les requêtes servies en asynchrone partagent le thread de la boucle
+    d'événements : elles passent leur propre clé à `start` et `stop`, et
+    leurs échantillons sont ceux de la boucle pendant la requête.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.01, max_depth: int = 40,
+                 top: int = 10, max_profiles: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_depth = max_depth
+        self.top = top
+        self.profiles: deque = deque(maxlen=max_profiles)
+        self._active: Dict[int, _Profile] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, label: str, key: Any = None) -> None:
+        """Commence l'échantillonnage du thread courant (pour la requête `key`, le thread par défaut)"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident if key is None else key] = _Profile(label, ident)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, key: Any = None) -> Optional[Dict[str, Any]]:
+        """Termine l'échantillonnage de la requête ; retourne le profil si la requête était lente"""
+        with self._lock:
+            profile = self._active.pop(threading.get_ident() if key is None else key, None)
+        if profile is None:
+            return None
+        elapsed = time.perf_counter() - profile.start
+        if elapsed < self.threshold or not profile.samples:
+            return None
+        total = sum(profile.samples.values())
+        result = {
+            "label": profile.label,
+            "duration": round(elapsed, 4),
+            "samples": total,
+            "stacks": [{"stack": stack, "samples": count, "share": round(count / total, 3)}
+                       for stack, count in profile.samples.most_common(self.top)],
+        }
+        self.profiles.append(result)
+        logger.warning(
+            f"Requête lente {profile.label} ({elapsed:.3f} s, {total} échantillons), piles les plus fréquentes:\n"
+            + "\n".join(f"  {s['samples']:>5} {s['stack']}" for s in result["stacks"])
+        )
+        return result
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample_loop(self) -> None:
+        while True:
+            if not self._active:
+                # Aucune requête suivie : attente sans consommer de CPU
+                self._wakeup.clear()
+                if not self._active:
+                    self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for profile in self._active.values():
+                    frame = frames.get(profile.ident)
+                    if frame is not None:
+                        profile.samples[self._collapse(frame)] += 1
+
+
+def build_profiler_from_env() -> Optional[SlowRequestProfiler]:
+    """Construit le profileur à partir de RECIPE_PROFILE_SLOW_MS (désactivé par défaut)"""
+    threshold_ms = os.getenv("RECIPE_PROFILE_SLOW_MS")
+    if not threshold_ms:
+        return None
+    interval_ms = float(os.getenv("RECIPE_PROFILE_INTERVAL_MS", "10"))
+    return SlowRequestProfiler(float(threshold_ms) / 1000, interval=interval_ms / 1000)
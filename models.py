@@ -0,0 +1,214 @@
+"""Modèle typé des recettes (Recipe, Ingredient, Step).
+
+Les classes utilisent `__slots__` pour limiter la mémoire occupée par les
+recettes en cache ou traitées par lots. `from_dict` valide et nettoie une
+recette en une seule passe : toutes les erreurs sont collectées et les
+champs manquants reçoivent une valeur par défaut.
+
+La sérialisation passe par orjson s'il est installé, sinon par le module
+json de la bibliothèque standard.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from normalizer import clean_text
+
+try:
+    import orjson
+except ImportError:  # dépendance facultative
+    orjson = None
+
+
+class Ingredient:
+    __slots__ = ("name", "quantity", "unit")
+
+    FIELDS = ("name", "quantity", "unit")
+
+    def __init__(self, name: str = "", quantity: str = "", unit: str = ""):
+        self.name = name
+        self.quantity = quantity
+        self.unit = unit
+
+    @classmethod
+    def from_dict(cls, data: Any, path: str, errors: List[str]) -> Optional["Ingredient"]:
+        """Construit un ingrédient, None s'il est vide ou invalide"""
+        if not isinstance(data, dict):
+            errors.append(f"{path}: ingrédient invalide")
+            return None
+        name, quantity, unit = (data.get(field) for field in cls.FIELDS)
+        if not (name or quantity or unit):
+            return None
+        return cls(
+            clean_text(name) if name else "",
+            clean_text(quantity) if quantity else "",
+            clean_text(unit) if unit else "",
+        )
+
+    def to_dict(self) -> Dict[str, str]:
+        # Seuls les champs renseignés sont exposés, comme avant le modèle typé
+        result = {}
+        if self.name:
+            result["name"] = self.name
+        if self.quantity:
+            result["quantity"] = self.quantity
+        if self.unit:
+            result["unit"] = self.unit
+        return result
+
+
+class Step:
+    __slots__ = ("step_number", "description")
+
+    def __init__(self, step_number: Any, description: str):
+        self.step_number = step_number
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, data: Any, default_number: int, path: str, errors: List[str]) -> Optional["Step"]:
+        """Construit une étape, None si elle n'a pas de description"""
+        if not isinstance(data, dict):
+            errors.append(f"{path}: étape invalide")
+            return None
+        description = data.get("description")
+        if not description:
+            errors.append(f"{path}: description manquante")
+            return None
+        return cls(data.get("step_number", default_number), clean_text(description))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"step_number": self.step_number, "description": self.description}
+
+
+class Recipe:
+    __slots__ = ("title", "servings", "prep_time", "cook_time", "difficulty",
+                 "ingredients", "steps", "tips", "extra")
+
+    TEXT_FIELDS = ("title", "servings", "prep_time", "cook_time", "difficulty")
+    LIST_FIELDS = ("ingredients", "steps", "tips")
+    FIELDS = TEXT_FIELDS + LIST_FIELDS
+
+    def __init__(self, title: str = "", servings: str = "", prep_time: str = "",
+                 cook_time: str = "", difficulty: str = "",
+                 ingredients: Optional[List[Ingredient]] = None,
+                 steps: Optional[List[Step]] = None,
+                 tips: Optional[List[str]] = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.title = title
+        self.servings = servings
+        self.prep_time = prep_time
+        self.cook_time = cook_time
+        self.difficulty = difficulty
+        self.ingredients = ingredients if ingredients is not None else []
+        self.steps = steps if steps is not None else []
+        self.tips = tips if tips is not None else []
+        # Champs supplémentaires renvoyés par le modèle, conservés tels quels
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: Any, path: str = "recipe",
+                  errors: Optional[List[str]] = None) -> Optional["Recipe"]:
+        """Valide et nettoie une recette en une passe, None si elle est inutilisable"""
+        if errors is None:
+            errors = []
+        if not isinstance(data, dict):
+            errors.append(f"{path}: recette invalide")
+            return None
+
+        recipe = cls()
+        for field in cls.TEXT_FIELDS:
+            value = data.get(field)
+            if field not in data:
+                errors.append(f"{path}.{field}: champ manquant")
+            elif value:
+                setattr(recipe, field, clean_text(value))
+
+        for field in cls.LIST_FIELDS:
+            if field not in data:
+                errors.append(f"{path}.{field}: champ manquant")
+            elif not isinstance(data[field], list):
+                errors.append(f"{path}.{field}: une liste est attendue")
+
+        ingredients = data.get("ingredients")
+        if isinstance(ingredients, list):
+            for i, item in enumerate(ingredients):
+                ingredient = Ingredient.from_dict(item, f"{path}.ingredients[{i}]", errors)
+                if ingredient is not None:
+                    recipe.ingredients.append(ingredient)
+
+        steps = data.get("steps")
+        if isinstance(steps, list):
+            for i, item in enumerate(steps):
+                step = Step.from_dict(item, len(recipe.steps) + 1, f"{path}.steps[{i}]", errors)
+                if step is not None:
+                    recipe.steps.append(step)
+
+        tips = data.get("tips")
+        if isinstance(tips, list):
+            recipe.tips = [clean_text(tip) for tip in tips if tip]
+
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS}
+        if extra:
+            recipe.extra = extra
+
+        return recipe
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "title": self.title,
+            "servings": self.servings,
+            "prep_time": self.prep_time,
+            "cook_time": self.cook_time,
+            "difficulty": self.difficulty,
+            "ingredients": [ingredient.to_dict() for ingredient in self.ingredients],
+            "steps": [step.to_dict() for step in self.steps],
+            "tips": list(self.tips),
+        }
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+def validate_recipes(items: List[Any], count: Optional[int] = None) -> Tuple[List[Recipe], List[str]]:
+    """Valide la liste "recipes" renvoyée par le modèle
+
+    Retourne les recettes utilisables et la liste complète des erreurs
+    rencontrées. Si `count` est donné, un nombre différent de recettes
+    utilisables est signalé comme une erreur.
+    """
+    errors: List[str] = []
+    recipes = []
+    for i, item in enumerate(items):
+        recipe = Recipe.from_dict(item, f"recipes[{i}]", errors)
+        if recipe is not None:
+            recipes.append(recipe)
+
+    if count is not None and len(recipes) != count:
+        errors.append(f"Nombre de recettes incorrect: {len(recipes)} au lieu de {count}")
+    return recipes, errors
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (Recipe, Ingredient, Step)):
+        return obj.to_dict()
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> str:
+    """Sérialise en JSON (orjson si disponible)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode("utf-8")
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Sérialise en JSON encodé en UTF-8 (orjson si disponible)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return dumps(obj).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Désérialise du JSON (orjson si disponible)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,147 @@
+"""Normalisation des textes de recettes en une seule passe.
+
+Les remplacements de caractères sont décrits une seule fois dans les tables
+ci-dessous. Les réponses du modèle sont validées et nettoyées champ par champ
+par `Recipe.from_dict` (models.py) ; `clean_recipes` nettoie en un seul
+parcours, piloté par le schéma, des recettes qui restent des dictionnaires,
+comme celles d'un jeu de données importé dans le garde-manger.
+
+`str.translate` et `re.sub` ont été mesurés (benchmarks/bench_normalizer.py) :
+sur du texte français (non ASCII), CPython les exécute caractère par
+caractère et ils sont bien plus lents que `str.replace`, qui parcourt la
+chaîne en mémoire et ne la copie que si le caractère est présent. Les textes ASCII, majoritaires, ne
+peuvent contenir que des retours à la ligne et prennent un chemin court.
+"""
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Retours à la ligne et apostrophes typographiques, sans risque dans du JSON brut
+RAW_REPLACEMENTS = (
+    ("\n", " "),
+    ("\r", " "),
+    ("\u2018", "'"),  # ‘
+    ("\u2019", "'"),  # ’
+)
+
+# Pour les valeurs déjà parsées, les guillemets typographiques peuvent aussi être
+# ramenés à des guillemets droits (dans le JSON brut, cela casserait les chaînes)
+TEXT_REPLACEMENTS = RAW_REPLACEMENTS + (
+    ("\u201c", '"'),  # “
+    ("\u201d", '"'),  # ”
+)
+
+# Schéma d'une recette
+TEXT_FIELDS = ("title", "servings", "prep_time", "cook_time", "difficulty")
+LIST_FIELDS = ("ingredients", "steps", "tips")
+INGREDIENT_FIELDS = ("name", "quantity", "unit")
+
+
+def _replace_all(text: str, replacements) -> str:
+    # str.replace renvoie la chaîne elle-même quand le caractère est absent
+    for old, new in replacements:
+        text = text.replace(old, new)
+    return text
+
+
+@lru_cache(maxsize=8192)
+def _clean_str(text: str) -> str:
+    text = text.strip()
+    if text.isascii():
+        # Seuls les retours à la ligne peuvent être présents
+        return text.replace("\n", " ").replace("\r", " ")
+    return _replace_all(text, TEXT_REPLACEMENTS)
+
+
+def clean_text(value: Any) -> str:
+    """Nettoie une valeur textuelle de recette
+
+    Les résultats sont mémorisés : unités, quantités et noms d'ingrédients se
+    répètent énormément d'une recette à l'autre.
+    """
+    return _clean_str(value if type(value) is str else str(value))
+
+
+def clean_raw_response(text: str) -> str:
+    """Nettoie la réponse brute du modèle avant le parsing JSON"""
+    return _replace_all(text, RAW_REPLACEMENTS)
+
+
+def clean_ingredients(ingredients: Iterable[Any]) -> List[Dict[str, str]]:
+    cleaned = []
+    for ing in ingredients:
+        if isinstance(ing, str):
+            # Jeux de données où l'ingrédient n'est qu'un nom
+            ing = {"name": ing}
+        elif not isinstance(ing, dict):
+            continue
+        cleaned_ing = {}
+        for field in INGREDIENT_FIELDS:
+            value = ing.get(field)
+            if value:
+                cleaned_ing[field] = clean_text(value)
+        if cleaned_ing:
+            cleaned.append(cleaned_ing)
+    return cleaned
+
+
+def clean_steps(steps: Iterable[Any]) -> List[Dict[str, Any]]:
+    cleaned = []
+    for step in steps:
+        if isinstance(step, str):
+            step = {"description": step}
+        if isinstance(step, dict) and step.get("description"):
+            cleaned.append({
+                "step_number": step.get("step_number", len(cleaned) + 1),
+                "description": clean_text(step["description"]),
+            })
+    return cleaned
+
+
+def clean_tips(tips: Iterable[Any]) -> List[str]:
+    return [clean_text(tip) for tip in tips if tip]
+
+
+_LIST_CLEANERS = {
+    "ingredients": clean_ingredients,
+    "steps": clean_steps,
+    "tips": clean_tips,
+}
+
+
+def clean_recipe(recipe: Any) -> Optional[Dict[str, Any]]:
+    """Nettoie une recette en place, retourne None si elle est inutilisable
+
+    Les champs absents sont ajoutés vides ; les autres clés sont conservées.
+    """
+    if not isinstance(recipe, dict):
+        logger.debug(f"Recette ignorée: {recipe!r}")
+        return None
+
+    for field in TEXT_FIELDS:
+        value = recipe.get(field)
+        if field not in recipe:
+            recipe[field] = ""
+        elif value:
+            recipe[field] = clean_text(value)
+
+    for field, cleaner in _LIST_CLEANERS.items():
+        value = recipe.get(field)
+        if field not in recipe:
+            recipe[field] = []
+        elif isinstance(value, list):
+            recipe[field] = cleaner(value)
+
+    return recipe
+
+
+def clean_recipes(recipes: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Nettoie une liste de recettes en ignorant celles qui sont inutilisables"""
+    cleaned = []
+    for recipe in recipes:
+        recipe = clean_recipe(recipe)
+        if recipe is not None:
+            cleaned.append(recipe)
+    return cleaned
@@ -0,0 +1,386 @@
+"""Moteur nutritionnel local.
+
+La table d'ingrédients (data/ingredients.csv, valeurs pour 100 g) est chargée
+une seule fois. Les noms d'ingrédients français sont rapprochés de la table
+(alias, singulier, préfixe, puis correspondance approchée), les champs
+`quantity`/`unit` sont convertis en grammes, et les totaux sont la somme
+des valeurs par gramme pondérées par ces poids. `analyze_many` traite un lot
+de recettes en cumulant les poids par ingrédient avant de les multiplier.
+
+Un préfixe n'est retenu que si les mots qui suivent le précisent (« beurre
+demi-sel », « tomates cerises bio ») : suivi d'un complément (« beurre de
+cacahuète », « crème de marrons »), c'est un autre ingrédient, laissé au
+modèle s'il n'est pas dans la table ou ses alias.
+
+Seuls les ingrédients non résolus nécessitent un appel au modèle.
+"""
+import csv
+import difflib
+import logging
+import operator
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cache import NUMBER_WORDS, strip_accents
+
+logger = logging.getLogger(__name__)
+
+NUTRIENTS = ("calories", "proteins", "carbs", "fat")
+
+DEFAULT_DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingredients.csv")
+
+# Unités converties directement en grammes
+UNIT_GRAMS = {
+    "g": 1.0, "gr": 1.0, "gramme": 1.0, "kg": 1000.0, "kilo": 1000.0, "mg": 0.001,
+    "pincee": 0.5, "poignee": 30.0, "botte": 50.0, "bouquet": 30.0, "boite": 400.0,
+}
+
+# Unités de volume, converties en millilitres puis en grammes via la densité
+UNIT_ML = {
+    "ml": 1.0, "cl": 10.0, "dl": 100.0, "l": 1000.0, "litre": 1000.0,
+    "cuillere a soupe": 15.0, "c a soupe": 15.0, "cas": 15.0, "cs": 15.0, "c a s": 15.0,
+    "cuillere a cafe": 5.0, "c a cafe": 5.0, "cac": 5.0, "cc": 5.0, "c a c": 5.0,
+    "tasse": 250.0, "verre": 200.0, "bol": 350.0,
+}
+
+# Unités comptées à la pièce, avec un poids par défaut si l'ingrédient n'en a pas
+PIECE_UNITS = {
+    "": None, "piece": None, "unite": None, "entier": None, "entiere": None,
+    "gousse": 5.0, "tranche": 30.0, "sachet": 10.0, "feuille": 0.5, "brin": 1.0,
+    "branche": 2.0, "filet": None, "pave": None, "boule": None, "rouleau": None,
+}
+
+# Quantités qui désignent un assaisonnement négligeable
+NEGLIGIBLE_RE = re.compile(r"\b(gout|qs|q s|pm|facultatif|selon)\b")
+
+_FRACTIONS = {"½": "1/2", "¼": "1/4", "¾": "3/4", "⅓": "1/3", "⅔": "2/3"}
+_AMOUNT_RE = re.compile(r"(\d+(?:[.,]\d+)?)(?:\s+(\d+)\s*/\s*(\d+)|\s*/\s*(\d+))?")
+_RANGE_RE = re.compile(r"^(\d+(?:[.,]\d+)?)\s*(?:-|a\b)\s*(\d+(?:[.,]\d+)?)")
+_LEADING_ARTICLE_RE = re.compile(r"^(?:de |d'|du |des |la |le |les |l')")
+# Mots qui introduisent un complément : ce qui suit désigne un autre ingrédient
+_COMPLEMENT_WORDS = {"de", "du", "des", "a", "au", "aux"}
+
+
+def normalize_name(name: str) -> str:
+    """Normalise un nom d'ingrédient pour la recherche dans la table"""
+    text = name.lower().replace("œ", "oe").replace("æ", "ae").replace("’", "'")
+    text = strip_accents(text)
+    text = re.sub(r"\(.*?\)", " ", text)
+    text = re.sub(r"[^a-z0-9' -]", " ", text)
+    text = " ".join(text.split())
+    return _LEADING_ARTICLE_RE.sub("", text)
+
+
+def normalize_unit(unit: str) -> str:
+    text = strip_accents(unit.lower()).replace(".", " ").replace("'", " ")
+    return " ".join(text.split())
+
+
+def _singular(token: str) -> str:
+    if len(token) > 3 and token[-1] in "sx":
+        return token[:-1]
+    return token
+
+
+def singular_words(text: str) -> str:
+    """Met chaque mot au singulier (pommes de terre -> pomme de terre)"""
+    return " ".join(_singular(token) for token in text.split())
+
+
+def _parse_number(text: str) -> Optional[float]:
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    match = _AMOUNT_RE.match(text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    if match.group(2):
+        # Nombre mixte : "1 1/2"
+        value += float(match.group(2)) / float(match.group(3))
+    elif match.group(4):
+        value /= float(match.group(4))
+    return value
+
+
+def parse_amount(quantity: Any, unit: Any = "") -> Tuple[Optional[float], str]:
+    """Convertit les champs quantity/unit en (valeur, unité normalisée)
+
+    La valeur vaut None si la quantité n'est pas interprétable, 0 si elle
+    désigne une quantité négligeable ("au goût", "une pincée"...).
+    """
+    text = str(quantity or "")
+    # Avant la suppression des accents, qui décompose "½" en "1⁄2"
+    for symbol, fraction in _FRACTIONS.items():
+        text = text.replace(symbol, fraction)
+    text = normalize_unit(text)
+    unit_text = normalize_unit(str(unit or ""))
+
+    if not text and not unit_text:
+        return None, ""
+    if NEGLIGIBLE_RE.search(text) or NEGLIGIBLE_RE.search(unit_text):
+        return 0.0, unit_text
+
+    range_match = _RANGE_RE.match(text)
+    if range_match:
+        low, high = _parse_number(range_match.group(1)), _parse_number(range_match.group(2))
+        if low is not None and high is not None:
+            rest = text[range_match.end():].strip()
+            return (low + high) / 2, unit_text or rest
+
+    match = _AMOUNT_RE.match(text)
+    if match:
+        value = _parse_number(text)
+        rest = text[match.end():].strip()
+        return value, unit_text or rest
+
+    # Nombre écrit en lettres, éventuellement suivi de l'unité : "une pincee"
+    first, _, rest = text.partition(" ")
+    if first in NUMBER_WORDS:
+        return float(NUMBER_WORDS[first]), unit_text or rest
+    if not text and unit_text:
+        first, _, rest = unit_text.partition(" ")
+        if first in NUMBER_WORDS:
+            return float(NUMBER_WORDS[first]), rest
+        return 1.0, unit_text
+    return None, unit_text
+
+
+def _lookup_unit(unit: str, table: Dict[str, Any]) -> Tuple[bool, Any]:
+    if unit in table:
+        return True, table[unit]
+    singular = " ".join(_singular(token) for token in unit.split())
+    if singular in table:
+        return True, table[singular]
+    # "cuilleres a soupe rases", "g de" : on ne garde que le début de l'unité
+    for known in sorted(table, key=len, reverse=True):
+        if known and (unit.startswith(known + " ") or singular.startswith(known + " ")):
+            return True, table[known]
+    return False, None
+
+
+class NutritionReport:
+    """Résultat du calcul nutritionnel d'une recette"""
+
+    __slots__ = ("total", "servings", "resolved", "unresolved", "source")
+
+    def __init__(self, total: Dict[str, float], servings: Optional[int],
+                 resolved: List[Dict[str, Any]], unresolved: List[Dict[str, Any]]):
+        self.total = total
+        self.servings = servings
+        self.resolved = resolved
+        self.unresolved = unresolved
+        self.source = "local"
+
+    def add(self, values: Dict[str, Any]) -> None:
+        """Ajoute des valeurs (par exemple estimées par le modèle) au total"""
+        for nutrient in NUTRIENTS:
+            try:
+                self.total[nutrient] += float(values.get(nutrient) or 0)
+            except (TypeError, ValueError):
+                continue
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = {nutrient: round(value, 1) for nutrient, value in self.total.items()}
+        per_serving = None
+        if self.servings:
+            per_serving = {nutrient: round(value / self.servings, 1) for nutrient, value in self.total.items()}
+        return {
+            "total": total,
+            "per_serving": per_serving,
+            "servings": self.servings,
+            "resolved": self.resolved,
+            "unresolved": self.unresolved,
+            "source": self.source,
+        }
+
+
+class NutritionDatabase:
+    """Table d'ingrédients avec recherche approchée"""
+
+    def __init__(self, rows: Sequence[Dict[str, str]]):
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        values, piece_weights, densities = [], [], []
+        for row in rows:
+            position = len(self.names)
+            name = normalize_name(row["name"])
+            self.names.append(name)
+            for alias in [name] + [normalize_name(a) for a in (row.get("aliases") or "").split("|") if a]:
+                self.index.setdefault(alias, position)
+            # Valeurs stockées par gramme
+            values.append([float(row[nutrient] or 0) / 100 for nutrient in NUTRIENTS])
+            piece_weights.append(float(row["piece_g"]) if row.get("piece_g") else None)
+            densities.append(float(row["density"]) if row.get("density") else 1.0)
+
+        self.piece_weights = piece_weights
+        self.densities = densities
+        self.per_gram = values
+        self._keys = list(self.index)
+        self.match = lru_cache(maxsize=4096)(self._match)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_DATABASE_PATH) -> "NutritionDatabase":
+        """Charge la table depuis un fichier CSV"""
+        with open(path, newline="", encoding="utf-8") as f:
+            database = cls(list(csv.DictReader(f)))
+        logger.debug(f"Table nutritionnelle chargée: {len(database.names)} ingrédients")
+        return database
+
+    def vocabulary(self) -> List[str]:
+        """Noms et alias d'ingrédients connus (normalisés)"""
+        return list(self.index)
+
+    def canonical(self, name: str, fuzzy: bool = True) -> str:
+        """Nom de la table pour un ingrédient, à défaut son nom normalisé au singulier
+
+        Sans `fuzzy`, seules les correspondances exactes (nom, alias,
+        singulier) sont essayées, sans préfixe ni correspondance approchée.
+        """
+        key = normalize_name(name)
+        singular = singular_words(key)
+        row = self.index.get(key, self.index.get(singular))
+        if row is None and fuzzy and key:
+            row = self.match(name)
+        return self.names[row] if row is not None else singular
+
+    def _match(self, name: str) -> Optional[int]:
+        """Retourne la ligne de la table correspondant au nom, ou None"""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self.index:
+            return self.index[key]
+
+        tokens = [_singular(token) for token in key.split()]
+        # Du plus long au plus court : "tomates cerises bio" -> "tomate cerise" -> "tomate"
+        for size in range(len(tokens), 0, -1):
+            if size < len(tokens) and _is_complement(tokens[size]):
+                # "beurre de cacahuete" n'est pas du beurre
+                continue
+            candidate = " ".join(tokens[:size])
+            if candidate in self.index:
+                return self.index[candidate]
+        if len(tokens) > 1 and any(_is_complement(token) for token in tokens[1:]):
+            return None
+
+        close = difflib.get_close_matches(key, self._keys, n=1, cutoff=0.85)
+        if close:
+            return self.index[close[0]]
+        return None
+
+    def to_grams(self, row: int, quantity: Any, unit: Any) -> Optional[float]:
+        """Convertit une quantité en grammes pour l'ingrédient de la ligne donnée"""
+        value, unit_name = parse_amount(quantity, unit)
+        if value is None:
+            return None
+        if value == 0:
+            return 0.0
+
+        found, factor = _lookup_unit(unit_name, UNIT_GRAMS)
+        if found:
+            return value * factor
+        found, factor = _lookup_unit(unit_name, UNIT_ML)
+        if found:
+            return value * factor * self.densities[row]
+        found, default_weight = _lookup_unit(unit_name, PIECE_UNITS)
+        if found:
+            weight = self.piece_weights[row] or default_weight
+            return value * weight if weight else None
+        return None
+
+    def _resolve(self, recipe: Any, conversions: Optional[Dict[Tuple[int, str, str], Optional[float]]] = None
+                 ) -> Tuple[List[int], List[float], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Lignes, poids et ingrédients résolus ou non d'une recette
+
+        `conversions` garde les quantités déjà converties, partagées entre
+        les recettes d'un lot.
+        """
+        if hasattr(recipe, "to_dict"):
+            recipe = recipe.to_dict()
+        rows, grams, resolved, unresolved = [], [], [], []
+        for ingredient in recipe.get("ingredients") or []:
+            if isinstance(ingredient, str):
+                ingredient = {"name": ingredient}
+            elif not isinstance(ingredient, dict):
+                continue
+            name = ingredient.get("name") or ""
+            row = self.match(name) if name else None
+            if row is None:
+                unresolved.append(dict(ingredient, reason="ingrédient inconnu"))
+                continue
+            quantity, unit = ingredient.get("quantity"), ingredient.get("unit")
+            if conversions is None:
+                weight = self.to_grams(row, quantity, unit)
+            else:
+                key = (row, str(quantity), str(unit))
+                if key not in conversions:
+                    conversions[key] = self.to_grams(row, quantity, unit)
+                weight = conversions[key]
+            if weight is None:
+                unresolved.append(dict(ingredient, reason="quantité non interprétable"))
+                continue
+            rows.append(row)
+            grams.append(weight)
+            resolved.append({"name": name, "matched": self.names[row], "grams": round(weight, 1)})
+        return rows, grams, resolved, unresolved
+
+    def _totals(self, rows: List[int], grams: List[float]) -> Dict[str, float]:
+        totals = [0.0] * len(NUTRIENTS)
+        for row, weight in zip(rows, grams):
+            for k, per_gram in enumerate(self.per_gram[row]):
+                totals[k] += weight * per_gram
+        return dict(zip(NUTRIENTS, totals))
+
+    def analyze(self, recipe: Any) -> NutritionReport:
+        """Calcule les apports d'une recette (dict ou Recipe)"""
+        rows, grams, resolved, unresolved = self._resolve(recipe)
+        return NutritionReport(self._totals(rows, grams), _servings(recipe), resolved, unresolved)
+
+    def analyze_many(self, recipes: Sequence[Any]) -> List[NutritionReport]:
+        """Calcule les apports d'un lot de recettes
+
+        Une quantité (« 200 g de farine ») n'est convertie qu'une fois pour
+        tout le lot, et les poids d'un même ingrédient sont cumulés par recette
+        avant d'être multipliés par ses valeurs.
+        """
+        conversions: Dict[Tuple[int, str, str], Optional[float]] = {}
+        reports = []
+        for recipe in recipes:
+            rows, grams, resolved, unresolved = self._resolve(recipe, conversions)
+            weights: Dict[int, float] = {}
+            for row, weight in zip(rows, grams):
+                weights[row] = weights.get(row, 0.0) + weight
+            values = [self.per_gram[row] for row in weights]
+            totals = {nutrient: sum(map(operator.mul, weights.values(), [v[k] for v in values]))
+                      for k, nutrient in enumerate(NUTRIENTS)}
+            reports.append(NutritionReport(totals, _servings(recipe), resolved, unresolved))
+        return reports
+
+
+def _is_complement(token: str) -> bool:
+    return token in _COMPLEMENT_WORDS or token.startswith("d'")
+
+
+def _servings(recipe: Any) -> Optional[int]:
+    return parse_servings(recipe.servings if hasattr(recipe, "servings") else recipe.get("servings"))
+
+
+def parse_servings(servings: Any) -> Optional[int]:
+    """Extrait le nombre de personnes ("4", "4 personnes", "quatre")"""
+    value, _ = parse_amount(servings)
+    if value is None or value <= 0:
+        return None
+    return int(round(value))
+
+
+_default_database: Optional[NutritionDatabase] = None
+
+
+def get_nutrition_database() -> NutritionDatabase:
+    """Retourne la table par défaut, chargée au premier appel"""
+    global _default_database
+    if _default_database is None:
+        _default_database = NutritionDatabase.load(os.getenv("RECIPE_NUTRITION_DB", DEFAULT_DATABASE_PATH))
+    return _default_database
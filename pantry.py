@@ -0,0 +1,622 @@
+"""Garde-manger : corpus local de recettes indexé par ingrédient.
+
+Les recettes produites par generate_recipes et les jeux de données importés
+sont ajoutés à un fichier JSON Lines (une recette par ligne, jamais réécrit).
+Chaque recette est réduite à l'ensemble de ses ingrédients normalisés
+(rapprochés de la table nutritionnelle, assaisonnements de base exclus), et
+un index inversé associe à chaque ingrédient la liste triée des recettes qui
+l'utilisent.
+
+Pour « que faire avec X, Y, Z », seules les listes de X, Y et Z sont lues :
+le nombre d'ingrédients disponibles par recette s'obtient en comptant les
+occurrences (collections.Counter), puis les recettes sont
+classées par ingrédients manquants et par couverture.
+
+L'index compacté est écrit dans un fichier binaire (`<corpus>.idx`) chargé
+par mmap : le démarrage ne lit que l'en-tête et le vocabulaire, les listes
+restent sur disque jusqu'à leur première lecture. Les recettes ajoutées
+depuis la dernière compaction, par ce processus ou par un autre, sont lues
+à la fin du corpus et gardées dans un index en mémoire.
+"""
+import argparse
+import array
+import bisect
+import csv
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+from models import dumps_bytes, loads
+from normalizer import clean_recipe
+from nutrition import NutritionDatabase, get_nutrition_database, normalize_name, singular_words
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PANTRY01"
+_HEADER = struct.Struct("<8sI")
+
+# Ingrédients supposés toujours disponibles : ils ne comptent jamais comme manquants
+DEFAULT_STAPLES = ("sel", "poivre", "eau", "huile", "huile d'olive")
+
+# Au-delà de ce nombre de recettes hors index compacté, le chargement réécrit l'index
+COMPACT_THRESHOLD = 1000
+
+# Longueur maximale, en mots, d'un nom d'ingrédient cherché dans un message libre
+_MAX_NGRAM = 4
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def recipe_digest(title: str, terms: Iterable[str]) -> int:
+    """Empreinte d'une recette (titre et ingrédients) pour ignorer les doublons"""
+    text = normalize_name(title) + "|" + ",".join(sorted(terms))
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _ingredient_names(recipe: Dict[str, Any]) -> List[str]:
+    names = []
+    for ingredient in recipe.get("ingredients") or []:
+        name = ingredient.get("name") if isinstance(ingredient, dict) else ingredient
+        if isinstance(name, str) and name.strip():
+            names.append(name)
+    return names
+
+
+class PantryMatch:
+    """Recette du corpus et ingrédients qui manquent pour la réaliser"""
+
+    __slots__ = ("recipe_id", "title", "recipe", "used", "missing", "coverage")
+
+    def __init__(self, recipe_id: int, record: Dict[str, Any], pantry: Set[str]):
+        terms = record["terms"]
+        self.recipe_id = recipe_id
+        self.title = record["title"]
+        self.recipe = record["recipe"]
+        self.used = [term for term in terms if term in pantry]
+        self.missing = [term for term in terms if term not in pantry]
+        self.coverage = len(self.used) / len(terms) if terms else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "coverage": round(self.coverage, 3),
+            "used": self.used,
+            "missing": self.missing,
+        }
+
+
+class PantryIndex:
+    """Corpus de recettes et index inversé ingrédient -> recettes
+
+    Sans chemin, le corpus reste en mémoire et disparaît avec le processus.
+    """
+
+    def __init__(self, path: Optional[str] = None, nutrition: Optional[NutritionDatabase] = None,
+                 staples: Sequence[str] = DEFAULT_STAPLES, min_coverage: float = 0.6,
+                 max_missing: int = 2, limit: int = 5, compact_threshold: int = COMPACT_THRESHOLD):
+        self.path = path
+        self.index_path = f"{path}.idx" if path else None
+        self.nutrition = nutrition
+        self.min_coverage = min_coverage
+        self.max_missing = max_missing
+        self.limit = limit
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._canonical: Dict[str, str] = {}
+        self.staples = {self.canonical(name) for name in staples}
+
+        self.terms: List[str] = []
+        self.vocabulary: Dict[str, int] = {}
+        # Index compacté (mmap) : recettes 0..base_count-1
+        self._mmap: Optional[mmap.mmap] = None
+        self.base_count = 0
+        self._base_terms = 0
+        self._base_offsets: Sequence[int] = ()
+        self._base_digests: Sequence[int] = ()
+        self._base_starts: Sequence[int] = ()
+        self._base_postings: Sequence[int] = ()
+        self._base_sizes: Sequence[int] = ()
+        # Nombre de recettes de l'index compacté ayant au plus n ingrédients
+        self._size_ends: List[int] = []
+        # Recettes ajoutées depuis la compaction
+        self._delta_postings: Dict[int, array.array] = {}
+        self._delta_offsets = array.array("Q")
+        self._delta_digests = array.array("Q")
+        self._delta_sizes = array.array("H")
+        # Corpus en mémoire uniquement (sans chemin)
+        self._records: List[Dict[str, Any]] = []
+        self._seen: Optional[Set[int]] = None
+        self._store_size = 0
+        self._reader = None
+        self._sizes_cache = None
+
+        self.searches = 0
+        self.matched = 0
+        self.added = 0
+        self.duplicates = 0
+        if path:
+            self.load()
+
+    # Normalisation
+
+    def canonical(self, name: str, fuzzy: bool = True) -> str:
+        """Nom d'ingrédient normalisé, celui de la table nutritionnelle s'il y figure
+
+        Sans `fuzzy`, seules les correspondances exactes (alias, singulier)
+        sont essayées : c'est le cas des fragments d'un message libre.
+        """
+        cache_key = name if fuzzy else f"\0{name}"
+        canonical = self._canonical.get(cache_key)
+        if canonical is not None:
+            return canonical
+        if self.nutrition is not None:
+            canonical = self.nutrition.canonical(name, fuzzy)
+        else:
+            canonical = singular_words(normalize_name(name))
+        if len(self._canonical) < 100000:
+            self._canonical[cache_key] = canonical
+        return canonical
+
+    def recipe_terms(self, recipe: Dict[str, Any]) -> List[str]:
+        """Ingrédients normalisés d'une recette, sans doublon ni assaisonnement de base"""
+        terms = (self.canonical(name) for name in _ingredient_names(recipe))
+        return [term for term in dict.fromkeys(terms) if term and term not in self.staples]
+
+    def parse_pantry(self, ingredients: Iterable[str]) -> List[str]:
+        """Ingrédients connus du corpus parmi les noms ou le message fournis
+
+        Un élément qui n'est pas un ingrédient connu est parcouru comme un
+        message libre, du plus long au plus court groupe de mots.
+        """
+        found: Dict[str, None] = {}
+        for item in ingredients:
+            term = self.canonical(item, fuzzy=False)
+            if term in self.vocabulary or term in self.staples:
+                found[term] = None
+                continue
+            terms = self._scan(item)
+            if not terms:
+                # Nom mal orthographié : correspondance approchée sur l'élément entier
+                term = self.canonical(item)
+                terms = [term] if term in self.vocabulary else []
+            found.update(dict.fromkeys(terms))
+        return [term for term in found if term not in self.staples]
+
+    def _scan(self, text: str) -> List[str]:
+        tokens = _TOKEN_RE.findall(normalize_name(text))
+        terms = []
+        position = 0
+        while position < len(tokens):
+            for size in range(min(_MAX_NGRAM, len(tokens) - position), 0, -1):
+                term = self.canonical(" ".join(tokens[position:position + size]), fuzzy=False)
+                if term in self.vocabulary or term in self.staples:
+                    terms.append(term)
+                    position += size
+                    break
+            else:
+                position += 1
+        return terms
+
+    # Chargement et ajout
+
+    def load(self) -> None:
+        """Charge l'index compacté puis les recettes ajoutées au corpus depuis"""
+        with self._lock:
+            if self.index_path and os.path.exists(self.index_path):
+                try:
+                    self._open_index()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Index du garde-manger illisible, reconstruction: {e}")
+                    self._reset()
+            self.refresh()
+            delta = len(self._delta_sizes)
+            logger.info(f"Garde-manger chargé: {self.base_count} recettes indexées, "
+                        f"{delta} ajoutées depuis, {len(self.terms)} ingrédients")
+            if delta >= self.compact_threshold:
+                self.compact()
+
+    def _reset(self) -> None:
+        # Pas de close() : des vues sur l'ancien index peuvent encore exister, le
+        # mmap est libéré avec la dernière d'entre elles
+        self._mmap = None
+        self.terms, self.vocabulary = [], {}
+        self.base_count = self._base_terms = 0
+        self._base_offsets = self._base_digests = self._base_starts = self._base_postings = self._base_sizes = ()
+        self._size_ends = []
+        self._delta_postings = {}
+        self._delta_offsets = array.array("Q")
+        self._delta_digests = array.array("Q")
+        self._delta_sizes = array.array("H")
+        self._seen = None
+        self._store_size = 0
+        self._sizes_cache = None
+
+    def _open_index(self) -> None:
+        with open(self.index_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError("signature inconnue")
+        header = json.loads(mapped[_HEADER.size:_HEADER.size + header_size])
+        store_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if header["byteorder"] != sys.byteorder or header["store_size"] > store_size:
+            mapped.close()
+            raise ValueError("index d'une autre machine ou d'un autre corpus")
+
+        view = memoryview(mapped)
+        offset = header["data_offset"]
+
+        def take(code: str, count: int) -> memoryview:
+            nonlocal offset
+            size = count * struct.calcsize(code)
+            part = view[offset:offset + size].cast(code)
+            offset += size
+            return part
+
+        count, terms = header["recipes"], header["terms"]
+        self._base_offsets = take("Q", count)
+        self._base_digests = take("Q", count)
+        self._base_starts = take("Q", len(terms) + 1)
+        self._base_postings = take("I", header["postings"])
+        self._base_sizes = take("H", count)
+        self._mmap = mapped
+        self.terms = list(terms)
+        self.vocabulary = {term: i for i, term in enumerate(self.terms)}
+        self.base_count = count
+        self._base_terms = len(terms)
+        self._size_ends = header["size_ends"]
+        self._store_size = header["store_size"]
+
+    def refresh(self) -> int:
+        """Indexe les recettes ajoutées à la fin du corpus (par ce processus ou un autre)"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with self._lock:
+            size = os.path.getsize(self.path)
+            if size <= self._store_size:
+                return 0
+            count = 0
+            with open(self.path, "rb") as f:
+                f.seek(self._store_size)
+                offset = self._store_size
+                for line in f:
+                    # Ligne en cours d'écriture par un autre processus : reprise au prochain appel
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = loads(line)
+                        self._index_record(record["terms"], record["digest"], offset)
+                        count += 1
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning(f"Ligne illisible dans le corpus du garde-manger (octet {offset})")
+                    offset += len(line)
+            self._store_size = offset
+            return count
+
+    def _index_record(self, terms: List[str], digest: int, offset: int) -> None:
+        recipe_id = self.base_count + len(self._delta_sizes)
+        for term in terms:
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = self.vocabulary[term] = len(self.terms)
+                self.terms.append(term)
+            postings = self._delta_postings.get(term_id)
+            if postings is None:
+                postings = self._delta_postings[term_id] = array.array("I")
+            postings.append(recipe_id)
+        self._delta_offsets.append(offset)
+        self._delta_digests.append(digest)
+        self._delta_sizes.append(min(len(terms), 65535))
+        self._sizes_cache = None
+        if self._seen is not None:
+            self._seen.add(digest)
+
+    def _digests(self) -> Set[int]:
+        # Construit à la première insertion : la recherche seule n'en a pas besoin
+        if self._seen is None:
+            self._seen = set(self._base_digests)
+            self._seen.update(self._delta_digests)
+        return self._seen
+
+    def add_recipes(self, recipes: Iterable[Dict[str, Any]], source: str = "generated") -> int:
+        """Ajoute des recettes au corpus et à l'index, retourne le nombre de nouvelles"""
+        with self._lock:
+            self.refresh()
+            seen = self._digests()
+            lines, records = [], []
+            for recipe in recipes:
+                if not isinstance(recipe, dict):
+                    continue
+                title = str(recipe.get("title") or recipe.get("name") or "").strip()
+                terms = self.recipe_terms(recipe)
+                if not title or not terms:
+                    continue
+                digest = recipe_digest(title, terms)
+                if digest in seen:
+                    self.duplicates += 1
+                    continue
+                seen.add(digest)
+                record = {"title": title, "terms": terms, "digest": digest, "source": source, "recipe": recipe}
+                if self.path:
+                    lines.append(dumps_bytes(record) + b"\n")
+                else:
+                    records.append(record)
+
+            if lines:
+                # Ajout en une écriture O_APPEND : les autres processus le liront par refresh()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, b"".join(lines))
+                finally:
+                    os.close(fd)
+                added = self.refresh()
+            else:
+                for record in records:
+                    self._index_record(record["terms"], record["digest"], len(self._records))
+                    self._records.append(record)
+                added = len(records)
+            self.added += added
+            return added
+
+    def import_dataset(self, path: str, batch_size: int = 5000) -> int:
+        """Importe un jeu de données de recettes (JSON, JSON Lines ou CSV), nettoyées au passage"""
+        total = 0
+        batch: List[Dict[str, Any]] = []
+        for recipe in iter_dataset(path):
+            recipe = clean_recipe(recipe)
+            if recipe is None:
+                continue
+            batch.append(recipe)
+            if len(batch) >= batch_size:
+                total += self.add_recipes(batch, source="import")
+                batch = []
+        total += self.add_recipes(batch, source="import")
+        return total
+
+    def compact(self) -> None:
+        """Réécrit l'index compacté avec toutes les recettes du corpus"""
+        if not self.index_path:
+            return
+        with self._lock:
+            self.refresh()
+            count = self.base_count + len(self._delta_sizes)
+            all_sizes = array.array("H", self._base_sizes)
+            all_sizes.extend(self._delta_sizes)
+            all_offsets = array.array("Q", self._base_offsets)
+            all_offsets.extend(self._delta_offsets)
+            all_digests = array.array("Q", self._base_digests)
+            all_digests.extend(self._delta_digests)
+
+            # Recettes renumérotées par nombre d'ingrédients croissant : une recherche
+            # ne lit que le début des listes, les recettes trop longues ne pouvant convenir
+            order = sorted(range(count), key=all_sizes.__getitem__)
+            renumbered = array.array("I", bytes(4 * count))
+            for recipe_id, previous in enumerate(order):
+                renumbered[previous] = recipe_id
+            sizes = array.array("H", (all_sizes[i] for i in order))
+            offsets = array.array("Q", (all_offsets[i] for i in order))
+            digests = array.array("Q", (all_digests[i] for i in order))
+            size_ends = [0] * ((sizes[-1] if count else 0) + 1)
+            for size in sizes:
+                size_ends[size] += 1
+            for size in range(1, len(size_ends)):
+                size_ends[size] += size_ends[size - 1]
+
+            starts = array.array("Q", [0])
+            postings = array.array("I")
+            for term_id in range(len(self.terms)):
+                postings.extend(sorted(renumbered[i] for i in self._postings(term_id)))
+                starts.append(len(postings))
+
+            header = {
+                "byteorder": sys.byteorder,
+                "recipes": count,
+                "postings": len(postings),
+                "store_size": self._store_size,
+                "size_ends": size_ends,
+                "terms": self.terms,
+            }
+            header_bytes = dumps_bytes(header)
+            # Données alignées sur 8 octets après l'en-tête
+            data_offset = (_HEADER.size + len(header_bytes) + 40 + 7) // 8 * 8
+            header["data_offset"] = data_offset
+            header_bytes = dumps_bytes(header).ljust(data_offset - _HEADER.size)
+
+            temporary = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, len(header_bytes)))
+                f.write(header_bytes)
+                for values in (offsets, digests, starts, postings, sizes):
+                    values.tofile(f)
+            os.replace(temporary, self.index_path)
+            self._reset()
+            self._open_index()
+            self.refresh()
+            logger.info(f"Index du garde-manger compacté: {count} recettes, {len(self.terms)} ingrédients")
+
+    # Recherche
+
+    def _postings(self, term_id: int, max_size: Optional[int] = None) -> Sequence[int]:
+        """Recettes contenant l'ingrédient, dans l'ordre croissant
+
+        Avec `max_size`, les recettes de l'index compacté ayant plus
+        d'ingrédients sont écartées sans être lues.
+        """
+        delta = self._delta_postings.get(term_id)
+        if term_id >= self._base_terms:
+            return delta if delta is not None else ()
+        start, end = self._base_starts[term_id], self._base_starts[term_id + 1]
+        if max_size is not None and max_size + 1 < len(self._size_ends):
+            end = bisect.bisect_left(self._base_postings, self._size_ends[max_size], start, end)
+        base = self._base_postings[start:end]
+        if delta is None:
+            return base
+        merged = array.array("I", base)
+        merged.extend(delta)
+        return merged
+
+    def _sizes(self) -> array.array:
+        """Nombre d'ingrédients de chaque recette, index compacté et ajouts confondus"""
+        if self._sizes_cache is None:
+            sizes = array.array("H", self._base_sizes)
+            sizes.extend(self._delta_sizes)
+            self._sizes_cache = sizes
+        return self._sizes_cache
+
+    def _ranked(self, term_ids: List[int], limit: int, max_missing: int) -> List[int]:
+        """Recettes classées par ingrédients manquants puis par couverture"""
+        # Au plus max_missing ingrédients manquants : pas plus de len(term_ids) + max_missing en tout
+        lists = [self._postings(term_id, len(term_ids) + max_missing) for term_id in term_ids]
+        sizes = self._sizes()
+        hits = Counter()
+        for postings in lists:
+            hits.update(postings)
+        ranked = []
+        for recipe_id, found in hits.items():
+            missing = sizes[recipe_id] - found
+            if missing <= max_missing:
+                ranked.append((missing, -found / (found + missing), recipe_id))
+        return [recipe_id for _, _, recipe_id in heapq.nsmallest(limit, ranked)]
+
+    def record(self, recipe_id: int) -> Dict[str, Any]:
+        """Recette du corpus, lue dans le fichier à la demande"""
+        if not self.path:
+            return self._records[recipe_id]
+        if recipe_id < self.base_count:
+            offset = self._base_offsets[recipe_id]
+        else:
+            offset = self._delta_offsets[recipe_id - self.base_count]
+        with self._lock:
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(offset)
+            return loads(self._reader.readline())
+
+    def search(self, ingredients: Iterable[str], limit: Optional[int] = None,
+               max_missing: Optional[int] = None) -> List[PantryMatch]:
+        """Recettes réalisables avec les ingrédients disponibles, les plus complètes d'abord"""
+        self.refresh()
+        pantry = self.parse_pantry(ingredients)
+        term_ids = [self.vocabulary[term] for term in pantry]
+        with self._lock:
+            self.searches += 1
+            if not term_ids:
+                return []
+            ranked = self._ranked(term_ids, limit or self.limit,
+                                  self.max_missing if max_missing is None else max_missing)
+            available = set(pantry) | self.staples
+            return [PantryMatch(recipe_id, self.record(recipe_id), available) for recipe_id in ranked]
+
+    def suggest(self, ingredients: List[str]) -> Optional[Dict[str, Any]]:
+        """Réponse d'analyse_ingredients tirée du corpus, ou None si aucune recette ne convient"""
+        matches = [match for match in self.search(ingredients) if match.coverage >= self.min_coverage]
+        if not matches:
+            return None
+        with self._lock:
+            self.matched += 1
+        lines = [f"{len(matches)} recette(s) du garde-manger avec ces ingrédients :"]
+        for match in matches:
+            missing = f" (il manque : {', '.join(match.missing)})" if match.missing else " (rien ne manque)"
+            lines.append(f"- {match.title}{missing}")
+        return {
+            "analysis": "\n".join(lines),
+            "recipes": [match.recipe for match in matches],
+            "matches": [match.to_dict() for match in matches],
+            "source": "local",
+        }
+
+    def __len__(self) -> int:
+        return self.base_count + len(self._delta_sizes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recipes": len(self),
+            "indexed": self.base_count,
+            "pending": len(self._delta_sizes) if self.path else 0,
+            "ingredients": len(self.terms),
+            "added": self.added,
+            "duplicates": self.duplicates,
+            "searches": self.searches,
+            "matched": self.matched,
+        }
+
+
+def iter_dataset(path: str) -> Iterator[Dict[str, Any]]:
+    """Recettes d'un jeu de données
+
+    - `.jsonl` : une recette par ligne ;
+    - `.json` : liste de recettes ou objet {"recipes": [...]} ;
+    - `.csv` : colonnes title (ou name) et ingredients, séparés par | ou ;
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="" if extension == ".csv" else None) as f:
+        if extension == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield loads(line)
+        elif extension == ".json":
+            data = loads(f.read())
+            yield from data.get("recipes", []) if isinstance(data, dict) else data
+        elif extension == ".csv":
+            for row in csv.DictReader(f):
+                names = re.split(r"[|;]", row.get("ingredients") or "")
+                yield {"title": row.get("title") or row.get("name"),
+                       "ingredients": [{"name": name.strip()} for name in names if name.strip()]}
+        else:
+            raise ValueError(f"Format de jeu de données inconnu: {path}")
+
+
+def build_pantry_from_env(nutrition: Optional[NutritionDatabase] = None) -> Optional[PantryIndex]:
+    """Construit le garde-manger à partir des variables RECIPE_PANTRY_*"""
+    backend_name = os.getenv("RECIPE_PANTRY_BACKEND", "memory").lower()
+    if backend_name in ("", "none", "off", "0"):
+        return None
+    if backend_name == "file":
+        path = os.getenv("RECIPE_PANTRY_PATH", "recipe_pantry.jsonl")
+    elif backend_name == "memory":
+        path = None
+    else:
+        raise ValueError(f"Backend de garde-manger inconnu: {backend_name}")
+    staples = os.getenv("RECIPE_PANTRY_STAPLES")
+    return PantryIndex(
+        path,
+        nutrition if nutrition is not None else get_nutrition_database(),
+        staples=[name.strip() for name in staples.split(",") if name.strip()] if staples is not None else DEFAULT_STAPLES,
+        min_coverage=float(os.getenv("RECIPE_PANTRY_MIN_COVERAGE", "0.6")),
+        max_missing=int(os.getenv("RECIPE_PANTRY_MAX_MISSING", "2")),
+        limit=int(os.getenv("RECIPE_PANTRY_RESULTS", "5")),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import et compaction du corpus du garde-manger")
+    parser.add_argument("command", choices=("import", "compact", "search", "stats"))
+    parser.add_argument("arguments", nargs="*", help="fichiers à importer ou ingrédients à chercher")
+    parser.add_argument("--path", default=os.getenv("RECIPE_PANTRY_PATH", "recipe_pantry.jsonl"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    pantry = PantryIndex(args.path, get_nutrition_database(), compact_threshold=sys.maxsize)
+    if args.command == "import":
+        for path in args.arguments:
+            print(f"{path}: {pantry.import_dataset(path)} recettes ajoutées")
+        pantry.compact()
+    elif args.command == "compact":
+        pantry.compact()
+    elif args.command == "search":
+        for match in pantry.search(args.arguments):
+            print(f"{match.coverage:>5.0%}  {match.title}  manque: {', '.join(match.missing) or '-'}")
+    print(json.dumps(pantry.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Prompts et format de sortie de la génération et de la retouche de recettes.
+
+Le prompt système est court et ne dépend pas de la demande : avec la
+définition de l'outil, il forme un préfixe identique d'un appel à l'autre,
+que le fournisseur peut mettre en cache. Tout ce qui varie (nombre de
+recettes, orientation, demande) est placé à la fin, dans le message
+utilisateur.
+
+Deux modes de sortie (RECIPE_OUTPUT_MODE) :
+
+- `json` (défaut) : mode JSON du modèle, qui garantit un JSON valide, avec
+  un exemple minifié du format dans le prompt ; c'est le plus économe en
+  tokens d'entrée (benchmarks/bench_prompts.py) ;
+- `tools` : le modèle est contraint d'appeler la fonction `submit_recipes`,
+  dont le schéma JSON décrit exactement une réponse ; la forme de la réponse
+  est alors imposée, au prix d'une définition d'outil plus longue.
+
+La version du SDK utilisée ne propose pas les sorties structurées strictes
+(`json_schema`) ; l'appel de fonction forcé est l'équivalent disponible.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from models import dumps
+
+RECIPE_SYSTEM_PROMPT = (
+    "Tu es un chef cuisinier expert qui crée des recettes personnalisées. "
+    "Génère exactement le nombre de recettes demandé, toutes différentes et adaptées à la demande. "
+    "Descriptions concises, une étape par élément, sans retour à la ligne. "
+    "Temps en minutes, difficulté Facile, Moyen ou Difficile."
+)
+
+_STRING = {"type": "string"}
+
+RECIPE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "recipes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": _STRING,
+                    "servings": _STRING,
+                    "prep_time": _STRING,
+                    "cook_time": _STRING,
+                    "difficulty": {"type": "string", "enum": ["Facile", "Moyen", "Difficile"]},
+                    "ingredients": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {"name": _STRING, "quantity": _STRING, "unit": _STRING},
+                            "required": ["name", "quantity", "unit"],
+                        },
+                    },
+                    "steps": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {"step_number": {"type": "integer"}, "description": _STRING},
+                            "required": ["step_number", "description"],
+                        },
+                    },
+                    "tips": {"type": "array", "items": _STRING},
+                },
+                "required": ["title", "servings", "prep_time", "cook_time", "difficulty",
+                             "ingredients", "steps", "tips"],
+            },
+        },
+    },
+    "required": ["recipes"],
+}
+
+RECIPE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "submit_recipes",
+        "description": "Enregistre les recettes générées",
+        "parameters": RECIPE_SCHEMA,
+    },
+}
+RECIPE_TOOL_CHOICE = {"type": "function", "function": {"name": "submit_recipes"}}
+
+# Exemple minifié pour le mode JSON, sérialisé une seule fois
+RECIPE_JSON_EXAMPLE = dumps({"recipes": [{
+    "title": "", "servings": "", "prep_time": "", "cook_time": "", "difficulty": "Facile|Moyen|Difficile",
+    "ingredients": [{"name": "", "quantity": "", "unit": ""}],
+    "steps": [{"step_number": 1, "description": ""}],
+    "tips": [""],
+}]})
+RECIPE_JSON_PROMPT = f"{RECIPE_SYSTEM_PROMPT} Réponds uniquement en JSON: {RECIPE_JSON_EXAMPLE}"
+
+OUTPUT_MODES = ("json", "tools")
+
+
+def output_mode_from_env() -> str:
+    """Mode de sortie lu dans RECIPE_OUTPUT_MODE au moment de l'appel (après le chargement du .env)"""
+    mode = os.getenv("RECIPE_OUTPUT_MODE", "json").lower()
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Mode de sortie inconnu: {mode}")
+    return mode
+
+
+def recipe_user_message(prompt: str, count: int, hint: Optional[str] = None,
+                        exclude: Optional[List[str]] = None) -> str:
+    if count == 1:
+        content = f"Génère 1 recette pour: {prompt}"
+    else:
+        content = f"Génère {count} recettes différentes pour: {prompt}"
+    if hint:
+        content += f". Propose {hint}"
+    if exclude:
+        # Complément d'une réponse partielle : pas de doublon des recettes déjà obtenues
+        content += f". Autres que: {', '.join(exclude)}"
+    return content
+
+
+def recipe_request(prompt: str, count: int, hint: Optional[str] = None,
+                   mode: Optional[str] = None, exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Paramètres de l'appel au modèle pour générer des recettes (sauf model et max_tokens)
+
+    Sans `mode`, RECIPE_OUTPUT_MODE est lu à chaque appel.
+    """
+    mode = mode or output_mode_from_env()
+    user_message = recipe_user_message(prompt, count, hint, exclude)
+    if mode == "json":
+        return {
+            "messages": [
+                {"role": "system", "content": RECIPE_JSON_PROMPT},
+                {"role": "user", "content": user_message},
+            ],
+            "response_format": {"type": "json_object"},
+        }
+    return {
+        "messages": [
+            {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_message},
+        ],
+        "tools": [RECIPE_TOOL],
+        "tool_choice": RECIPE_TOOL_CHOICE,
+    }
+
+
+def response_text(message: Any) -> str:
+    """JSON produit par le modèle : arguments de l'appel de fonction, sinon le contenu"""
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        return tool_calls[0].function.arguments
+    return message.content or ""
+
+
+def is_structured(message: Any) -> bool:
+    return bool(getattr(message, "tool_calls", None))
+
+
+def is_truncated(choice: Any) -> bool:
+    """Indique si la réponse a été coupée par la limite de tokens"""
+    return getattr(choice, "finish_reason", None) == "length"
+
+
+# Retouche d'une recette existante : seuls les champs modifiés sont renvoyés
+RECIPE_EDIT_PROMPT = (
+    "Tu modifies une recette existante selon la demande. "
+    "Réponds uniquement avec un objet JSON contenant les champs modifiés de la recette "
+    "(title, servings, prep_time, cook_time, difficulty, ingredients, steps, tips) ; "
+    "une liste modifiée est renvoyée en entier, un champ inchangé est omis."
+)
+
+
+def recipe_edit_request(recipe: Dict[str, Any], instruction: str) -> Dict[str, Any]:
+    """Paramètres de l'appel au modèle pour retoucher une recette (sauf model et max_tokens)"""
+    return {
+        "messages": [
+            {"role": "system", "content": RECIPE_EDIT_PROMPT},
+            {"role": "user", "content": f"Recette: {dumps(recipe)}\nDemande: {instruction}"},
+        ],
+        "response_format": {"type": "json_object"},
+    }
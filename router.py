@@ -0,0 +1,265 @@
+"""Routage local des demandes vers les outils de l'agent.
+
+Deux niveaux :
+
+1. des mots-clés pondérés, compilés en une seule expression régulière
+   (un seul parcours du texte, quelques microsecondes) ;
+2. facultativement, un petit classifieur TF-IDF + modèle linéaire entraîné
+   au démarrage sur des exemples annotés (data/intents.csv), consulté quand
+   les mots-clés sont absents ou peu concluants.
+
+Le routeur extrait aussi des entités (régime, ingrédients connus) pour
+raccourcir les prompts des substitutions et des analyses. Les demandes de
+recettes gardent le message complet : nombre de personnes, cuisine et
+nuances de la demande y sont lus par le modèle.
+"""
+import csv
+import logging
+import math
+import os
+import random
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from cache import strip_accents
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("generate_recipes", "suggest_substitutions", "analyze_ingredients")
+DEFAULT_INTENT = "analyze_ingredients"
+
+DEFAULT_SAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intents.csv")
+
+# (outil, poids, motif) ; les motifs s'appliquent au texte en minuscules sans accents.
+# Les signaux de substitution et d'analyse pèsent plus lourd que ceux de recette :
+# "par quoi remplacer le beurre dans une recette" est une substitution.
+KEYWORD_RULES = (
+    ("suggest_substitutions", 3, r"substitu\w*|rempla[cç]\w*|a la place d|au lieu d|alternatives?|equivalents?|par quoi"),
+    ("suggest_substitutions", 2, r"se passer d|autre option|n'ai (?:pas|plus) d"),
+    ("analyze_ingredients", 3, r"analys\w*|bienfaits?|calori\w*|proteines?|vitamines?|nutri\w*|fibres?|allergenes?"),
+    ("analyze_ingredients", 2, r"sante|sains?|saines?|equilibre|proprietes?|qualites|se marient|associer"
+                               r"|index glycemique|cholesterol|regime|riches? en|source de|que penser|que vaut"),
+    ("analyze_ingredients", 1, r"combien de|contient|gras|est-ce que|est-il|sont-ils|sont-elles"),
+    ("generate_recipes", 2, r"recettes?|cuisin\w*|prepar\w*|menus?|diner|dejeuner|repas|brunch|aperitif|gouter"),
+    ("generate_recipes", 1, r"faire|fais|idees?|plats?|manger|mange|dessert|maison|pour \d+|nous sommes|on est"
+                            r"|on recoit|j'ai (?:des|du|de la|un|une)|il me reste"),
+)
+
+DIETS = {
+    "vegetarien": "végétarien", "vegan": "végan", "vegetalien": "végan",
+    "sans gluten": "sans gluten", "sans lactose": "sans lactose",
+}
+
+_DIET_RE = re.compile(r"\b(" + "|".join(DIETS) + r")(?:ne|e)?s?\b")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Questions sur les apports d'un aliment, auxquelles une liste de recettes ne répond pas
+_NUTRITION_QUESTION_RE = re.compile(
+    r"\b(?:bienfaits?|calori\w*|proteines?|vitamines?|nutri\w*|fibres?|allergenes?|sante|sains?|saines?"
+    r"|index glycemique|cholesterol|riches? en|source de|contient|contiennent|gluten|lactose|gras)\b"
+)
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules, sans accents ni apostrophe typographique"""
+    text = text.lower().replace("’", "'")
+    if text.isascii():
+        return text
+    return strip_accents(text.replace("œ", "oe"))
+
+
+class RouteDecision:
+    """Outil choisi pour une demande, avec la confiance et le niveau qui l'a décidé"""
+
+    __slots__ = ("intent", "confidence", "tier")
+
+    def __init__(self, intent: str, confidence: float, tier: str):
+        self.intent = intent
+        self.confidence = confidence
+        self.tier = tier
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"intent": self.intent, "confidence": round(self.confidence, 3), "tier": self.tier}
+
+
+class KeywordMatcher:
+    """Mots-clés pondérés compilés en une seule alternance de groupes nommés"""
+
+    def __init__(self, rules: Sequence[Tuple[str, int, str]] = KEYWORD_RULES):
+        self._rules = {f"r{i}": (intent, weight) for i, (intent, weight, _) in enumerate(rules)}
+        self._regex = re.compile("|".join(
+            rf"(?P<r{i}>\b(?:{pattern}))" for i, (_, _, pattern) in enumerate(rules)
+        ))
+
+    def scores(self, text: str) -> Dict[str, int]:
+        scores: Dict[str, int] = {}
+        for match in self._regex.finditer(text):
+            intent, weight = self._rules[match.lastgroup]
+            scores[intent] = scores.get(intent, 0) + weight
+        return scores
+
+    def match(self, text: str) -> Optional[RouteDecision]:
+        """Retourne l'outil le mieux noté, ou None si aucun mot-clé n'est trouvé"""
+        scores = self.scores(text)
+        if not scores:
+            return None
+        # À égalité, l'ordre de INTENTS départage (la recette en premier, comme avant)
+        intent = max(INTENTS, key=lambda name: scores.get(name, 0))
+        return RouteDecision(intent, scores[intent] / sum(scores.values()), "keyword")
+
+
+def _features(text: str) -> Dict[str, float]:
+    tokens = [token[:-1] if len(token) > 3 and token[-1] in "sx" else token
+              for token in _TOKEN_RE.findall(text)]
+    counts: Dict[str, float] = defaultdict(float)
+    for token in tokens:
+        counts[token] += 1
+    for first, second in zip(tokens, tokens[1:]):
+        counts[f"{first} {second}"] += 1
+    return counts
+
+
+class TfidfLinearClassifier:
+    """Régression logistique multinomiale sur des vecteurs TF-IDF creux, en Python pur"""
+
+    def __init__(self, epochs: int = 30, learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 0):
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.seed = seed
+        self.labels: List[str] = []
+        self.idf: Dict[str, float] = {}
+        self.weights: Dict[str, Dict[str, float]] = {}
+        self.bias: Dict[str, float] = {}
+
+    def vectorize(self, text: str) -> Dict[str, float]:
+        vector = {}
+        for feature, count in _features(normalize_text(text)).items():
+            idf = self.idf.get(feature)
+            if idf is not None:
+                vector[feature] = (1 + math.log(count)) * idf
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        if norm:
+            for feature in vector:
+                vector[feature] /= norm
+        return vector
+
+    def fit(self, samples: Sequence[Tuple[str, str]]) -> "TfidfLinearClassifier":
+        """Entraîne le modèle sur des couples (texte, outil)"""
+        self.labels = sorted({label for _, label in samples})
+        document_frequency: Dict[str, int] = defaultdict(int)
+        for text, _ in samples:
+            for feature in _features(normalize_text(text)):
+                document_frequency[feature] += 1
+        n = len(samples)
+        self.idf = {feature: math.log((1 + n) / (1 + df)) + 1 for feature, df in document_frequency.items()}
+
+        self.weights = {label: defaultdict(float) for label in self.labels}
+        self.bias = {label: 0.0 for label in self.labels}
+        vectors = [(self.vectorize(text), label) for text, label in samples]
+        rng = random.Random(self.seed)
+        for _ in range(self.epochs):
+            rng.shuffle(vectors)
+            for vector, label in vectors:
+                probabilities = self._probabilities(vector)
+                for candidate in self.labels:
+                    gradient = probabilities[candidate] - (1.0 if candidate == label else 0.0)
+                    weights = self.weights[candidate]
+                    for feature, value in vector.items():
+                        weights[feature] -= self.learning_rate * (gradient * value + self.l2 * weights[feature])
+                    self.bias[candidate] -= self.learning_rate * gradient
+        self.weights = {label: dict(weights) for label, weights in self.weights.items()}
+        return self
+
+    def _probabilities(self, vector: Dict[str, float]) -> Dict[str, float]:
+        scores = {}
+        for label in self.labels:
+            weights = self.weights[label]
+            scores[label] = self.bias[label] + sum(value * weights.get(feature, 0.0) for feature, value in vector.items())
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Retourne l'outil le plus probable et sa probabilité"""
+        probabilities = self._probabilities(self.vectorize(text))
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+
+class IntentRouter:
+    """Choisit l'outil d'une demande et en extrait les entités"""
+
+    def __init__(self, keywords: Optional[KeywordMatcher] = None,
+                 classifier: Optional[TfidfLinearClassifier] = None,
+                 keyword_threshold: float = 0.7, classifier_threshold: float = 0.5,
+                 vocabulary: Optional[Iterable[str]] = None):
+        self.keywords = keywords or KeywordMatcher()
+        self.classifier = classifier
+        self.keyword_threshold = keyword_threshold
+        self.classifier_threshold = classifier_threshold
+        # Noms d'ingrédients connus, normalisés comme le texte des demandes
+        self._ingredient_re = None
+        names = sorted(set(vocabulary or ()), key=len, reverse=True)
+        if names:
+            # Chaque mot peut être au pluriel : "pommes de terre" pour "pomme de terre"
+            patterns = (" ".join(re.escape(word) + "(?:s|x)?" for word in name.split()) for name in names)
+            self._ingredient_re = re.compile(r"\b(" + "|".join(patterns) + r")\b")
+
+    def route(self, user_input: str) -> RouteDecision:
+        text = normalize_text(user_input)
+        decision = self.keywords.match(text)
+        if decision is not None and (decision.confidence >= self.keyword_threshold or self.classifier is None):
+            return decision
+
+        if self.classifier is not None:
+            intent, confidence = self.classifier.predict(text)
+            if confidence >= self.classifier_threshold:
+                return RouteDecision(intent, confidence, "classifier")
+        if decision is not None:
+            return decision
+        return RouteDecision(DEFAULT_INTENT, 0.0, "default")
+
+    def is_nutrition_question(self, user_input: str) -> bool:
+        """Vrai pour une question sur les apports d'un aliment plutôt que sur ce qu'on peut cuisiner"""
+        return _NUTRITION_QUESTION_RE.search(normalize_text(user_input)) is not None
+
+    def extract_entities(self, user_input: str) -> Dict[str, Any]:
+        """Régimes et ingrédients mentionnés"""
+        text = normalize_text(user_input)
+        entities: Dict[str, Any] = {}
+
+        diets = [DIETS[match.group(1)] for match in _DIET_RE.finditer(text)]
+        if diets:
+            entities["diet"] = list(dict.fromkeys(diets))
+
+        if self._ingredient_re is not None:
+            ingredients = [match.group(1) for match in self._ingredient_re.finditer(text)]
+            if ingredients:
+                entities["ingredients"] = list(dict.fromkeys(ingredients))
+        return entities
+
+
+def load_samples(path: str = DEFAULT_SAMPLES_PATH) -> List[Tuple[str, str]]:
+    """Charge les exemples annotés (colonnes text, intent)"""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["text"], row["intent"]) for row in csv.DictReader(f)]
+
+
+def build_router_from_env(vocabulary: Optional[Iterable[str]] = None) -> IntentRouter:
+    """Construit le routeur à partir des variables d'environnement RECIPE_ROUTER_*"""
+    classifier = None
+    if os.getenv("RECIPE_ROUTER_CLASSIFIER", "1").lower() in ("1", "true", "yes"):
+        path = os.getenv("RECIPE_ROUTER_SAMPLES", DEFAULT_SAMPLES_PATH)
+        try:
+            classifier = TfidfLinearClassifier().fit(load_samples(path))
+            logger.debug(f"Classifieur d'intentions entraîné sur {path}")
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Classifieur d'intentions indisponible: {str(e)}")
+    return IntentRouter(
+        classifier=classifier,
+        keyword_threshold=float(os.getenv("RECIPE_ROUTER_KEYWORD_THRESHOLD", "0.7")),
+        classifier_threshold=float(os.getenv("RECIPE_ROUTER_CLASSIFIER_THRESHOLD", "0.5")),
+        vocabulary=vocabulary,
+    )
@@ -0,0 +1,482 @@
+"""Ordonnancement des appels au modèle : quotas par client et priorités.
+
+Tous les appels passent par Transport, qui demande une place à
+`LLMScheduler` avant d'interroger le fournisseur et la rend à la fin de
+l'appel (à la fin du flux pour une réponse en streaming) :
+
+- seau de tokens facultatif par client (clé d'API reconnue, sinon adresse
+  IP), débité du coût estimé
+  de l'appel (moyenne des tokens réellement consommés par l'outil, une
+  génération de recettes coûte environ quatre fois une substitution) puis
+  ajusté avec l'usage réel. Le seau peut passer en négatif : un appel en
+  cours n'est jamais interrompu, mais les requêtes suivantes du client sont
+  refusées (429 avec Retry-After) jusqu'à ce qu'il se soit rechargé. Les
+  réponses servies sans le modèle (cache, garde-manger...) ne coûtent rien ;
+- seau global facultatif, réglé sur la limite de tokens par minute du
+  fournisseur, pour ne pas provoquer ses 429 ;
+- nombre maximal d'appels simultanés, avec deux classes de priorité : les
+  demandes interactives passent avant les lots, qui ne peuvent occuper
+  qu'une part des places. Un lot dont le client a épuisé son quota attend
+  au lieu d'échouer.
+
+Les seaux sont en mémoire ou dans un fichier SQLite partagé entre workers ;
+le nombre de places est propre à chaque processus.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Collection, Dict, FrozenSet, Optional, Tuple
+
+from limiter import Overloaded
+from metrics import QUEUE_DURATION
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+
+# Tokens (prompt + réponse) d'un appel, avant les premières mesures
+DEFAULT_TOOL_COSTS = {
+    "generate_recipes": 2000,
+    "generate_recipe": 800,
+    "complete_recipes": 1200,
+    "stream_recipes": 2000,
+    "edit_recipe": 900,
+    "analyze_ingredients": 700,
+    "suggest_substitutions": 500,
+    "expand_substitutions": 3000,
+    "calculate_nutrition": 500,
+}
+DEFAULT_COST = 1000
+
+GLOBAL_BUCKET = "__global__"
+
+# Client et classe de priorité de la requête en cours
+_client: ContextVar[Optional[str]] = ContextVar("recipe_client", default=None)
+_priority: ContextVar[str] = ContextVar("recipe_priority", default=INTERACTIVE)
+
+
+def parse_client_keys(value: Optional[str]) -> FrozenSet[str]:
+    """Clés d'API reconnues, séparées par des virgules (RECIPE_CLIENT_API_KEYS)"""
+    return frozenset(key.strip() for key in (value or "").split(",") if key.strip())
+
+
+def client_key(api_key: Optional[str], address: Optional[str], known_keys: Collection[str] = ()) -> str:
+    """Identifiant du client : empreinte de sa clé d'API si elle est reconnue, sinon son adresse
+
+    Une clé inconnue est ignorée : sans cela, un client obtiendrait un
+    nouveau quota en envoyant une clé différente à chaque requête.
+    """
+    if api_key and api_key in known_keys:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"ip:{address or 'inconnu'}"
+
+
+@contextmanager
+def request_context(client: Optional[str], priority: str = INTERACTIVE):
+    """Associe les appels au modèle faits dans ce bloc à un client et une priorité"""
+    client_token = _client.set(client)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        _client.reset(client_token)
+
+
+def current_priority() -> str:
+    """Priorité de la requête en cours"""
+    return _priority.get()
+
+
+class RateLimited(Overloaded):
+    """Levée quand le quota du client ou du fournisseur est épuisé"""
+
+    def __init__(self, retry_after: float, message: str = "Limite de débit atteinte, réessayez plus tard"):
+        super().__init__(429, max(1, math.ceil(retry_after)), message)
+
+
+class MemoryBucketStore:
+    """Seaux de tokens en mémoire du processus"""
+
+    def __init__(self, max_buckets: int = 100000):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, key: str, amount: float, rate: float, burst: float) -> float:
+        """Recharge le seau, en retire `amount` (négatif : rend des tokens) et retourne son niveau"""
+        now = time.monotonic()
+        with self._lock:
+            level, updated = self._buckets.pop(key, (burst, now))
+            level = min(burst, min(burst, level + (now - updated) * rate) - amount)
+            self._buckets[key] = (level, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return level
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Seaux de tokens sur disque (SQLite), partagés entre processus"""
+
+    def __init__(self, path: str, idle_expiry: float = 3600.0):
+        self.path = path
+        self.idle_expiry = idle_expiry
+        self._updates = 0
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, level REAL, updated REAL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, key: str, amount: float, rate: float, burst: float) -> float:
+        now = time.time()
+        conn = self._connect()
+        # Lecture et écriture dans la même transaction : pas de débit perdu entre workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT level, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            level, updated = row if row is not None else (burst, now)
+            level = min(burst, min(burst, level + max(0.0, now - updated) * rate) - amount)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)",
+                         (key, level, now))
+            self._updates += 1
+            if self._updates % 1000 == 0:
+                # Un seau inactif depuis longtemps est plein : inutile de le garder
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_expiry,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return level
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class _Waiter:
+    __slots__ = ("priority", "granted", "event", "future", "loop")
+
+    def __init__(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: "asyncio.Future") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class PrioritySlots:
+    """Places d'appel au modèle attribuées par priorité, aux threads comme aux coroutines"""
+
+    def __init__(self, max_concurrent: int = 32, batch_share: float = 0.75):
+        self.max_concurrent = max_concurrent
+        # Les lots laissent toujours des places libres aux demandes interactives
+        self.batch_limit = max(1, min(max_concurrent, int(max_concurrent * batch_share)))
+        self.active = {INTERACTIVE: 0, BATCH: 0}
+        self._queue: list = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _available(self, priority: str) -> bool:
+        if self.active[INTERACTIVE] + self.active[BATCH] >= self.max_concurrent:
+            return False
+        return priority == INTERACTIVE or self.active[BATCH] < self.batch_limit
+
+    def _enqueue(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Prend une place tout de suite si possible, sinon retourne un ticket d'attente"""
+        rank = PRIORITIES[priority]
+        with self._lock:
+            # Pas de resquille : une demande en attente de même priorité passe avant
+            if self._available(priority) and not (self._queue and self._queue[0][0] <= rank):
+                self.active[priority] += 1
+                return None
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._queue, (rank, next(self._sequence), waiter))
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Retire un ticket de la file ; False si la place lui a déjà été attribuée"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+            heapq.heapify(self._queue)
+            return True
+
+    def _grant(self) -> None:
+        # Appelée avec le verrou
+        while self._queue and self._available(self._queue[0][2].priority):
+            waiter = heapq.heappop(self._queue)[2]
+            waiter.granted = True
+            self.active[waiter.priority] += 1
+            waiter.wake()
+
+    def try_acquire(self, priority: str) -> bool:
+        """Prend une place libre sans attendre ni passer devant une demande en file"""
+        with self._lock:
+            if self._queue or not self._available(priority):
+                return False
+            self.active[priority] += 1
+            return True
+
+    def acquire(self, priority: str, timeout: float) -> None:
+        waiter = self._enqueue(priority)
+        if waiter is None or waiter.event.wait(max(0.0, timeout)) or not self._abandon(waiter):
+            return
+        raise Overloaded(503, 1, "Service surchargé, réessayez plus tard")
+
+    async def aacquire(self, priority: str, timeout: float) -> None:
+        waiter = self._enqueue(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, timeout))
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                raise Overloaded(503, 1, "Service surchargé, réessayez plus tard")
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self.release(priority)
+            raise
+
+    def release(self, priority: str) -> None:
+        with self._lock:
+            self.active[priority] -= 1
+            self._grant()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting = {INTERACTIVE: 0, BATCH: 0}
+            for _, _, waiter in self._queue:
+                waiting[waiter.priority] += 1
+            return {
+                "max_concurrent": self.max_concurrent,
+                "batch_limit": self.batch_limit,
+                "active": dict(self.active),
+                "waiting": waiting,
+            }
+
+
+class LLMScheduler:
+    """Quotas de tokens par client et global, et places d'appel par priorité"""
+
+    def __init__(self, store=None, client_tokens_per_minute: float = 0, client_burst: Optional[float] = None,
+                 global_tokens_per_minute: float = 0, global_burst: Optional[float] = None,
+                 slots: Optional[PrioritySlots] = None, batch_reserve: float = 0.2,
+                 queue_timeouts: Optional[Dict[str, float]] = None):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.client_rate = client_tokens_per_minute / 60
+        self.client_burst = client_burst if client_burst is not None else client_tokens_per_minute
+        self.global_rate = global_tokens_per_minute / 60
+        self.global_burst = global_burst if global_burst is not None else global_tokens_per_minute
+        # Part du seau global que les lots laissent aux demandes interactives
+        self.batch_floor = self.global_burst * batch_reserve
+        self.slots = slots if slots is not None else PrioritySlots()
+        self.queue_timeouts = dict({INTERACTIVE: 10.0, BATCH: 600.0}, **(queue_timeouts or {}))
+        self._estimates: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = {INTERACTIVE: 0, BATCH: 0}
+
+    def estimate(self, tool: str) -> float:
+        """Tokens attendus pour un appel de l'outil"""
+        return self._estimates.get(tool) or DEFAULT_TOOL_COSTS.get(tool, DEFAULT_COST)
+
+    def _level(self, key: str, amount: float = 0.0) -> float:
+        if key == GLOBAL_BUCKET:
+            return self.store.update(key, amount, self.global_rate, self.global_burst)
+        return self.store.update(key, amount, self.client_rate, self.client_burst)
+
+    async def _offload(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Appelle fn dans un thread quand les seaux sont sur disque, pour ne pas bloquer la boucle"""
+        if isinstance(self.store, SQLiteBucketStore):
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def admit(self, client: Optional[str]) -> None:
+        """Refuse la requête (RateLimited) si le client a épuisé son quota"""
+        if self.client_rate and client is not None:
+            level = self._level(client)
+            if level < 0:
+                with self._lock:
+                    self.rejected += 1
+                raise RateLimited(-level / self.client_rate)
+        with self._lock:
+            self.admitted += 1
+
+    async def aadmit(self, client: Optional[str]) -> None:
+        """Version coroutine de admit"""
+        await self._offload(self.admit, client)
+
+    def _try_charge(self, cost: float, client: Optional[str], priority: str) -> float:
+        """Débite les seaux, ou retourne le temps à attendre avant de pouvoir le faire"""
+        if priority == BATCH and self.client_rate and client is not None:
+            level = self._level(client)
+            if level < 0:
+                return -level / self.client_rate
+        if self.global_rate:
+            floor = self.batch_floor if priority == BATCH else 0.0
+            level = self._level(GLOBAL_BUCKET)
+            if level < floor:
+                return (floor - level) / self.global_rate
+            self._level(GLOBAL_BUCKET, cost)
+        if self.client_rate and client is not None:
+            self._level(client, cost)
+        return 0.0
+
+    def _throttle(self, priority: str, wait: float, deadline: float) -> float:
+        if time.monotonic() + wait > deadline:
+            with self._lock:
+                self.rejected += 1
+            raise RateLimited(wait)
+        with self._lock:
+            self.throttled[priority] += 1
+        # Attente par paliers : le seau peut se recharger plus tôt (ajustement à l'usage réel)
+        return min(wait, 1.0)
+
+    def _refund(self, cost: float, client: Optional[str]) -> None:
+        """Rend aux seaux le coût d'un appel qui n'a pas eu lieu"""
+        if self.global_rate:
+            self._level(GLOBAL_BUCKET, -cost)
+        if self.client_rate and client is not None:
+            self._level(client, -cost)
+
+    def acquire(self, tool: str) -> Tuple[float, str]:
+        """Attend le quota et une place pour un appel de l'outil
+
+        Retourne le coût estimé de l'appel et la priorité de la place, à rendre
+        avec release. Si la place n'est pas obtenue, le coût est remboursé.
+        """
+        client, priority = _client.get(), _priority.get()
+        cost = self.estimate(tool)
+        start = time.monotonic()
+        deadline = start + self.queue_timeouts[priority]
+        while True:
+            wait = self._try_charge(cost, client, priority)
+            if not wait:
+                break
+            time.sleep(self._throttle(priority, wait, deadline))
+        try:
+            self.slots.acquire(priority, deadline - time.monotonic())
+        except BaseException:
+            self._refund(cost, client)
+            raise
+        QUEUE_DURATION.observe(time.monotonic() - start, priority=priority)
+        return cost, priority
+
+    async def aacquire(self, tool: str) -> Tuple[float, str]:
+        """Version coroutine de acquire"""
+        client, priority = _client.get(), _priority.get()
+        cost = self.estimate(tool)
+        start = time.monotonic()
+        deadline = start + self.queue_timeouts[priority]
+        while True:
+            wait = await self._offload(self._try_charge, cost, client, priority)
+            if not wait:
+                break
+            await asyncio.sleep(self._throttle(priority, wait, deadline))
+        try:
+            await self.slots.aacquire(priority, deadline - time.monotonic())
+        except BaseException:
+            self._refund(cost, client)
+            raise
+        QUEUE_DURATION.observe(time.monotonic() - start, priority=priority)
+        return cost, priority
+
+    def release(self, priority: str) -> None:
+        """Rend la place obtenue par acquire"""
+        self.slots.release(priority)
+
+    def settle(self, tool: str, estimated: float, usage: Any) -> None:
+        """Ajuste les seaux et l'estimation de l'outil d'après les tokens consommés"""
+        if usage is None:
+            return
+        actual = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        with self._lock:
+            previous = self._estimates.get(tool)
+            # Moyenne mobile : suit les changements de prompt sans réagir à un appel isolé
+            self._estimates[tool] = actual if previous is None else 0.9 * previous + 0.1 * actual
+        difference = actual - estimated
+        if not difference:
+            return
+        if self.global_rate:
+            self._level(GLOBAL_BUCKET, difference)
+        client = _client.get()
+        if self.client_rate and client is not None:
+            self._level(client, difference)
+
+    async def asettle(self, tool: str, estimated: float, usage: Any) -> None:
+        """Version coroutine de settle"""
+        await self._offload(self.settle, tool, estimated, usage)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            estimates = {tool: round(cost) for tool, cost in self._estimates.items()}
+            return {
+                "client_tokens_per_minute": round(self.client_rate * 60),
+                "global_tokens_per_minute": round(self.global_rate * 60),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "throttled": dict(self.throttled),
+                "estimates": estimates,
+                "slots": self.slots.stats(),
+                "shared_store": isinstance(self.store, SQLiteBucketStore),
+            }
+
+
+def build_scheduler_from_env() -> Optional[LLMScheduler]:
+    """Construit l'ordonnanceur à partir des variables RECIPE_SCHEDULER_* et RECIPE_LLM_*"""
+    if os.getenv("RECIPE_SCHEDULER", "1").lower() in ("0", "false", "no"):
+        return None
+    path = os.getenv("RECIPE_SCHEDULER_STORE")
+    store = SQLiteBucketStore(path) if path else MemoryBucketStore()
+    client_burst = os.getenv("RECIPE_CLIENT_BURST")
+    global_burst = os.getenv("RECIPE_LLM_BURST")
+    return LLMScheduler(
+        store,
+        client_tokens_per_minute=float(os.getenv("RECIPE_CLIENT_TOKENS_PER_MINUTE", "0")),
+        client_burst=float(client_burst) if client_burst else None,
+        global_tokens_per_minute=float(os.getenv("RECIPE_LLM_TOKENS_PER_MINUTE", "0")),
+        global_burst=float(global_burst) if global_burst else None,
+        slots=PrioritySlots(
+            max_concurrent=int(os.getenv("RECIPE_LLM_MAX_CONCURRENCY", "32")),
+            batch_share=float(os.getenv("RECIPE_LLM_BATCH_SHARE", "0.75")),
+        ),
+        queue_timeouts={
+            INTERACTIVE: float(os.getenv("RECIPE_LLM_QUEUE_TIMEOUT", "10")),
+            BATCH: float(os.getenv("RECIPE_BATCH_QUEUE_TIMEOUT", "600")),
+        },
+    )
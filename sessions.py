@@ -0,0 +1,256 @@
+"""Sessions de conversation et retouches de recettes.
+
+Chaque session garde la dernière série de recettes générées. Une demande de
+suite qui désigne l'une d'elles (« version végétarienne de la recette 2 »,
+« rends la première recette plus légère ») n'entraîne pas une nouvelle génération
+complète : seule la recette visée et la modification demandée sont envoyées
+au modèle, qui renvoie les champs modifiés sous forme de patch JSON
+(RFC 7396) appliqué à la recette enregistrée.
+
+Deux stockages, sur le modèle du cache de réponses : en mémoire (LRU avec
+durée de vie) ou SQLite, partagé entre processus.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import strip_accents
+from models import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Identifiant de session fourni par le client
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+ORDINALS = {
+    "premiere": 1, "premier": 1, "deuxieme": 2, "seconde": 2, "second": 2,
+    "troisieme": 3, "quatrieme": 4, "cinquieme": 5, "sixieme": 6,
+    "septieme": 7, "huitieme": 8, "neuvieme": 9, "dixieme": 10,
+    "derniere": -1, "dernier": -1,
+}
+_ORDINAL = "|".join(ORDINALS)
+
+# Déterminant qui fait de « recette 2 » ou « deuxième recette » une recette déjà proposée
+_DEFINITE = r"(?:la|ta|ma|cette)"
+# « la recette 2 », « la recette n°2 », « la 2e recette », « la deuxième recette », « la dernière recette »
+_REFERENCE_RE = re.compile(
+    rf"\b{_DEFINITE}\s+recette\s*(?:n\s*[o°]?\s*|numero\s*)?(?P<number>\d{{1,2}})\b"
+    rf"|\b{_DEFINITE}\s+(?P<rank>\d{{1,2}})\s*(?:e|eme|ere|re)\s+recette\b"
+    rf"|\b{_DEFINITE}\s+(?P<ordinal>{_ORDINAL})\s+recette\b"
+)
+# Désigne la recette quand la session n'en contient qu'une
+_SINGLE_REFERENCE_RE = re.compile(rf"\b{_DEFINITE} recette\b|\brends-la\b|\bla rendre\b")
+# Verbes de retouche : sans eux, la demande est une nouvelle génération
+_EDIT_RE = re.compile(
+    r"\b(?:version|rend|rends|rendre|modifi\w*|change\w*|remplac\w*|adapt\w*|transform\w*|"
+    r"ajout\w*|enlev\w*|retir\w*|retouch\w*|double\w*|divis\w*)\b"
+)
+
+
+def find_recipe_reference(message: str, count: int) -> Optional[int]:
+    """Indice (à partir de 0) de la recette à retoucher, ou None pour une nouvelle demande
+
+    Il faut à la fois un verbe de retouche et une désignation sans ambiguïté
+    (« la recette 2 », « la deuxième recette ») : « une deuxième recette plus
+    épicée » ou « la première était trop salée » sont de nouvelles demandes.
+    """
+    if count <= 0:
+        return None
+    text = strip_accents(message.lower())
+    if not _EDIT_RE.search(text):
+        return None
+    match = _REFERENCE_RE.search(text)
+    if match is None:
+        if count == 1 and _SINGLE_REFERENCE_RE.search(text):
+            return 0
+        return None
+    if match.group("ordinal"):
+        position = ORDINALS[match.group("ordinal")]
+    else:
+        position = int(match.group("number") or match.group("rank"))
+    if position == -1:
+        return count - 1
+    if 1 <= position <= count:
+        return position - 1
+    return None
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """Applique un patch JSON Merge Patch (RFC 7396) : null supprime, les listes sont remplacées"""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class MemorySessionStore:
+    """Sessions en mémoire du processus, avec éviction LRU et durée de vie"""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if self.ttl > 0 and time.time() - entry[1] > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+        return loads(entry[0])
+
+    def set(self, session_id: str, data: Dict[str, Any]) -> None:
+        value = dumps(data)
+        with self._lock:
+            self._sessions[session_id] = (value, time.time())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Sessions sur disque (SQLite) partagées entre processus, avec éviction LRU et durée de vie"""
+
+    def __init__(self, path: str, max_sessions: int = 100000, ttl: float = 3600):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT data, updated FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl > 0 and time.time() - row[1] > self.ttl:
+            self.delete(session_id)
+            return None
+        return loads(row[0])
+
+    def set(self, session_id: str, data: Dict[str, Any]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+                (session_id, dumps(data), time.time()),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            excess = count - self.max_sessions
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM sessions WHERE id IN "
+                    "(SELECT id FROM sessions ORDER BY updated ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    def delete(self, session_id: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionManager:
+    """Recettes de chaque session et compteurs de retouches"""
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else MemorySessionStore()
+        self._lock = threading.Lock()
+        self.edits = 0
+        self.generations = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def recipes(self, session_id: str) -> List[Dict[str, Any]]:
+        data = self.store.get(session_id)
+        return data["recipes"] if data else []
+
+    def remember(self, session_id: str, prompt: str, recipes: List[Dict[str, Any]]) -> None:
+        """Enregistre une nouvelle série de recettes pour la session"""
+        self.store.set(session_id, {"prompt": prompt, "recipes": recipes})
+        self._count("generations")
+
+    def replace(self, session_id: str, index: int, recipe: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Remplace une recette retouchée et retourne la série à jour"""
+        data = self.store.get(session_id) or {"prompt": "", "recipes": []}
+        recipes = data["recipes"]
+        if index < len(recipes):
+            recipes[index] = recipe
+        else:
+            recipes.append(recipe)
+        self.store.set(session_id, data)
+        self._count("edits")
+        return recipes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.store),
+            "evictions": self.store.evictions,
+            "generations": self.generations,
+            "edits": self.edits,
+        }
+
+
+def build_sessions_from_env() -> Optional[SessionManager]:
+    """Construit le stockage des sessions à partir des variables RECIPE_SESSION_*"""
+    backend_name = os.getenv("RECIPE_SESSION_BACKEND", "memory").lower()
+    if backend_name in ("", "none", "off", "0"):
+        return None
+    ttl = float(os.getenv("RECIPE_SESSION_TTL", "3600"))
+    if backend_name == "sqlite":
+        path = os.getenv("RECIPE_SESSION_PATH", "recipe_sessions.sqlite3")
+        store = SQLiteSessionStore(path, int(os.getenv("RECIPE_SESSION_MAX", "100000")), ttl)
+    elif backend_name == "memory":
+        store = MemorySessionStore(int(os.getenv("RECIPE_SESSION_MAX", "10000")), ttl)
+    else:
+        raise ValueError(f"Backend de sessions inconnu: {backend_name}")
+    return SessionManager(store)
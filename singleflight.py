@@ -0,0 +1,218 @@
+"""Regroupement des appels identiques simultanés (single-flight).
+
+Quand plusieurs requêtes identiques (après normalisation du prompt) arrivent
+en même temps, seule la première appelle le modèle ; les autres attendent
+son résultat au lieu de lancer chacune leur propre appel. Les appelants
+fournissent la clé : l'application y inclut la priorité de la demande, pour
+ne pas faire attendre une demande interactive derrière un lot.
+
+Entre processus (plusieurs workers gunicorn/uvicorn), un magasin de verrous
+SQLite facultatif désigne un seul processus meneur par clé. Les autres
+attendent la libération du verrou puis relancent le calcul, qui est alors
+servi par le cache partagé : ce mode suppose donc un cache SQLite commun.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _LeaderCancelled(Exception):
+    """Remise aux appelants en attente quand le meneur est annulé"""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SQLiteFlightStore:
+    """Verrous par clé partagés entre processus, avec bail d'expiration"""
+
+    def __init__(self, path: str, lease: float = 60.0, poll_interval: float = 0.05):
+        self.path = path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}"
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS flights (key TEXT PRIMARY KEY, owner TEXT, expires REAL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, key: str) -> bool:
+        """Prend le verrou de la clé s'il est libre ou expiré"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM flights WHERE key = ? AND expires < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO flights (key, owner, expires) VALUES (?, ?, ?)",
+            (key, self.owner, now + self.lease),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key: str) -> None:
+        self._connect().execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, self.owner))
+
+
+class SingleFlight:
+    """Partage un calcul en cours entre les appelants d'une même clé"""
+
+    def __init__(self, store: Optional[SQLiteFlightStore] = None, wait_timeout: float = 60.0):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_waits = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Exécute fn une seule fois pour tous les appelants simultanés de la clé"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_exclusive(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run_exclusive(self, key: str, fn: Callable[[], Any]) -> Any:
+        if self.store is None:
+            return fn()
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while not self.store.try_acquire(key):
+            # Un autre processus calcule déjà cette réponse : on attend qu'il ait fini,
+            # le calcul sera alors servi par le cache partagé
+            if not waited:
+                waited = True
+                self._count("remote_waits")
+            if time.monotonic() >= deadline:
+                logger.warning(f"Attente du verrou {key} trop longue, calcul local")
+                return fn()
+            time.sleep(self.store.poll_interval)
+        try:
+            return fn()
+        finally:
+            self.store.release(key)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Version coroutine de do, pour les appelants d'une même boucle d'événements
+
+        Si le meneur est annulé, l'un des appelants en attente reprend le
+        calcul et les autres se regroupent derrière lui.
+        """
+        while True:
+            future = self._async_calls.get(key)
+            if future is None:
+                break
+            self._count("coalesced")
+            try:
+                # shield : l'annulation d'un appelant n'annule pas le calcul partagé
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        self._count("leaders")
+        try:
+            result = await self._arun_exclusive(key, fn)
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Évite l'avertissement "exception never retrieved" quand personne n'attendait
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[key]
+
+    async def _arun_exclusive(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.store is None:
+            return await fn()
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        # Les appels au magasin SQLite sont bloquants : hors de la boucle d'événements
+        while not await asyncio.to_thread(self.store.try_acquire, key):
+            if not waited:
+                waited = True
+                self._count("remote_waits")
+            if time.monotonic() >= deadline:
+                logger.warning(f"Attente du verrou {key} trop longue, calcul local")
+                return await fn()
+            await asyncio.sleep(self.store.poll_interval)
+        try:
+            return await fn()
+        finally:
+            await asyncio.to_thread(self.store.release, key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Nombre d'appels menés, regroupés et en attente d'un autre processus"""
+        total = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "remote_waits": self.remote_waits,
+            "in_flight": len(self._calls) + len(self._async_calls),
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+            "shared_store": self.store is not None,
+        }
+
+
+def build_single_flight_from_env() -> Optional[SingleFlight]:
+    """Construit le regroupement d'appels à partir des variables RECIPE_SINGLE_FLIGHT*"""
+    if os.getenv("RECIPE_SINGLE_FLIGHT", "1").lower() in ("0", "false", "no"):
+        return None
+    store = None
+    path = os.getenv("RECIPE_SINGLE_FLIGHT_STORE")
+    if path:
+        store = SQLiteFlightStore(path, lease=float(os.getenv("RECIPE_SINGLE_FLIGHT_LEASE", "60")))
+    return SingleFlight(store, wait_timeout=float(os.getenv("RECIPE_SINGLE_FLIGHT_WAIT", "60")))
@@ -0,0 +1,195 @@
+"""Analyse incrémentale du JSON de recettes reçu en streaming.
+
+Le modèle renvoie un objet de la forme {"recipes": [{...}, {...}, {...}]}.
+Le parseur consomme les fragments au fur et à mesure de leur arrivée et
+restitue chaque recette dès que son objet JSON est complet, sans attendre la
+fin de la réponse.
+
+Le même parseur récupère les recettes complètes d'une réponse tronquée
+(limite de tokens atteinte) ou légèrement mal formée : texte autour, virgule
+en trop, caractère parasite entre deux recettes, retour à la ligne brut dans
+une chaîne.
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from models import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalRecipeParser:
+    """Extrait les éléments du tableau "recipes" au fil des fragments reçus"""
+
+    def __init__(self, array_key: str = "recipes"):
+        self.array_key = array_key
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start = -1
+        self.count = 0
+
+    @property
+    def in_array(self) -> bool:
+        """Indique si le parseur se trouve dans le tableau des recettes"""
+        return self._array_depth is not None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Ajoute un fragment et retourne les éléments complétés par ce fragment"""
+        self.buffer += chunk
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._item_start < 0:
+                        self._last_string = buffer[self._string_start + 1:i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":":
+                if len(self._stack) == 1:
+                    self._current_key = self._last_string
+            elif char in "{[":
+                self._stack.append(char)
+                depth = len(self._stack)
+                if char == "[" and depth == 2 and self._current_key == self.array_key:
+                    self._array_depth = depth
+                elif char == "{" and self._array_depth is not None and depth == self._array_depth + 1:
+                    self._item_start = i
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                depth = len(self._stack)
+                if char == "}" and self._array_depth is not None and depth == self._array_depth and self._item_start >= 0:
+                    item = self._decode(buffer[self._item_start:i + 1])
+                    self._item_start = -1
+                    if item is not None:
+                        self.count += 1
+                        completed.append(item)
+                elif char == "]" and self._array_depth is not None and depth == self._array_depth - 1:
+                    self._array_depth = None
+
+        self._pos = len(buffer)
+        return completed
+
+    def _decode(self, fragment: str) -> Optional[Any]:
+        try:
+            return loads(fragment)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return loads(repair_json(fragment))
+        except json.JSONDecodeError as e:
+            logger.error(f"Élément JSON invalide ignoré: {e.msg}")
+            return None
+
+
+def repair_json(text: str) -> str:
+    """Corrige les défauts courants d'un objet JSON produit par le modèle
+
+    Hors des chaînes, les virgules placées juste avant `}` ou `]` sont
+    supprimées ; dans les chaînes, les caractères de contrôle bruts (retours à
+    la ligne, tabulations) deviennent des espaces.
+    """
+    out: List[str] = []
+    in_string = False
+    escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char < " ":
+                char = " "
+        elif char == '"':
+            in_string = True
+        elif char in "}]":
+            # Retire la virgule en trop, espaces compris
+            end = len(out)
+            while end and out[end - 1].isspace():
+                end -= 1
+            if end and out[end - 1] == ",":
+                del out[end - 1]
+        out.append(char)
+    return "".join(out)
+
+
+def salvage_recipes(text: str, array_key: str = "recipes") -> List[Any]:
+    """Éléments complets du tableau des recettes d'une réponse tronquée ou mal formée
+
+    Le texte qui précède le premier objet JSON est ignoré ; un élément
+    inachevé ou irréparable est écarté, les suivants sont conservés.
+    """
+    start = text.find("{")
+    if start < 0:
+        return []
+    return IncrementalRecipeParser(array_key).feed(text[start:])
+
+
+def _delta_text(delta: Any) -> Optional[str]:
+    # Avec un appel de fonction forcé, le JSON arrive dans les arguments de l'outil
+    if delta.tool_calls:
+        function = delta.tool_calls[0].function
+        return function.arguments if function is not None else None
+    return delta.content
+
+
+def iter_stream_content(stream) -> Iterator[str]:
+    """Itère sur les fragments de texte d'une réponse OpenAI en streaming
+
+    Le flux est fermé dès que l'itération s'arrête, y compris quand le client
+    HTTP se déconnecte : la connexion et la place de l'ordonnanceur sont rendues.
+    """
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = _delta_text(chunk.choices[0].delta)
+            if content:
+                yield content
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+async def aiter_stream_content(stream) -> AsyncIterator[str]:
+    """Version asynchrone de iter_stream_content"""
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = _delta_text(chunk.choices[0].delta)
+            if content:
+                yield content
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Formate un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
@@ -0,0 +1,443 @@
+"""Graphe local de substitutions d'ingrédients.
+
+`data/substitutions.csv` décrit une substitution par ligne : ingrédient,
+remplaçant, proportion (et unité si elle change), contextes où elle convient
+(pâtisserie, sauce, cuisson, cru) et régimes qu'elle respecte. Le fichier est
+chargé une seule fois ; une question courante (« par quoi remplacer le beurre
+dans un gâteau vegan ») se résout alors par un accès de dictionnaire.
+
+Les noms sont rapprochés comme pour la table nutritionnelle (accents,
+pluriels, alias), puis par correspondance approchée sur les ingrédients du
+graphe, puis par préfixe de la table : « beurre demi-sel » est du beurre,
+mais un nom composé (« beurre de cacahuète », « crème de marrons ») n'est
+pas rapproché de son premier mot. Seuls les ingrédients absents sont demandés au modèle : sa réponse
+structurée est ajoutée au graphe et, si `RECIPE_SUBSTITUTIONS_LEARNED` est
+défini, à un fichier JSON Lines relu au démarrage.
+
+`python -m substitutions expand` complète le graphe hors ligne, par lots
+d'ingrédients envoyés au modèle, puis réécrit le fichier CSV.
+"""
+import argparse
+import csv
+import difflib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from cache import strip_accents
+from models import dumps, loads
+from nutrition import NutritionDatabase, get_nutrition_database, normalize_name, singular_words
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRAPH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "substitutions.csv")
+
+CONTEXTS = ("patisserie", "sauce", "cuisson", "cru")
+CONTEXT_LABELS = {"patisserie": "pâtisserie", "sauce": "sauce", "cuisson": "cuisson", "cru": "cru"}
+TAGS = ("vegan", "vegetarien", "sans lactose", "sans gluten", "sans oeuf", "sans alcool", "allege")
+# Un remplaçant végan convient aussi à ces régimes
+_IMPLIED_TAGS = {"vegan": ("vegetarien", "sans lactose", "sans oeuf")}
+
+# Contexte d'utilisation déduit de la demande
+_CONTEXT_RE = (
+    ("patisserie", re.compile(r"\b(?:gateaux?|cakes?|patisseries?|biscuits?|cookies?|muffins?|crepes?|brioches?"
+                              r"|desserts?|madeleines?|brownies?|pate a \w+|cuisson au four)\b")),
+    ("sauce", re.compile(r"\b(?:sauces?|vinaigrettes?|bechamel|mayonnaise|soupes?|veloutes?|currys?|gratins?)\b")),
+    ("cru", re.compile(r"\b(?:crus?|crues?|salades?|tartares?|smoothies?|sans cuisson)\b")),
+    ("cuisson", re.compile(r"\b(?:poele|poeler|sauter|saute|frire|friture|griller|rotir|revenir|mijoter)\b")),
+)
+
+# Ingrédient nommé après « remplacer », « substitut de »... quand le routeur ne le connaît pas
+_INGREDIENT_RE = re.compile(
+    r"(?:rempla\w*|substitu\w*|alternatives?|[eé]quivalents?|la place|au lieu|se passer|n'ai (?:pas|plus))"
+    r"\s+(?:(?:aux|au|pour|des|du|de|[aà])\s+|d')?(?:(?:les|la|le|une|un|du|des|de la)\s+|l'|d')?"
+    r"(?P<name>[a-zà-ÿœ][a-zà-ÿœ' -]*?)\s*(?:\b(?:dans|en|pour|par|sans|avec|et|ou)\b|[,?.!;:]|$)"
+)
+
+SUBSTITUTION_PROMPT = (
+    "Tu es un expert culinaire. Pour chaque ingrédient donné, propose de 3 à 6 substitutions "
+    "courantes, dont une végane si possible. Réponds uniquement en JSON : "
+    '{"substitutions": {"<ingrédient>": [{"substitute": "...", "ratio": 1, "unit": "", '
+    '"contexts": ["patisserie", "sauce", "cuisson", "cru"], "tags": ["vegan", "vegetarien", '
+    '"sans lactose", "sans gluten", "sans oeuf", "sans alcool", "allege"], "note": "..."}]}}. '
+    "ratio : quantité de remplaçant pour une unité de l'ingrédient (dans l'unité `unit` si elle "
+    "diffère, sinon la même) ; contexts et tags : uniquement les valeurs listées qui s'appliquent ; "
+    "note : conseil d'utilisation en une phrase."
+)
+
+
+def detect_context(text: str) -> Optional[str]:
+    """Contexte culinaire mentionné dans la demande, ou None"""
+    normalized = strip_accents(text.lower())
+    for context, pattern in _CONTEXT_RE:
+        if pattern.search(normalized):
+            return context
+    return None
+
+
+def extract_ingredient(text: str) -> Optional[str]:
+    """Ingrédient à remplacer d'après la formulation de la demande, ou None"""
+    match = _INGREDIENT_RE.search(text.lower())
+    if match is None:
+        return None
+    name = match.group("name").strip(" '-")
+    return name if name and len(name.split()) <= 4 else None
+
+
+def diet_tags(diets: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Étiquettes du graphe correspondant aux régimes extraits par le routeur"""
+    tags = (strip_accents(diet.lower()) for diet in diets or ())
+    return tuple(tag for tag in tags if tag in TAGS)
+
+
+class Substitution:
+    """Remplaçant d'un ingrédient, avec sa proportion et ses conditions d'usage"""
+
+    __slots__ = ("substitute", "ratio", "unit", "contexts", "tags", "note", "source")
+
+    def __init__(self, substitute: str, ratio: float = 1.0, unit: str = "", contexts: Sequence[str] = (),
+                 tags: Sequence[str] = (), note: str = "", source: str = "curated"):
+        self.substitute = substitute
+        self.ratio = ratio
+        self.unit = unit
+        self.contexts = tuple(context for context in contexts if context in CONTEXTS)
+        tags = set(tag for tag in tags if tag in TAGS)
+        for tag, implied in _IMPLIED_TAGS.items():
+            if tag in tags:
+                tags.update(implied)
+        self.tags = frozenset(tags)
+        self.note = note
+        self.source = source
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], source: str = "llm") -> Optional["Substitution"]:
+        """Substitution à partir d'un objet JSON, None s'il est inutilisable"""
+        if not isinstance(data, dict):
+            return None
+        substitute = str(data.get("substitute") or "").strip()
+        if not substitute:
+            return None
+        try:
+            ratio = float(data.get("ratio") or 1)
+        except (TypeError, ValueError):
+            ratio = 1.0
+        contexts = [strip_accents(str(c).lower()) for c in data.get("contexts") or () if isinstance(c, str)]
+        tags = [strip_accents(str(t).lower()) for t in data.get("tags") or () if isinstance(t, str)]
+        return cls(substitute, ratio if ratio > 0 else 1.0, str(data.get("unit") or "").strip(),
+                   contexts, tags, str(data.get("note") or "").strip(), source)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "substitute": self.substitute,
+            "ratio": self.ratio,
+            "unit": self.unit,
+            "contexts": list(self.contexts),
+            "tags": sorted(self.tags),
+            "note": self.note,
+        }
+
+    def proportion(self) -> str:
+        if self.unit:
+            return f"{self.ratio:g} {self.unit}"
+        if self.ratio == 1:
+            return "même quantité"
+        return f"{self.ratio:g} fois la quantité"
+
+    def describe(self) -> str:
+        text = f"{self.substitute} ({self.proportion()})"
+        return f"{text} : {self.note}" if self.note else text
+
+
+class SubstitutionGraph:
+    """Substitutions par ingrédient, avec rapprochement des noms"""
+
+    def __init__(self, edges: Optional[Dict[str, List[Substitution]]] = None,
+                 nutrition: Optional[NutritionDatabase] = None, learned_path: Optional[str] = None,
+                 limit: int = 5):
+        self.nutrition = nutrition
+        self.learned_path = learned_path
+        self.limit = limit
+        self.edges: Dict[str, List[Substitution]] = {}
+        self._names: Dict[str, str] = {}
+        self._keys: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        for ingredient, substitutions in (edges or {}).items():
+            self._merge(ingredient, substitutions)
+        if learned_path and os.path.exists(learned_path):
+            self._load_learned()
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_GRAPH_PATH, nutrition: Optional[NutritionDatabase] = None,
+             learned_path: Optional[str] = None, limit: int = 5) -> "SubstitutionGraph":
+        """Charge le graphe depuis un fichier CSV"""
+        edges: Dict[str, List[Substitution]] = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                edges.setdefault(row["ingredient"], []).append(Substitution(
+                    row["substitute"], float(row["ratio"] or 1), row.get("unit") or "",
+                    [c for c in (row.get("contexts") or "").split("|") if c],
+                    [t for t in (row.get("tags") or "").split("|") if t],
+                    row.get("note") or "",
+                ))
+        graph = cls(edges, nutrition, learned_path, limit)
+        logger.debug(f"Graphe de substitutions chargé: {len(graph.edges)} ingrédients")
+        return graph
+
+    def _load_learned(self) -> None:
+        with open(self.learned_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = loads(line)
+                    substitutions = [Substitution.from_dict(item) for item in entry["substitutions"]]
+                    self._merge(entry["ingredient"], [s for s in substitutions if s is not None])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Ligne illisible dans les substitutions apprises")
+
+    def canonical(self, name: str) -> str:
+        """Nom normalisé d'un ingrédient (celui de la table nutritionnelle s'il y figure)"""
+        if self.nutrition is not None:
+            return self.nutrition.canonical(name, fuzzy=False)
+        return singular_words(normalize_name(name))
+
+    def _merge(self, ingredient: str, substitutions: List[Substitution]) -> int:
+        """Ajoute les remplaçants absents de l'ingrédient, retourne leur nombre"""
+        key = self.canonical(ingredient)
+        if not key:
+            return 0
+        current = self.edges.setdefault(key, [])
+        self._names.setdefault(key, ingredient)
+        known = {normalize_name(s.substitute) for s in current}
+        added = 0
+        for substitution in substitutions:
+            name = normalize_name(substitution.substitute)
+            if name and name not in known and name != key:
+                known.add(name)
+                current.append(substitution)
+                added += 1
+        # Les rapprochements approchés déjà calculés peuvent changer
+        self._keys.clear()
+        return added
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Ingrédient du graphe correspondant au nom, y compris mal orthographié, ou None"""
+        if name in self._keys:
+            return self._keys[name]
+        key = self.canonical(name)
+        if key not in self.edges:
+            close = difflib.get_close_matches(key, list(self.edges), n=1, cutoff=0.85)
+            key = close[0] if close else None
+        if key is None and self.nutrition is not None:
+            # Rapprochement par préfixe de la table : "beurre demi-sel" -> "beurre", mais pas
+            # "beurre de cacahuete" ; la table écarte les préfixes suivis d'un complément
+            row = self.nutrition.match(name)
+            fuzzy = self.nutrition.names[row] if row is not None else None
+            key = fuzzy if fuzzy in self.edges else None
+        if len(self._keys) < 10000:
+            self._keys[name] = key
+        return key
+
+    def lookup(self, name: str, context: Optional[str] = None,
+               diets: Sequence[str] = ()) -> Optional[Tuple[str, List[Substitution]]]:
+        """Remplaçants adaptés au contexte et aux régimes, None si l'ingrédient est inconnu
+
+        Une substitution qui ne respecte pas un régime est écartée ; celles
+        du contexte demandé passent avant celles qui conviennent partout,
+        puis avant les autres.
+        """
+        key = self.resolve(name)
+        if key is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        candidates = [s for s in self.edges[key] if all(tag in s.tags for tag in diets)]
+        if context is not None:
+            matching = [s for s in candidates if context in s.contexts or not s.contexts]
+            candidates = matching or candidates
+            candidates.sort(key=lambda s: 0 if context in s.contexts else 1)
+        if not candidates:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return self._names.get(key, key), candidates[:self.limit]
+
+    def answer(self, name: str, context: Optional[str] = None,
+               diets: Sequence[str] = ()) -> Optional[Dict[str, Any]]:
+        """Réponse de suggest_substitutions tirée du graphe, ou None"""
+        found = self.lookup(name, context, diets)
+        if found is None:
+            return None
+        ingredient, substitutions = found
+        return {**format_substitutions(ingredient, substitutions, context, diets), "source": "local"}
+
+    def learn(self, ingredient: str, options: Iterable[Dict[str, Any]], source: str = "llm") -> int:
+        """Ajoute au graphe les remplaçants proposés par le modèle et les enregistre"""
+        substitutions = [s for s in (Substitution.from_dict(o, source) for o in options) if s is not None]
+        with self._lock:
+            added = self._merge(ingredient, substitutions)
+            if not added:
+                return 0
+            self.learned += added
+            if self.learned_path:
+                entry = {"ingredient": ingredient, "substitutions": [s.to_dict() for s in substitutions]}
+                with open(self.learned_path, "a", encoding="utf-8") as f:
+                    f.write(dumps(entry) + "\n")
+        logger.info(f"{added} substitution(s) apprise(s) pour {ingredient}")
+        return added
+
+    def save(self, path: str) -> None:
+        """Réécrit le graphe complet (données d'origine et apprises) au format CSV"""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("ingredient", "substitute", "ratio", "unit", "contexts", "tags", "note"))
+            for key, substitutions in self.edges.items():
+                for s in substitutions:
+                    writer.writerow((self._names.get(key, key), s.substitute, f"{s.ratio:g}", s.unit,
+                                     "|".join(s.contexts), "|".join(sorted(s.tags)), s.note))
+        os.replace(temporary, path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ingredients": len(self.edges),
+            "substitutions": sum(len(substitutions) for substitutions in self.edges.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "learned": self.learned,
+        }
+
+
+def format_substitutions(ingredient: str, substitutions: Sequence[Substitution], context: Optional[str] = None,
+                         diets: Sequence[str] = ()) -> Dict[str, Any]:
+    """Réponse de suggest_substitutions : texte affiché et substitutions structurées"""
+    conditions = [CONTEXT_LABELS[context]] if context else []
+    conditions.extend(diets)
+    header = f"Pour remplacer {ingredient}" + (f" ({', '.join(conditions)})" if conditions else "") + " :"
+    return {
+        "substitutions": "\n".join([header] + [f"- {s.describe()}" for s in substitutions]),
+        "ingredient": ingredient,
+        "options": [s.to_dict() for s in substitutions],
+        "context": context,
+    }
+
+
+def substitution_request(ingredients: Sequence[str]) -> Dict[str, Any]:
+    """Paramètres de l'appel au modèle pour les substitutions d'un ou plusieurs ingrédients"""
+    return {
+        "model": "gpt-4.1-nano",
+        "messages": [
+            {"role": "system", "content": SUBSTITUTION_PROMPT},
+            {"role": "user", "content": "Ingrédients : " + ", ".join(ingredients)},
+        ],
+        "temperature": 0.3,
+        # Environ 250 tokens par ingrédient
+        "max_tokens": min(4000, 300 * len(ingredients)),
+        "response_format": {"type": "json_object"},
+    }
+
+
+def parse_substitutions(content: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Substitutions par ingrédient de la réponse du modèle ; vide si elle est invalide"""
+    try:
+        data = loads(content)
+    except ValueError:
+        return {}
+    entries = data.get("substitutions") if isinstance(data, dict) else None
+    if not isinstance(entries, dict):
+        return {}
+    return {str(name): [item for item in items if isinstance(item, dict)]
+            for name, items in entries.items() if isinstance(items, list)}
+
+
+def build_substitutions_from_env(nutrition: Optional[NutritionDatabase] = None) -> Optional[SubstitutionGraph]:
+    """Construit le graphe à partir des variables RECIPE_SUBSTITUTIONS_*"""
+    path = os.getenv("RECIPE_SUBSTITUTIONS_DB", DEFAULT_GRAPH_PATH)
+    if path.lower() in ("", "none", "off", "0"):
+        return None
+    return SubstitutionGraph.load(
+        path,
+        nutrition if nutrition is not None else get_nutrition_database(),
+        learned_path=os.getenv("RECIPE_SUBSTITUTIONS_LEARNED") or None,
+        limit=int(os.getenv("RECIPE_SUBSTITUTIONS_RESULTS", "5")),
+    )
+
+
+def expand(graph: SubstitutionGraph, transport, ingredients: Sequence[str], batch_size: int = 10,
+           workers: int = 4, depth: int = 1) -> int:
+    """Complète le graphe par lots d'ingrédients envoyés au modèle
+
+    À chaque niveau de profondeur, les remplaçants proposés qui ne sont pas
+    encore dans le graphe forment le lot suivant.
+    """
+    total = 0
+    pending = [name for name in dict.fromkeys(ingredients) if graph.resolve(name) is None]
+    for level in range(depth):
+        if not pending:
+            break
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        logger.info(f"Niveau {level + 1} : {len(pending)} ingrédients en {len(batches)} lots")
+
+        def run(batch: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+            try:
+                response = transport.create("expand_substitutions", **substitution_request(batch))
+                return parse_substitutions(response.choices[0].message.content)
+            except Exception as e:
+                logger.error(f"Lot en échec ({', '.join(batch)}): {e}")
+                return {}
+
+        discovered: List[str] = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(run, batches):
+                for ingredient, options in result.items():
+                    total += graph.learn(ingredient, options, source="expand")
+                    discovered.extend(str(option.get("substitute") or "") for option in options)
+        pending = [name for name in dict.fromkeys(discovered) if name and graph.resolve(name) is None]
+    return total
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from transport import OpenAIClients, build_openai_clients, build_transport_from_env
+
+    parser = argparse.ArgumentParser(description="Complète le graphe de substitutions avec le modèle, par lots")
+    parser.add_argument("command", choices=("expand", "lookup", "stats"))
+    parser.add_argument("ingredients", nargs="*", help="ingrédients à ajouter ou à chercher")
+    parser.add_argument("--from-nutrition", action="store_true",
+                        help="ajoute les ingrédients de la table nutritionnelle absents du graphe")
+    parser.add_argument("--graph", default=os.getenv("RECIPE_SUBSTITUTIONS_DB", DEFAULT_GRAPH_PATH))
+    parser.add_argument("--output", help="fichier CSV écrit (défaut : --graph)")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--context", choices=CONTEXTS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    nutrition = get_nutrition_database()
+    graph = SubstitutionGraph.load(args.graph, nutrition)
+    if args.command == "expand":
+        load_dotenv()
+        clients = OpenAIClients(lambda: build_openai_clients(os.getenv("OPENAI_API_KEY")))
+        names = list(args.ingredients)
+        if args.from_nutrition:
+            names.extend(nutrition.names)
+        added = expand(graph, build_transport_from_env(clients), names,
+                       args.batch_size, args.workers, args.depth)
+        graph.save(args.output or args.graph)
+        print(f"{added} substitutions ajoutées")
+    elif args.command == "lookup":
+        for name in args.ingredients:
+            answer = graph.answer(name, args.context)
+            print(answer["substitutions"] if answer else f"{name} : inconnu")
+    print(dumps(graph.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+from app import RecipeAgent, create_app
+from prompts import recipe_request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_create_app_builds_components_lazily():
+    app = create_app({"LOAD_DOTENV": False})
+    services = app.extensions["recipe"]
+    assert services._components == {}
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert services._components == {}
+
+
+def test_output_mode_is_read_at_call_time(monkeypatch):
+    monkeypatch.setenv("RECIPE_OUTPUT_MODE", "tools")
+    assert "tools" in recipe_request("pâtes", 3)
+    monkeypatch.setenv("RECIPE_OUTPUT_MODE", "json")
+    assert "response_format" in recipe_request("pâtes", 3)
+
+
+def test_output_mode_from_app_config(monkeypatch):
+    monkeypatch.setenv("RECIPE_OUTPUT_MODE", "json")
+    app = create_app({"LOAD_DOTENV": False, "RECIPE_OUTPUT_MODE": "tools"})
+    agent = app.extensions["recipe"].agent
+    assert "tools" in agent._recipe_request("pâtes")
+    assert "response_format" in RecipeAgent()._recipe_request("pâtes")
+
+
+def test_importing_asgi_does_not_create_the_app():
+    code = "import asgi, app; print('application' in vars(asgi), 'app' in vars(app))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["False", "False"]
@@ -0,0 +1,85 @@
+import gzip
+
+import pytest
+
+from app import create_app
+from assets import (IMMUTABLE, REVALIDATE, AssetBundle, accepted_encodings, minify_css, minify_html,
+                    minify_js)
+
+
+def write_sources(directory, script="let a = 1\n"):
+    (directory / "index.html").write_text(
+        '<html>\n  <head><link href="app.css"></head>\n  <body><script src="app.js"></script></body>\n</html>\n',
+        encoding="utf-8")
+    (directory / "app.js").write_text(script * 50, encoding="utf-8")
+    (directory / "app.css").write_text("/* thème */\nbody {\n  color : red;\n}\n" * 50, encoding="utf-8")
+
+
+def test_minify_js_keeps_strings():
+    source = 'const url = "http://x//y"  // commentaire\n\n  /* bloc */ let s = `a /* b */`\n'
+    assert minify_js(source) == 'const url = "http://x//y"\nlet s = `a /* b */`'
+
+
+def test_minify_css_and_html():
+    assert minify_css("/* c */ a , b {\n  color : red ;\n}") == "a,b{color:red}"
+    assert minify_html("  <p>\n  </p>  ") == "<p></p>"
+
+
+def test_accepted_encodings_skip_refused_ones():
+    assert accepted_encodings("gzip;q=0, BR, deflate ; q=0.5") == ["br", "deflate"]
+    assert accepted_encodings("") == []
+
+
+def test_page_references_content_named_files(tmp_path):
+    write_sources(tmp_path)
+    bundle = AssetBundle(str(tmp_path))
+    names = sorted(bundle.assets)
+    assert [name.split(".")[0] for name in names] == ["app", "app"]
+    page = bundle.page.bodies["identity"].decode()
+    for name in names:
+        assert f'"/assets/{name}"' in page
+        assert bundle.lookup(f"/assets/{name}").cache_control == IMMUTABLE
+    assert bundle.lookup("/").cache_control == REVALIDATE
+    assert bundle.lookup("/assets/app.js") is None
+
+    # Un nouveau contenu change le nom du fichier
+    write_sources(tmp_path, script="let b = 2\n")
+    bundle.build()
+    assert sorted(bundle.assets) != names
+
+
+def test_respond_picks_a_precompressed_variant(tmp_path):
+    write_sources(tmp_path)
+    bundle = AssetBundle(str(tmp_path))
+    asset = bundle.lookup("/")
+    status, headers, body = bundle.respond(asset, "gzip")
+    headers = dict(headers)
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == asset.bodies["identity"]
+
+    status, headers, body = bundle.respond(asset, "gzip;q=0")
+    assert "Content-Encoding" not in dict(headers)
+    assert body == asset.bodies["identity"]
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"autre", {etag}', "*"])
+def test_matching_etag_is_not_modified(tmp_path, if_none_match):
+    write_sources(tmp_path)
+    bundle = AssetBundle(str(tmp_path))
+    asset = bundle.lookup("/")
+    etag = dict(bundle.respond(asset, "gzip")[1])["ETag"]
+    status, headers, body = bundle.respond(asset, "gzip", if_none_match.format(etag=etag))
+    assert (status, body) == (304, b"")
+    # L'ETag d'une autre variante ne correspond pas
+    assert bundle.respond(asset, "", etag)[0] == 200
+
+
+def test_flask_serves_the_bundle():
+    client = create_app({"LOAD_DOTENV": False}).test_client()
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    response = client.get("/", headers={"If-None-Match": response.headers["ETag"], "Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert client.get("/assets/inconnu.js").status_code == 404
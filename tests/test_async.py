@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+from app import RecipeAgent
+from cache import MemoryBackend, ResponseCache
+from router import IntentRouter
+from scheduler import LLMScheduler, SQLiteBucketStore
+from sessions import MemorySessionStore, SessionManager
+from singleflight import SingleFlight, SQLiteFlightStore
+
+
+class RecordingSessionStore(MemorySessionStore):
+    def __init__(self, threads):
+        super().__init__()
+        self.threads = threads
+
+    def get(self, session_id):
+        self.threads.append(threading.current_thread())
+        return super().get(session_id)
+
+
+class RecordingBucketStore(SQLiteBucketStore):
+    def __init__(self, path, threads):
+        super().__init__(path)
+        self.threads = threads
+
+    def update(self, key, amount, rate, burst):
+        self.threads.append(threading.current_thread())
+        return super().update(key, amount, rate, burst)
+
+
+def test_blocking_stores_run_off_the_event_loop():
+    threads = []
+
+    def embedder(text):
+        threads.append(threading.current_thread())
+        return [1.0, 0.0]
+
+    agent = RecipeAgent(cache=ResponseCache(backend=MemoryBackend(), embedder=embedder),
+                        router=IntentRouter(), sessions=SessionManager(RecordingSessionStore(threads)))
+    asyncio.run(agent.aprocess_request("une recette de pâtes au pesto", session_id="session"))
+    assert threads
+    assert threading.main_thread() not in threads
+
+
+def test_shared_buckets_run_off_the_event_loop(tmp_path):
+    threads = []
+    scheduler = LLMScheduler(client_tokens_per_minute=60000,
+                             store=RecordingBucketStore(str(tmp_path / "buckets.sqlite3"), threads))
+    asyncio.run(scheduler.aadmit("client"))
+    assert threads
+    assert threading.main_thread() not in threads
+
+
+class RecordingFlightStore(SQLiteFlightStore):
+    def __init__(self, path, threads):
+        super().__init__(path)
+        self.threads = threads
+
+    def try_acquire(self, key):
+        self.threads.append(threading.current_thread())
+        return super().try_acquire(key)
+
+    def release(self, key):
+        self.threads.append(threading.current_thread())
+        super().release(key)
+
+
+class RecordingPantry:
+    def __init__(self, threads):
+        self.threads = threads
+
+    def suggest(self, ingredients):
+        self.threads.append(threading.current_thread())
+        return {"recipes": [], "source": "pantry"}
+
+
+class RecordingGraph:
+    def __init__(self, threads):
+        self.threads = threads
+        self.learned = {}
+
+    def answer(self, name, context=None, diet=()):
+        self.threads.append(threading.current_thread())
+        return self.learned.get(name)
+
+    def learn(self, ingredient, options, source="llm"):
+        self.threads.append(threading.current_thread())
+        self.learned[ingredient] = {"ingredient": ingredient, "options": list(options)}
+        return len(self.learned[ingredient]["options"])
+
+
+def test_shared_flight_locks_run_off_the_event_loop(tmp_path):
+    threads = []
+    flights = SingleFlight(RecordingFlightStore(str(tmp_path / "flights.sqlite3"), threads))
+
+    async def compute():
+        return 1
+
+    assert asyncio.run(flights.ado("key", compute)) == 1
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_local_sources_run_off_the_event_loop():
+    threads = []
+    agent = RecipeAgent(pantry=RecordingPantry(threads), substitutions=RecordingGraph(threads))
+
+    async def ask_model(ingredient):
+        return {"ingredient": ingredient, "options": [{"substitute": "huile"}]}
+
+    agent._asuggest_substitutions = ask_model
+    asyncio.run(agent.aanalyze_ingredients(["tomate", "basilic"]))
+    result = asyncio.run(agent.asuggest_substitutions("beurre"))
+    assert result["options"] == [{"substitute": "huile"}]
+    # Garde-manger, puis graphe consulté, appris et consulté de nouveau
+    assert len(threads) == 4
+    assert threading.main_thread() not in threads
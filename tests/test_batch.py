@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+from batch import CANCELLED, BatchItem, BatchRunner
+
+
+class SlowAgent:
+    def cached_response(self, message, **options):
+        return None
+
+    def process_request(self, message, **options):
+        time.sleep(0.01)
+        return {"type": "recipes", "data": {"message": message}}
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Compte les éléments soumis et pas encore terminés"""
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers)
+        self.outstanding = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _done(self, future):
+        with self._lock:
+            self.outstanding -= 1
+
+    def submit(self, *args, **kwargs):
+        with self._lock:
+            self.outstanding += 1
+            self.peak = max(self.peak, self.outstanding)
+        future = super().submit(*args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+
+def items(count):
+    return [BatchItem("chat", f"recette numéro {i}") for i in range(count)]
+
+
+def test_run_submits_a_bounded_window():
+    runner = BatchRunner(SlowAgent(), max_workers=2)
+    runner._executor = CountingExecutor(2)
+    result = runner.run_all(items(10))
+    assert result["request_counts"]["completed"] == 10
+    assert runner._executor.peak <= 2
+
+
+def test_cancelled_job_reports_every_item():
+    runner = BatchRunner(SlowAgent(), max_workers=2)
+    cancelled = threading.Event()
+    results = []
+    for result in runner.run(items(10), cancelled):
+        results.append(result)
+        cancelled.set()
+    assert sorted(result["index"] for result in results) == list(range(10))
+    assert sum(result["status"] == CANCELLED for result in results) >= 6
+
+
+def test_invalid_mode_is_rejected_before_admission():
+    app = create_app({"LOAD_DOTENV": False})
+    response = app.test_client().post("/api/batch", json={"items": ["pâtes"], "mode": "bogus"})
+    assert response.status_code == 400
+    # Ni le quota du client ni les composants du lot n'ont été touchés
+    assert "transport" not in app.extensions["recipe"]._components
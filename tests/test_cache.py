@@ -0,0 +1,64 @@
+import pytest
+
+from cache import MemoryBackend, ResponseCache, SQLiteBackend, normalize_prompt
+
+
+def test_equivalent_prompts_share_key():
+    assert (ResponseCache.make_key("generate_recipes", "Je voudrais un plat italien pour 4 personnes")
+            == ResponseCache.make_key("generate_recipes", "plat italien pour quatre"))
+    assert normalize_prompt("Des tomates") == normalize_prompt("tomate")
+
+
+def test_negation_changes_key():
+    assert normalize_prompt("je ne veux pas de poisson") != normalize_prompt("je veux du poisson")
+    assert normalize_prompt("un gâteau sans beurre") != normalize_prompt("un gâteau au beurre")
+
+
+def test_word_order_changes_key():
+    assert normalize_prompt("poulet sans fromage") != normalize_prompt("fromage sans poulet")
+
+
+def test_semantic_lookup_reuses_embedding_and_caps_scan():
+    calls = []
+
+    def embedder(text):
+        calls.append(text)
+        return [1.0, float(len(text))]
+
+    backend = MemoryBackend()
+    cache = ResponseCache(backend=backend, embedder=embedder, semantic_scan=2)
+    assert cache.get_or_compute("generate_recipes", "soupe de potiron", lambda: {"recipes": []}) == {"recipes": []}
+    # Le get manqué et le set qui le suit partagent le même embedding
+    assert calls == ["soupe potiron"]
+
+    for i in range(5):
+        cache.set("generate_recipes", f"recette {i}", {"recipes": [i]})
+    assert len(backend.items("generate_recipes:", limit=2)) == 2
+    assert [value for _, (value, _, _) in backend.items("generate_recipes:", limit=1)] == ['{"recipes":[4]}']
+
+
+def test_servings_share_a_fixed_slot():
+    assert normalize_prompt("4 personnes plat italien") == normalize_prompt("plat italien pour 4") == "n=4 plat italien"
+    assert normalize_prompt("une recette pour une personne") == normalize_prompt("recette pour 1 personne")
+    assert normalize_prompt("plat italien pour 2") != normalize_prompt("plat italien pour 6")
+    # Un article n'est pas un nombre de convives
+    assert not normalize_prompt("un gâteau pour un anniversaire").startswith("n=")
+
+
+def test_semantic_lookup_only_compares_same_servings():
+    def embedder(text):
+        return [1.0, 0.0, 0.0]
+
+    cache = ResponseCache(embedder=embedder)
+    cache.set("generate_recipes", "lasagnes pour 6", {"recipes": [6]})
+    assert cache.get("generate_recipes", "un gratin pour 2") is None
+    assert cache.get("generate_recipes", "un gratin pour 6") == {"recipes": [6]}
+    assert cache.semantic_hits == 1
+
+
+def test_sqlite_embeddings_round_trip(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+    cache = ResponseCache(backend=backend, embedder=lambda text: [3.0, 4.0])
+    cache.set("generate_recipes", "soupe pour 2", {"recipes": []})
+    [(_, (_, _, embedding))] = backend.items("generate_recipes:")
+    assert list(embedding) == pytest.approx([0.6, 0.8])
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+from app import DIVERSITY_HINTS, RecipeAgent, parse_recipe_options
+from cache import MemoryBackend, ResponseCache
+from transport import OpenAIClients, Transport
+
+
+def recipe(title):
+    return {
+        "title": title, "servings": "4", "prep_time": "10 min", "cook_time": "20 min", "difficulty": "Facile",
+        "ingredients": [{"name": "farine", "quantity": "200", "unit": "g"}],
+        "steps": [{"step_number": 1, "description": "Mélanger."}],
+        "tips": [],
+    }
+
+
+def completion(content):
+    message = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+class HintProvider:
+    """Une recette par appel, titrée d'après l'indice de diversité ; `failures` appels en échec par indice"""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.calls = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def reply(self, messages):
+        user_message = messages[-1]["content"]
+        hint = next(hint for hint in DIVERSITY_HINTS if hint in user_message)
+        with self._lock:
+            self.calls.append(hint)
+            if self.failures.get(hint, 0) > 0:
+                self.failures[hint] -= 1
+                return completion("pas de recette")
+        return completion(json.dumps({"recipes": [recipe(hint)]}, ensure_ascii=False))
+
+    def create(self, timeout=None, messages=None, **kwargs):
+        return self.reply(messages)
+
+
+class AsyncHintProvider(HintProvider):
+    async def create(self, timeout=None, messages=None, **kwargs):
+        return self.reply(messages)
+
+
+def agent_for(provider, **options):
+    clients = OpenAIClients.of(None, provider) if isinstance(provider, AsyncHintProvider) else OpenAIClients.of(provider)
+    return RecipeAgent(transport=Transport(clients), output_mode="json", **options)
+
+
+def test_each_recipe_gets_its_own_hint():
+    provider = HintProvider()
+    result = agent_for(provider).generate_recipes("des pâtes", count=3, fan_out=True)
+    assert [r["title"] for r in result["recipes"]] == DIVERSITY_HINTS[:3]
+    assert sorted(provider.calls) == sorted(DIVERSITY_HINTS[:3])
+
+
+def test_only_failed_slots_are_retried():
+    provider = HintProvider({DIVERSITY_HINTS[1]: 1})
+    result = agent_for(provider, fan_out_retries=1).generate_recipes("des pâtes", count=3, fan_out=True)
+    assert [r["title"] for r in result["recipes"]] == DIVERSITY_HINTS[:3]
+    assert "partial" not in result
+    assert provider.calls.count(DIVERSITY_HINTS[1]) == 2
+    assert provider.calls.count(DIVERSITY_HINTS[0]) == 1
+
+
+def test_missing_slots_make_a_partial_result_that_is_not_cached():
+    cache = ResponseCache(backend=MemoryBackend())
+    provider = HintProvider({DIVERSITY_HINTS[2]: 2})
+    agent = agent_for(provider, cache=cache, fan_out=True, fan_out_retries=1)
+    result = agent.generate_recipes("des pâtes", count=3)
+    assert result["partial"] is True
+    assert result["missing"] == 1
+    assert [r["title"] for r in result["recipes"]] == DIVERSITY_HINTS[:2]
+    assert cache.get("generate_recipes", "des pâtes") is None
+
+
+def test_async_fan_out_retries_failed_slots():
+    provider = AsyncHintProvider({DIVERSITY_HINTS[0]: 1})
+    agent = agent_for(provider, fan_out_retries=1)
+    result = asyncio.run(agent.agenerate_recipes("des pâtes", count=2, fan_out=True))
+    assert [r["title"] for r in result["recipes"]] == DIVERSITY_HINTS[:2]
+    assert provider.calls.count(DIVERSITY_HINTS[0]) == 2
+
+
+def test_no_recipe_at_all_is_an_error():
+    provider = HintProvider({hint: 5 for hint in DIVERSITY_HINTS})
+    result = agent_for(provider, fan_out_retries=0).generate_recipes("des pâtes", count=2, fan_out=True)
+    assert result == {"error": "Aucune recette générée"}
+
+
+def test_parse_recipe_options():
+    assert parse_recipe_options({"recipe_count": 5, "fan_out": True}) == ({"count": 5, "fan_out": True}, None)
+    assert parse_recipe_options({}) == ({}, None)
+    for data in ({"recipe_count": 0}, {"recipe_count": 11}, {"recipe_count": True}, {"fan_out": "oui"}):
+        options, error = parse_recipe_options(data)
+        assert options is None and error
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from asgi import create_asgi_app
+from metrics import HTTP_DURATION, Registry, SlowRequestProfiler
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("duree", "Durée", ("tool",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, tool="a")
+    histogram.observe(0.5, tool="a")
+    histogram.observe(5.0, tool="a")
+    lines = registry.render().splitlines()
+    assert 'duree_bucket{tool="a",le="0.1"} 1' in lines
+    assert 'duree_bucket{tool="a",le="1.0"} 2' in lines
+    assert 'duree_bucket{tool="a",le="+Inf"} 3' in lines
+    assert 'duree_count{tool="a"} 3' in lines
+
+
+def test_timer_records_the_exception_as_outcome():
+    registry = Registry()
+    histogram = registry.histogram("outil", "Outil", ("tool", "outcome"))
+    with pytest.raises(KeyError):
+        with histogram.time(tool="x", outcome="ok"):
+            raise KeyError("x")
+    assert histogram.count(tool="x", outcome="KeyError") == 1
+    assert histogram.count(tool="x", outcome="ok") == 0
+
+
+def test_failing_collector_does_not_break_the_export():
+    registry = Registry()
+    registry.counter("appels", "Appels").inc()
+
+    def broken():
+        raise RuntimeError("collecteur")
+
+    registry.add_collector(broken)
+    assert "appels 1" in registry.render().splitlines()
+
+
+def test_profiles_are_kept_per_key_on_a_shared_thread():
+    profiler = SlowRequestProfiler(threshold=0, interval=0.001)
+    profiler.start("POST /a", key="a")
+    profiler.start("POST /b", key="b")
+    time.sleep(0.05)
+    first = profiler.stop(key="a")
+    second = profiler.stop(key="b")
+    assert first["label"] == "POST /a" and first["samples"] > 0
+    assert second["label"] == "POST /b" and second["samples"] > 0
+    assert profiler.stop() is None
+
+
+class RecordingProfiler:
+    def __init__(self):
+        self.calls = []
+
+    def start(self, label, key=None):
+        self.calls.append(("start", label, key))
+
+    def stop(self, key=None):
+        self.calls.append(("stop", None, key))
+
+
+def call(app, method, path, payload):
+    messages = []
+    body = json.dumps(payload).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": [], "client": ("127.0.0.1", 1)}
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_native_asgi_routes_are_timed_and_profiled(path):
+    app = create_asgi_app({"LOAD_DOTENV": False})
+    profiler = app.services.profiler = RecordingProfiler()
+    before = HTTP_DURATION.count(method="POST", endpoint=path, status=400)
+    messages = call(app, "POST", path, {"message": ""})
+    assert messages[0]["status"] == 400
+    assert HTTP_DURATION.count(method="POST", endpoint=path, status=400) == before + 1
+    (start, label, key), (stop, _, stop_key) = profiler.calls
+    assert (start, label, stop) == ("start", f"POST {path}", "stop")
+    assert key is not None and stop_key is key
@@ -0,0 +1,72 @@
+import pytest
+
+import models
+from models import Ingredient, Recipe, Step, dumps, dumps_bytes, loads, validate_recipes
+
+
+def recipe(**overrides):
+    data = {
+        "title": " Tarte aux pommes ", "servings": "4", "prep_time": "10 min", "cook_time": "30 min",
+        "difficulty": "Facile",
+        "ingredients": [{"name": "pommes", "quantity": "4"}, {"name": "", "quantity": "", "unit": ""}],
+        "steps": [{"description": "Éplucher."}, {"step_number": 2, "description": "Cuire."}],
+        "tips": ["Servir tiède.", ""],
+    }
+    data.update(overrides)
+    return data
+
+
+def test_from_dict_cleans_and_drops_empty_items():
+    errors = []
+    result = Recipe.from_dict(recipe(), errors=errors)
+    assert errors == []
+    assert result.title == "Tarte aux pommes"
+    assert [ingredient.to_dict() for ingredient in result.ingredients] == [{"name": "pommes", "quantity": "4"}]
+    assert [step.step_number for step in result.steps] == [1, 2]
+    assert result.tips == ["Servir tiède."]
+
+
+def test_from_dict_collects_every_error():
+    data = recipe(steps="cuire", ingredients=["pommes", {"name": "sucre"}])
+    del data["cook_time"]
+    errors = []
+    result = Recipe.from_dict(data, "recipes[0]", errors)
+    assert result is not None
+    assert result.cook_time == ""
+    assert errors == [
+        "recipes[0].cook_time: champ manquant",
+        "recipes[0].steps: une liste est attendue",
+        "recipes[0].ingredients[0]: ingrédient invalide",
+    ]
+    assert Recipe.from_dict("tarte", errors=errors) is None
+
+
+def test_extra_fields_are_kept():
+    result = Recipe.from_dict(recipe(cuisine="française"))
+    assert result.to_dict()["cuisine"] == "française"
+    assert "extra" not in result.to_dict()
+
+
+def test_validate_recipes_checks_the_count():
+    recipes, errors = validate_recipes([recipe(), "pas une recette"], 2)
+    assert [r.title for r in recipes] == ["Tarte aux pommes"]
+    assert errors == ["recipes[1]: recette invalide", "Nombre de recettes incorrect: 1 au lieu de 2"]
+    assert validate_recipes([recipe()], 1)[1] == []
+
+
+def test_slots_keep_instances_small():
+    for cls in (Recipe, Ingredient, Step):
+        assert not hasattr(cls.__new__(cls), "__dict__")
+
+
+@pytest.mark.parametrize("backend", ["default", "json"])
+def test_serialization_round_trip(monkeypatch, backend):
+    if backend == "json":
+        monkeypatch.setattr(models, "orjson", None)
+    result = Recipe.from_dict(recipe())
+    payload = {"recipes": [result]}
+    assert loads(dumps(payload)) == {"recipes": [result.to_dict()]}
+    assert loads(dumps_bytes(payload)) == loads(dumps(payload))
+    assert "tiède" in dumps(payload)
+    with pytest.raises(TypeError):
+        dumps({"objet": object()})
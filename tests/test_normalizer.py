@@ -0,0 +1,43 @@
+from normalizer import clean_raw_response, clean_recipe, clean_recipes, clean_text
+from pantry import PantryIndex
+
+
+def test_clean_text():
+    assert clean_text("  Recette ‘maison’\n") == "Recette 'maison'"
+    assert clean_text("Mélanger “doucement”\r\n") == 'Mélanger "doucement"'
+    assert clean_text(4) == "4"
+
+
+def test_raw_response_keeps_typographic_double_quotes():
+    # Dans le JSON brut, un guillemet droit fermerait la chaîne
+    assert clean_raw_response('{"a": "l’“idée”"}\n') == '{"a": "l\'“idée”"} '
+
+
+def test_walker_follows_the_schema():
+    recipe = {
+        "title": " Tarte\n",
+        "ingredients": [{"name": "farine\r", "quantity": 200, "unit": "g", "extra": 1}, "sucre", None, {}],
+        "steps": [{"description": "Cuire"}, {"step_number": 5}, "Servir"],
+        "tips": ["", "Tiède\n"],
+        "source": "import",
+    }
+    assert clean_recipe(recipe) == {
+        "title": "Tarte",
+        "servings": "", "prep_time": "", "cook_time": "", "difficulty": "",
+        "ingredients": [{"name": "farine", "quantity": "200", "unit": "g"}, {"name": "sucre"}],
+        "steps": [{"step_number": 1, "description": "Cuire"}, {"step_number": 2, "description": "Servir"}],
+        "tips": ["Tiède"],
+        "source": "import",
+    }
+    assert clean_recipes([recipe, "texte", None]) == [recipe]
+
+
+def test_imported_recipes_are_cleaned(tmp_path):
+    dataset = tmp_path / "recettes.jsonl"
+    dataset.write_text('{"title": "Soupe\\n", "ingredients": ["poireaux", {"name": "pommes de terre\\r"}]}\n"bruit"\n',
+                       encoding="utf-8")
+    pantry = PantryIndex()
+    assert pantry.import_dataset(str(dataset)) == 1
+    record = pantry._records[0]
+    assert record["title"] == "Soupe"
+    assert record["recipe"]["ingredients"] == [{"name": "poireaux"}, {"name": "pommes de terre"}]
@@ -0,0 +1,51 @@
+import pytest
+
+from nutrition import get_nutrition_database
+
+
+@pytest.fixture(scope="module")
+def database():
+    return get_nutrition_database()
+
+
+@pytest.mark.parametrize("name, matched", [
+    ("beurre demi-sel", "beurre"),
+    ("tomates cerises bio", "tomate"),
+    ("farine de blé", "farine"),
+    ("sucre en poudre", "sucre"),
+    ("huile d'olive vierge", "huile d'olive"),
+])
+def test_prefix_keeps_modifiers(database, name, matched):
+    assert database.canonical(name) == matched
+
+
+@pytest.mark.parametrize("name", ["beurre de cacahuète", "crème de marrons", "beurre d'arachide", "pâte à tartiner"])
+def test_compounds_are_left_to_the_model(database, name):
+    assert database.match(name) is None
+
+
+def test_plain_string_ingredients(database):
+    recipe = {"servings": "2", "ingredients": ["beurre", None, {"name": "farine", "quantity": 100, "unit": "g"}]}
+    report = database.analyze(recipe)
+    assert [item["matched"] for item in report.resolved] == ["farine"]
+    assert [item["name"] for item in report.unresolved] == ["beurre"]
+
+
+def test_analyze_many_matches_analyze(database):
+    recipes = [
+        {"servings": 4, "ingredients": [
+            {"name": "farine", "quantity": 200, "unit": "g"},
+            {"name": "beurre", "quantity": 50, "unit": "g"},
+            {"name": "beurre doux", "quantity": 25, "unit": "g"},
+            {"name": "crème de marrons", "quantity": 100, "unit": "g"},
+        ]},
+        {"servings": "2 personnes", "ingredients": [{"name": "oeufs", "quantity": 3}]},
+        {"ingredients": []},
+    ]
+    batch = database.analyze_many(recipes)
+    for recipe, report in zip(recipes, batch):
+        single = database.analyze(recipe)
+        assert report.servings == single.servings
+        assert report.unresolved == single.unresolved
+        assert report.total == pytest.approx(single.total)
+    assert batch[0].total["fat"] > 0
@@ -0,0 +1,88 @@
+import pytest
+
+from pantry import PantryIndex, build_pantry_from_env
+
+
+def recipe(title, *ingredients):
+    return {"title": title, "ingredients": [{"name": name} for name in ingredients]}
+
+
+RECIPES = [
+    recipe("Omelette", "oeufs", "beurre", "sel"),
+    recipe("Pâtes au beurre", "pâtes", "beurre", "parmesan"),
+    recipe("Tomates farcies", "tomates", "viande hachée", "oignon", "riz", "persil"),
+    recipe("Salade de tomates", "tomates", "oignon", "huile d'olive"),
+]
+
+
+def titles(matches):
+    return [match.title for match in matches]
+
+
+def test_staples_and_duplicates_are_skipped():
+    pantry = PantryIndex()
+    assert pantry.add_recipes(RECIPES + [RECIPES[0], "pas une recette", recipe("Sans ingrédient")]) == 4
+    assert pantry.duplicates == 1
+    assert pantry.recipe_terms(RECIPES[0]) == ["oeuf", "beurre"]
+
+
+def test_search_ranks_by_missing_ingredients():
+    pantry = PantryIndex()
+    pantry.add_recipes(RECIPES)
+    matches = pantry.search(["tomates", "oignons"], max_missing=3)
+    assert titles(matches) == ["Salade de tomates", "Tomates farcies"]
+    assert matches[0].missing == []
+    assert matches[1].missing == ["viande hachee", "riz", "persil"]
+    # Au plus deux ingrédients manquants par défaut : les tomates farcies sont écartées
+    assert titles(pantry.search(["tomates", "oignons"])) == ["Salade de tomates"]
+
+
+def test_free_message_is_scanned_for_known_ingredients():
+    pantry = PantryIndex()
+    pantry.add_recipes(RECIPES)
+    assert pantry.parse_pantry(["j'ai des oeufs et du beurre, du sel"]) == ["oeuf", "beurre"]
+
+
+def test_suggest_keeps_well_covered_recipes():
+    pantry = PantryIndex(min_coverage=0.6)
+    pantry.add_recipes(RECIPES)
+    result = pantry.suggest(["oeufs", "beurre"])
+    assert result["source"] == "local"
+    assert [match["title"] for match in result["matches"]] == ["Omelette"]
+    assert pantry.suggest(["chocolat"]) is None
+    assert pantry.stats()["matched"] == 1
+
+
+def test_compacted_index_gives_the_same_results(tmp_path):
+    path = str(tmp_path / "pantry.jsonl")
+    pantry = PantryIndex(path, compact_threshold=0)
+    pantry.add_recipes(RECIPES)
+    before = titles(pantry.search(["beurre", "oeufs", "pâtes"], max_missing=3))
+    pantry.compact()
+    assert pantry.stats()["indexed"] == 4
+    assert titles(pantry.search(["beurre", "oeufs", "pâtes"], max_missing=3)) == before
+
+    # Un autre processus lit l'index compacté, puis les ajouts faits depuis
+    other = PantryIndex(path)
+    assert other.base_count == 4
+    pantry.add_recipes([recipe("Crêpes", "farine", "oeufs", "lait", "beurre")])
+    assert other.refresh() == 1
+    assert "Crêpes" in titles(other.search(["farine", "oeufs", "lait"]))
+    assert other.record(other.search(["farine", "lait"])[0].recipe_id)["title"] == "Crêpes"
+
+
+def test_import_dataset_cleans_recipes(tmp_path):
+    path = tmp_path / "recettes.csv"
+    path.write_text("title,ingredients\nOmelette,oeufs|beurre\nSoupe, poireaux ; pommes de terre\n,sans titre\n",
+                    encoding="utf-8")
+    pantry = PantryIndex()
+    assert pantry.import_dataset(str(path)) == 2
+    assert titles(pantry.search(["poireaux"])) == ["Soupe"]
+
+
+def test_unknown_backend(monkeypatch):
+    monkeypatch.setenv("RECIPE_PANTRY_BACKEND", "redis")
+    with pytest.raises(ValueError):
+        build_pantry_from_env()
+    monkeypatch.setenv("RECIPE_PANTRY_BACKEND", "off")
+    assert build_pantry_from_env() is None
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from models import loads
+from prompts import (RECIPE_JSON_PROMPT, RECIPE_SCHEMA, RECIPE_SYSTEM_PROMPT, RECIPE_TOOL, is_structured,
+                     is_truncated, output_mode_from_env, recipe_edit_request, recipe_request, response_text)
+
+
+def test_variable_parts_stay_in_the_user_message():
+    first = recipe_request("des pâtes", 3, mode="json")
+    second = recipe_request("une soupe", 1, hint="une recette rapide et simple", mode="json")
+    # Préfixe identique d'un appel à l'autre (mise en cache par le fournisseur)
+    assert first["messages"][0] == second["messages"][0]
+    assert first["messages"][1]["content"] == "Génère 3 recettes différentes pour: des pâtes"
+    assert second["messages"][1]["content"] == "Génère 1 recette pour: une soupe. Propose une recette rapide et simple"
+
+
+def test_json_mode():
+    request = recipe_request("des pâtes", 3, mode="json")
+    assert request["messages"][0]["content"] == RECIPE_JSON_PROMPT
+    assert request["response_format"] == {"type": "json_object"}
+    assert "tools" not in request
+
+
+def test_tools_mode():
+    request = recipe_request("des pâtes", 3, mode="tools", exclude=["Tarte", "Soupe"])
+    assert request["messages"][0]["content"] == RECIPE_SYSTEM_PROMPT
+    assert request["tools"] == [RECIPE_TOOL]
+    assert request["tool_choice"]["function"]["name"] == RECIPE_TOOL["function"]["name"]
+    assert request["messages"][1]["content"].endswith(". Autres que: Tarte, Soupe")
+    assert "response_format" not in request
+
+
+def test_json_example_matches_the_schema():
+    example = loads(RECIPE_JSON_PROMPT.split("JSON: ", 1)[1])
+    item = RECIPE_SCHEMA["properties"]["recipes"]["items"]
+    assert set(example["recipes"][0]) == set(item["required"])
+
+
+def test_unknown_output_mode(monkeypatch):
+    monkeypatch.setenv("RECIPE_OUTPUT_MODE", "TOOLS")
+    assert output_mode_from_env() == "tools"
+    monkeypatch.setenv("RECIPE_OUTPUT_MODE", "xml")
+    with pytest.raises(ValueError):
+        recipe_request("des pâtes", 3)
+
+
+def test_response_text_prefers_the_tool_call():
+    call = SimpleNamespace(function=SimpleNamespace(arguments='{"recipes": []}'))
+    structured = SimpleNamespace(content=None, tool_calls=[call])
+    plain = SimpleNamespace(content='{"recipes": [1]}', tool_calls=None)
+    assert response_text(structured) == '{"recipes": []}'
+    assert is_structured(structured) and not is_structured(plain)
+    assert response_text(plain) == '{"recipes": [1]}'
+    assert response_text(SimpleNamespace(content=None, tool_calls=[])) == ""
+
+
+def test_is_truncated():
+    assert is_truncated(SimpleNamespace(finish_reason="length"))
+    assert not is_truncated(SimpleNamespace(finish_reason="stop"))
+    assert not is_truncated(SimpleNamespace())
+
+
+def test_edit_request_carries_the_recipe():
+    request = recipe_edit_request({"title": "Tarte"}, "sans gluten")
+    assert request["messages"][1]["content"] == 'Recette: {"title":"Tarte"}\nDemande: sans gluten'
+    assert request["response_format"] == {"type": "json_object"}
@@ -0,0 +1,43 @@
+import pytest
+
+from router import IntentRouter, TfidfLinearClassifier, build_router_from_env, load_samples
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter(classifier=TfidfLinearClassifier().fit(load_samples()),
+                        vocabulary=["beurre", "farine", "tomate", "pomme de terre"])
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Par quoi remplacer le beurre dans un gâteau ?", "suggest_substitutions"),
+    ("Donne-moi une recette de risotto", "generate_recipes"),
+    ("Combien de calories dans une pomme de terre ?", "analyze_ingredients"),
+])
+def test_keywords_route_clear_requests(router, message, intent):
+    decision = router.route(message)
+    assert decision.intent == intent
+    assert decision.tier == "keyword"
+
+
+def test_classifier_routes_requests_without_keywords(router):
+    decision = router.route("Cookies moelleux au chocolat")
+    assert decision.intent == "generate_recipes"
+    assert decision.tier == "classifier"
+    assert IntentRouter().route("Cookies moelleux au chocolat").tier == "default"
+
+
+def test_entities(router):
+    entities = router.extract_entities("Remplacer le beurre et les pommes de terre, version végane sans gluten")
+    assert entities == {"diet": ["végan", "sans gluten"], "ingredients": ["beurre", "pommes de terre"]}
+    assert router.extract_entities("Un dîner italien pour 4") == {}
+
+
+def test_nutrition_questions(router):
+    assert router.is_nutrition_question("Les lentilles sont-elles riches en fer ?")
+    assert not router.is_nutrition_question("Que faire avec des lentilles ?")
+
+
+def test_build_router_without_classifier(monkeypatch):
+    monkeypatch.setenv("RECIPE_ROUTER_CLASSIFIER", "0")
+    assert build_router_from_env(["beurre"]).classifier is None
@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from limiter import Overloaded
+from scheduler import INTERACTIVE, LLMScheduler, PrioritySlots, client_key, request_context
+from transport import OpenAIClients, Transport
+
+
+def test_unknown_api_key_falls_back_to_address():
+    assert client_key("random-key", "10.0.0.1", {"known"}) == client_key(None, "10.0.0.1")
+    assert client_key("known", "10.0.0.1", {"known"}) != client_key(None, "10.0.0.1")
+    assert client_key("a", "10.0.0.1") == client_key("b", "10.0.0.1")
+
+
+def test_cost_is_refunded_when_no_slot_is_free():
+    scheduler = LLMScheduler(client_tokens_per_minute=60, client_burst=100000, slots=PrioritySlots(1),
+                             queue_timeouts={INTERACTIVE: 0.05})
+    with request_context("client"):
+        _, priority = scheduler.acquire("generate_recipes")
+        level = scheduler._level("client")
+        with pytest.raises(Overloaded):
+            scheduler.acquire("generate_recipes")
+        assert scheduler._level("client") == pytest.approx(level, abs=1)
+        scheduler.release(priority)
+
+
+class StreamingProvider:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        return iter(self.chunks)
+
+
+def chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+
+def test_stream_holds_slot_until_exhausted():
+    scheduler = LLMScheduler(slots=PrioritySlots(2))
+    usage = SimpleNamespace(choices=[], usage={"prompt_tokens": 10, "completion_tokens": 20})
+    transport = Transport(OpenAIClients.of(StreamingProvider([chunk("a"), chunk("b"), usage])), scheduler=scheduler)
+    stream = transport.create("stream_recipes", model="m", messages=[], stream=True)
+    assert scheduler.slots.active[INTERACTIVE] == 1
+    assert len(list(stream)) == 3
+    assert scheduler.slots.active[INTERACTIVE] == 0
+    assert transport.usage.stats()["stream_recipes"]["completion_tokens"] == 20
+
+
+def test_closed_stream_releases_slot():
+    scheduler = LLMScheduler(slots=PrioritySlots(2))
+    transport = Transport(OpenAIClients.of(StreamingProvider([chunk("a"), chunk("b")])), scheduler=scheduler)
+    stream = transport.create("stream_recipes", model="m", messages=[], stream=True)
+    next(stream)
+    stream.close()
+    assert scheduler.slots.active[INTERACTIVE] == 0
+
+
+def test_async_cost_is_refunded_on_timeout():
+    scheduler = LLMScheduler(global_tokens_per_minute=60, global_burst=100000, slots=PrioritySlots(1),
+                             queue_timeouts={INTERACTIVE: 0.05})
+
+    async def main():
+        _, priority = await scheduler.aacquire("suggest_substitutions")
+        level = scheduler._level("__global__")
+        with pytest.raises(Overloaded):
+            await scheduler.aacquire("suggest_substitutions")
+        assert scheduler._level("__global__") == pytest.approx(level, abs=1)
+        scheduler.release(priority)
+
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+import pytest
+
+from sessions import find_recipe_reference, merge_patch
+
+
+@pytest.mark.parametrize("message, index", [
+    ("version végétarienne de la recette 2", 1),
+    ("rends la première recette plus légère", 0),
+    ("remplace le beurre dans la 3e recette", 2),
+    ("enlève le fromage de la dernière recette", 2),
+    ("modifie la recette n°1 pour 6 personnes", 0),
+])
+def test_explicit_edit_is_detected(message, index):
+    assert find_recipe_reference(message, 3) == index
+
+
+@pytest.mark.parametrize("message", [
+    "donne-moi 1 recette végétarienne",
+    "une deuxième recette plus épicée",
+    "des pâtes pour 2, la première était trop salée",
+    "ajoute une deuxième recette plus épicée",
+    "la recette 2 était délicieuse",
+    "change la recette 5",
+])
+def test_other_messages_are_new_generations(message):
+    assert find_recipe_reference(message, 3) is None
+
+
+def test_single_recipe_reference():
+    assert find_recipe_reference("rends-la plus épicée", 1) == 0
+    assert find_recipe_reference("rends-la plus épicée", 2) is None
+
+
+def test_merge_patch():
+    assert merge_patch({"a": 1, "b": {"c": 2, "d": 3}}, {"b": {"c": None, "e": 4}}) == {"a": 1, "b": {"d": 3, "e": 4}}
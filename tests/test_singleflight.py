@@ -0,0 +1,36 @@
+import asyncio
+
+from app import RecipeAgent
+from router import IntentRouter
+from scheduler import BATCH, request_context
+from singleflight import SingleFlight
+
+
+def test_leader_cancellation_promotes_a_waiter():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.ensure_future(flights.ado("key", compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flights.ado("key", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*waiters)
+
+    # Un seul nouveau calcul, partagé par les trois appelants en attente
+    assert asyncio.run(main()) == [2, 2, 2]
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_calls_are_not_coalesced_across_priorities():
+    agent = RecipeAgent(router=IntentRouter(), flights=SingleFlight())
+    interactive = agent._flight_key("generate_recipes", "pâtes au pesto")
+    with request_context("client", BATCH):
+        batch = agent._flight_key("generate_recipes", "pâtes au pesto")
+    assert interactive != batch
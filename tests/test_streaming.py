@@ -0,0 +1,141 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import RecipeAgent
+from models import validate_recipes
+from streaming import IncrementalRecipeParser, format_sse, iter_stream_content, repair_json, salvage_recipes
+from transport import OpenAIClients, Transport
+
+
+def recipe(title, **extra):
+    return dict({
+        "title": title, "servings": "4", "prep_time": "10 min", "cook_time": "20 min", "difficulty": "Facile",
+        "ingredients": [{"name": "farine", "quantity": "200", "unit": "g"}, {"name": "oeufs", "quantity": "2"}],
+        "steps": [{"step_number": 1, "description": "Mélanger."}, {"step_number": 2, "description": "Cuire."}],
+        "tips": ["Servir tiède."],
+    }, **extra)
+
+
+def response(*recipes):
+    return json.dumps({"recipes": list(recipes)}, ensure_ascii=False)
+
+
+def test_repair_json():
+    assert json.loads(repair_json('{"a": [1, 2, ], "b": {"c": 1,\n }, }')) == {"a": [1, 2], "b": {"c": 1}}
+    # Dans une chaîne, rien n'est retiré et les caractères de contrôle deviennent des espaces
+    assert json.loads(repair_json('{"a": "x, ]\ty\nz"}')) == {"a": "x, ] y z"}
+    assert json.loads(repair_json(r'{"a": "il dit \"oui\", }", }')) == {"a": 'il dit "oui", }'}
+
+
+@pytest.mark.parametrize("cut", [
+    # Au milieu d'une chaîne de la troisième recette
+    lambda text: text[:text.rindex("Cuire") + 2],
+    # Dans le tableau des ingrédients de la troisième recette
+    lambda text: text[:text.rindex('"oeufs"')],
+    # Juste après la virgule qui suit la deuxième recette
+    lambda text: text[:text.index('{"title": "Gratin"')],
+])
+def test_truncated_response_keeps_complete_recipes(cut):
+    text = response(recipe("Tarte"), recipe("Soupe"), recipe("Gratin"))
+    salvaged = salvage_recipes(cut(text))
+    assert [item["title"] for item in salvaged] == ["Tarte", "Soupe"]
+    recipes, errors = validate_recipes(salvaged, 2)
+    assert errors == []
+    assert [r.title for r in recipes] == ["Tarte", "Soupe"]
+
+
+def test_escaped_quotes_and_unicode_escapes():
+    first = recipe('Tarte "maison"', tips=["Four à 180 °C, } pas plus"])
+    text = "Voici : " + json.dumps({"recipes": [first, recipe("Crème brûlée")]}, ensure_ascii=True)[:-3]
+    assert "\\u00e8" in text and '\\"maison\\"' in text
+    salvaged = salvage_recipes(text)
+    assert salvaged == [first]
+    recipes, errors = validate_recipes(salvaged)
+    assert errors == []
+    assert recipes[0].title == 'Tarte "maison"'
+    assert recipes[0].tips == ["Four à 180 °C, } pas plus"]
+
+
+def test_malformed_response_is_repaired():
+    # Texte autour, virgule en trop, caractère parasite entre deux recettes, retour à la ligne brut
+    tarte = json.dumps(recipe("Tarte"), ensure_ascii=False)[:-1] + ", }"
+    gratin = json.dumps(recipe("Gratin"), ensure_ascii=False).replace('"Gratin"', '"Gratin\nau four"')
+    text = '```json\n{"recipes": [' + tarte + ', ;\n' + gratin + "]}\n```"
+    recipes, errors = validate_recipes(salvage_recipes(text))
+    assert [r.title for r in recipes] == ["Tarte", "Gratin au four"]
+    assert errors == []
+
+
+def test_no_json():
+    assert salvage_recipes("Désolé, je ne peux pas répondre.") == []
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 10000])
+def test_parser_emits_each_recipe_once_complete(size):
+    text = response(recipe("Tarte"), recipe("Soupe {aux} [légumes]"), recipe("Gratin"))
+    parser = IncrementalRecipeParser()
+    emitted = []
+    for start in range(0, len(text), size):
+        chunk_text = text[start:start + size]
+        for item in parser.feed(chunk_text):
+            # La recette est restituée dans le fragment qui la termine
+            emitted.append((item["title"], start + len(chunk_text) >= text.index(item["title"])))
+    assert [title for title, _ in emitted] == ["Tarte", "Soupe {aux} [légumes]", "Gratin"]
+    assert all(in_order for _, in_order in emitted)
+    assert parser.count == 3
+    assert not parser.in_array
+
+
+def test_parser_reads_only_the_recipes_array():
+    text = '{"note": "recipes", "meta": {"recipes": [{"title": "x"}]}, "recipes": [' + json.dumps(recipe("Tarte")) + "]}"
+    parser = IncrementalRecipeParser()
+    assert [item["title"] for item in parser.feed(text)] == ["Tarte"]
+
+
+def stream_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+
+class ClosingStream:
+    def __init__(self, texts):
+        self.chunks = iter([stream_chunk(text) for text in texts])
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_is_closed_when_iteration_stops():
+    stream = ClosingStream(["a", "", "b"])
+    content = iter_stream_content(stream)
+    assert next(content) == "a"
+    content.close()
+    assert stream.closed
+
+
+class StreamingProvider:
+    def __init__(self, text, size):
+        self.chunks = [stream_chunk(text[i:i + size]) for i in range(0, len(text), size)]
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        return iter(self.chunks)
+
+
+def test_agent_streams_validated_recipes():
+    text = response(recipe("Tarte\n"), "pas une recette", recipe("Soupe"), recipe("Gratin"))
+    agent = RecipeAgent(transport=Transport(OpenAIClients.of(StreamingProvider(text, 50))), salvage=False)
+    recipes = list(agent.stream_recipes("trois recettes"))
+    assert [r["title"] for r in recipes] == ["Tarte", "Soupe", "Gratin"]
+
+
+def test_format_sse():
+    assert format_sse("recipe", {"index": 0}) == 'event: recipe\ndata: {"index":0}\n\n'
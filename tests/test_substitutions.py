@@ -0,0 +1,46 @@
+import pytest
+
+from nutrition import get_nutrition_database
+from substitutions import SubstitutionGraph
+
+
+@pytest.fixture
+def graph():
+    return SubstitutionGraph.load(nutrition=get_nutrition_database())
+
+
+@pytest.mark.parametrize("name, key", [
+    ("beurre demi-sel", "beurre"),
+    ("beure", "beurre"),
+    ("crème fraîche épaisse", "creme fraiche"),
+    ("oeufs bio", "oeuf"),
+    ("sucre de canne", "sucre roux"),
+])
+def test_names_resolve_to_the_graph(graph, name, key):
+    assert graph.resolve(name) == key
+
+
+@pytest.mark.parametrize("name", ["beurre de cacahuète", "crème de marrons", "beurre d'arachide"])
+def test_compounds_are_not_resolved_by_their_first_word(graph, name):
+    assert graph.resolve(name) is None
+    assert graph.answer(name) is None
+
+
+def test_unknown_compound_is_learned(graph, tmp_path):
+    graph.learned_path = str(tmp_path / "learned.jsonl")
+    options = [{"substitute": "purée d'amande", "ratio": 1, "tags": ["vegan"]}]
+    assert graph.learn("beurre de cacahuète", options) == 1
+    assert graph.resolve("beurre de cacahuètes") == "beurre de cacahuete"
+    assert graph.answer("beurre de cacahuète")["options"][0]["substitute"] == "purée d'amande"
+    # Le beurre garde ses propres remplaçants
+    assert graph.lookup("beurre")[1] != graph.lookup("beurre de cacahuète")[1]
+    # Le fichier appris est relu au démarrage
+    reloaded = SubstitutionGraph.load(nutrition=get_nutrition_database(), learned_path=graph.learned_path)
+    assert reloaded.resolve("beurre de cacahuète") == "beurre de cacahuete"
+
+
+def test_context_and_diet_filters(graph):
+    ingredient, substitutions = graph.lookup("beurre", "patisserie", ("vegan",))
+    assert ingredient == "beurre"
+    assert substitutions
+    assert all("vegan" in s.tags for s in substitutions)
@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from scheduler import INTERACTIVE, LLMScheduler, PrioritySlots, request_context
+from transport import CircuitBreaker, HedgePolicy, OpenAIClients, RetryPolicy, Transport
+
+
+class FailingProvider:
+    def __init__(self, error):
+        self.error = error
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        raise self.error
+
+
+class HangingProvider:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, timeout=None, **kwargs):
+        await asyncio.sleep(10)
+
+
+def half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    return breaker
+
+
+def status_error(status: int) -> openai.APIStatusError:
+    response = httpx.Response(status, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+    return openai.APIStatusError("erreur", response=response, body=None)
+
+
+def test_probe_is_released_on_local_error():
+    breaker = half_open_breaker()
+    transport = Transport(OpenAIClients.of(FailingProvider(ValueError("bug"))), RetryPolicy(max_retries=0), breaker)
+    with pytest.raises(ValueError):
+        transport.create("generate_recipes", model="m", messages=[])
+    # Le disjoncteur n'a pas changé d'état et accepte un nouvel appel de test
+    assert breaker.state == "half_open"
+    assert breaker.failures == 1
+    assert breaker.before_call() is True
+
+
+def test_probe_is_released_on_cancellation():
+    breaker = half_open_breaker()
+    transport = Transport(OpenAIClients.of(None, HangingProvider()), breaker=breaker)
+
+    async def main():
+        task = asyncio.ensure_future(transport.acreate("generate_recipes", model="m", messages=[]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert breaker.before_call() is True
+
+
+def test_only_client_errors_close_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=5)
+    breaker.record_failure()
+    transport = Transport(OpenAIClients.of(FailingProvider(status_error(400))), breaker=breaker)
+    with pytest.raises(openai.APIStatusError):
+        transport.create("generate_recipes", model="m", messages=[])
+    assert breaker.failures == 0
+
+    breaker.record_failure()
+    transport = Transport(OpenAIClients.of(FailingProvider(KeyError("choices"))), breaker=breaker)
+    with pytest.raises(KeyError):
+        transport.create("generate_recipes", model="m", messages=[])
+    assert breaker.failures == 1
+
+
+class RecordingProvider:
+    def __init__(self):
+        self.timeouts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        return SimpleNamespace(choices=[], usage=None)
+
+
+def test_call_timeout_keeps_the_connect_timeout():
+    provider = RecordingProvider()
+    transport = Transport(OpenAIClients.of(provider), timeouts={"generate_recipes": 20.0}, connect_timeout=5.0)
+    transport.create("generate_recipes", model="m", messages=[])
+    timeout = provider.timeouts[0]
+    assert isinstance(timeout, httpx.Timeout)
+    assert 19.0 < timeout.read <= 20.0
+    assert timeout.connect == 5.0
+    assert transport._call_timeout(2.0).connect == 2.0
+
+
+def test_rate_limits_do_not_open_the_breaker():
+    response = httpx.Response(429, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+    error = openai.RateLimitError("quota", response=response, body=None)
+    breaker = CircuitBreaker(failure_threshold=1)
+    transport = Transport(OpenAIClients.of(FailingProvider(error)), RetryPolicy(max_retries=1, base_delay=0), breaker)
+    with pytest.raises(openai.RateLimitError):
+        transport.create("generate_recipes", model="m", messages=[])
+    assert breaker.failures == 0
+    assert breaker.state == "closed"
+    assert transport.rate_limited == 2
+
+
+def completion(content):
+    message = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+class SlowModelProvider:
+    """Le modèle "slow" répond en `delay` secondes, les autres tout de suite"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.threads = []
+        self.finished = threading.Event()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, model=None, **kwargs):
+        self.threads.append(threading.current_thread())
+        if model == "slow":
+            time.sleep(self.delay)
+            self.finished.set()
+        return completion(model)
+
+
+class AsyncSlowModelProvider:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, timeout=None, model=None, **kwargs):
+        if model == "slow":
+            await asyncio.sleep(10)
+        return completion(model)
+
+
+def test_unhedged_call_stays_on_the_calling_thread():
+    provider = SlowModelProvider(0)
+    hedging = HedgePolicy(burst=0, budget=0)
+    transport = Transport(OpenAIClients.of(provider), hedging=hedging)
+    assert transport.create("generate_recipes", model="slow", messages=[]).choices[0].message.content == "slow"
+    assert provider.threads == [threading.current_thread()]
+
+
+def test_losing_primary_keeps_its_slot():
+    provider = SlowModelProvider(0.3)
+    slots = PrioritySlots(2)
+    hedging = HedgePolicy(initial_delay=0.02, min_delay=0.01, model="fast")
+    transport = Transport(OpenAIClients.of(provider), scheduler=LLMScheduler(slots=slots), hedging=hedging)
+    with request_context("client"):
+        response = transport.create("generate_recipes", model="slow", messages=[])
+    assert response.choices[0].message.content == "fast"
+    assert hedging.stats()["hedge_won"] == 1
+    # L'appel initial continue : sa place n'est pas rendue
+    assert slots.active[INTERACTIVE] == 1
+    assert provider.finished.wait(2)
+    deadline = time.monotonic() + 2
+    while slots.active[INTERACTIVE] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert slots.active[INTERACTIVE] == 0
+
+
+def test_cancelled_loser_records_a_censored_latency():
+    slots = PrioritySlots(2)
+    hedging = HedgePolicy(initial_delay=0.05, min_delay=0.01, model="fast")
+    transport = Transport(OpenAIClients.of(None, AsyncSlowModelProvider()), scheduler=LLMScheduler(slots=slots),
+                          hedging=hedging)
+
+    async def main():
+        with request_context("client"):
+            return await transport.acreate("generate_recipes", model="slow", messages=[])
+
+    assert asyncio.run(main()).choices[0].message.content == "fast"
+    latencies = sorted(hedging.latencies._tools["generate_recipes"])
+    # Le doublement gagnant, puis l'appel initial annulé, compté pour au moins le délai de doublement
+    assert len(latencies) == 2
+    assert latencies[-1] >= 0.05
+    assert hedging.stats()["abandoned"] == 1
+    assert slots.active[INTERACTIVE] == 0
@@ -0,0 +1,1068 @@
+"""Couche de transport vers l'API OpenAI.
+
+- pool de connexions keep-alive dimensionné (httpx), HTTP/2 si le paquet h2
+  est installé ;
+- délai maximal par outil (plus court pour les substitutions que pour la
+  génération de recettes), qui couvre toutes les tentatives ;
+- nouvelles tentatives sur 429, 5xx et erreurs réseau, avec backoff
+  exponentiel à jitter qui respecte l'en-tête Retry-After ;
+- disjoncteur : après plusieurs échecs consécutifs, les appels échouent
+  immédiatement pendant un temps de repos au lieu d'attendre le fournisseur.
+- ordonnanceur facultatif (scheduler.py) : quotas de tokens par client,
+  priorité des demandes interactives sur les lots et nombre maximal d'appels
+  simultanés ; le délai de l'outil court à partir de l'obtention d'une place.
+  Une réponse en streaming garde sa place jusqu'à la fin du flux.
+- clients créés au premier appel, et recréés dans chaque processus après un
+  fork : les workers ne partagent pas les connexions du processus parent.
+  Le SDK openai et httpx ne sont importés qu'à ce moment.
+- modèles par outil (RECIPE_MODEL_<OUTIL>) : la liste donne les modèles de
+  repli, utilisés tour à tour par les nouvelles tentatives ;
+- doublement d'appels facultatif (RECIPE_HEDGE) : si la réponse tarde au-delà
+  d'un centile des latences récentes de l'outil, un second appel est lancé
+  (éventuellement vers un autre modèle ou un autre serveur) et la première
+  réponse valide l'emporte, dans la limite d'une fraction du trafic.
+
+`OPENAI_BASE_URL` permet de viser un serveur OpenAI local de test.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+import types
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from limiter import Overloaded
+from metrics import ERRORS, LLM_DURATION, LLM_HEDGE_WASTED_TOKENS, LLM_HEDGES, LLM_TOKENS
+from scheduler import BATCH, LLMScheduler, build_scheduler_from_env, current_priority
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+# Délai total par outil, en secondes (surchargeable par RECIPE_TIMEOUT_<OUTIL>)
+DEFAULT_TOOL_TIMEOUTS = {
+    "generate_recipes": 45.0,
+    "generate_recipe": 25.0,
+    "complete_recipes": 30.0,
+    "edit_recipe": 20.0,
+    "stream_recipes": 60.0,
+    "analyze_ingredients": 20.0,
+    "suggest_substitutions": 10.0,
+    "expand_substitutions": 60.0,
+    "calculate_nutrition": 10.0,
+}
+DEFAULT_TIMEOUT = 30.0
+# Délai d'établissement de la connexion, borné par le délai restant de l'outil
+DEFAULT_CONNECT_TIMEOUT = 5.0
+
+# Outils dont les appels peuvent être doublés (ni le streaming ni les lots)
+DEFAULT_HEDGE_TOOLS = ("generate_recipes", "generate_recipe", "complete_recipes", "edit_recipe",
+                       "analyze_ingredients", "suggest_substitutions", "calculate_nutrition")
+
+
+class CircuitOpen(Exception):
+    """Levée quand le disjoncteur refuse un appel au fournisseur"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Service du modèle indisponible, réessayez plus tard")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Levée quand le délai de l'outil est écoulé avant une réponse"""
+
+    def __init__(self, tool: str, timeout: float):
+        super().__init__(f"Délai dépassé pour {tool} ({timeout:g} s)")
+        self.tool = tool
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert, partagé entre threads"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Lève CircuitOpen si le fournisseur est considéré comme dégradé
+
+        Retourne True si l'appel est l'appel de test du mode semi-ouvert :
+        l'appelant doit alors appeler end_probe une fois la tentative finie,
+        quelle qu'en soit l'issue.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpen(remaining)
+            # Semi-ouvert : un seul appel de test à la fois
+            if self._probing:
+                raise CircuitOpen(1.0)
+            self._probing = True
+            return True
+
+    def end_probe(self) -> None:
+        """Fin de l'appel de test, même interrompu sans verdict (annulation, erreur locale)"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    self.trips += 1
+                    logger.warning(f"Disjoncteur ouvert après {self.failures} échecs consécutifs")
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
+
+
+class RetryPolicy:
+    """Backoff exponentiel à jitter complet, borné par Retry-After et max_delay"""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        import openai
+
+        if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        """Délai demandé par le fournisseur (Retry-After / retry-after-ms)"""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            return None
+        return None
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        requested = self.retry_after(error)
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class TokenUsage:
+    """Tokens consommés par outil, d'après le champ usage des réponses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, Dict[str, int]] = {}
+
+    def record(self, tool: str, usage: Any) -> None:
+        if usage is None:
+            # Réponses en streaming : le SDK ne fournit pas l'usage
+            return
+        with self._lock:
+            counters = self._tools.setdefault(tool, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            counters["calls"] += 1
+            counters["prompt_tokens"] += usage.prompt_tokens or 0
+            counters["completion_tokens"] += usage.completion_tokens or 0
+        LLM_TOKENS.observe(usage.prompt_tokens or 0, tool=tool, kind="prompt")
+        LLM_TOKENS.observe(usage.completion_tokens or 0, tool=tool, kind="completion")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for tool, counters in self._tools.items():
+                calls = counters["calls"]
+                result[tool] = dict(
+                    counters,
+                    avg_prompt_tokens=round(counters["prompt_tokens"] / calls, 1),
+                    avg_completion_tokens=round(counters["completion_tokens"] / calls, 1),
+                )
+            return result
+
+
+# Clients à recréer dans le processus enfant après un fork
+_CLIENT_POOLS: "weakref.WeakSet[OpenAIClients]" = weakref.WeakSet()
+
+
+class OpenAIClients:
+    """Clients OpenAI synchrone et asynchrone, créés à la première utilisation
+
+    Après un fork (workers gunicorn lancés avec --preload), l'enfant oublie les
+    clients hérités et crée les siens : un pool de connexions partagé entre
+    processus mélangerait les réponses sur les mêmes sockets.
+    """
+
+    def __init__(self, factory: Callable[[], Tuple["OpenAI", "AsyncOpenAI"]]):
+        self.factory = factory
+        self._clients: Optional[Tuple["OpenAI", "AsyncOpenAI"]] = None
+        self._lock = threading.Lock()
+        _CLIENT_POOLS.add(self)
+
+    @classmethod
+    def of(cls, client: "OpenAI", async_client: Optional["AsyncOpenAI"] = None) -> "OpenAIClients":
+        """Enveloppe des clients déjà construits"""
+        clients = cls(lambda: (client, async_client))
+        clients._clients = (client, async_client)
+        return clients
+
+    def _get(self) -> Tuple["OpenAI", "AsyncOpenAI"]:
+        clients = self._clients
+        if clients is None:
+            with self._lock:
+                if self._clients is None:
+                    self._clients = self.factory()
+                clients = self._clients
+        return clients
+
+    @property
+    def client(self) -> "OpenAI":
+        return self._get()[0]
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        return self._get()[1]
+
+    @property
+    def created(self) -> bool:
+        return self._clients is not None
+
+    def _after_fork(self) -> None:
+        # Les clients hérités ne sont pas fermés : cela fermerait aussi les
+        # connexions encore utilisées par le processus parent
+        self._lock = threading.Lock()
+        self._clients = None
+
+
+def _reset_clients_after_fork() -> None:
+    for clients in list(_CLIENT_POOLS):
+        clients._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+class LatencyWindow:
+    """Latences des derniers appels réussis, par outil"""
+
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._tools: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, tool: str, seconds: float) -> None:
+        with self._lock:
+            window = self._tools.get(tool)
+            if window is None:
+                window = self._tools[tool] = deque(maxlen=self.size)
+            window.append(seconds)
+
+    def percentile(self, tool: str, percent: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._tools.get(tool, ()))
+        if len(values) < min_samples or not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class HedgePolicy:
+    """Quand doubler un appel, vers quel modèle ou serveur, et dans quelle limite
+
+    Le délai avant le second appel est le centile `percentile` des latences
+    récentes de l'outil (`initial_delay` tant qu'il y a moins de
+    `min_samples` mesures). Chaque appel crédite le budget de `budget`
+    doublement, plafonné à `burst` : sur la durée, au plus cette fraction des
+    appels est doublée.
+
+    Les appels synchrones qui peuvent être doublés passent par `workers`
+    threads réutilisés ; quand tous sont occupés, l'appel reste sur le thread
+    appelant, sans doublement.
+    """
+
+    def __init__(self, tools=DEFAULT_HEDGE_TOOLS, percentile: float = 95.0, initial_delay: float = 2.0,
+                 min_delay: float = 0.05, min_samples: int = 20, budget: float = 0.1, burst: float = 10.0,
+                 model: Optional[str] = None, clients: Optional[OpenAIClients] = None, workers: int = 64):
+        self.tools = frozenset(tools)
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.burst = burst
+        # Cible du second appel : autre modèle et/ou autre serveur (par défaut, les mêmes)
+        self.model = model
+        self.clients = clients
+        self.latencies = LatencyWindow()
+        self.workers = workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._busy = 0
+        self._credit = burst
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.outcomes = {"hedge_won": 0, "primary_won": 0, "failed": 0, "no_budget": 0, "no_slot": 0,
+                         "no_worker": 0}
+        self.wasted_tokens = 0
+        self.abandoned = 0
+
+    def applies(self, tool: str, kwargs: Dict[str, Any]) -> bool:
+        # Les lots n'ont pas d'utilisateur qui attend : ils ne sont jamais doublés
+        return tool in self.tools and not kwargs.get("stream") and current_priority() != BATCH
+
+    def delay(self, tool: str) -> float:
+        observed = self.latencies.percentile(tool, self.percentile, self.min_samples)
+        return max(self.min_delay, observed if observed is not None else self.initial_delay)
+
+    def on_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self._credit = min(self.burst, self._credit + self.budget)
+
+    def has_credit(self) -> bool:
+        with self._lock:
+            return self._credit >= 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            return True
+
+    def refund(self) -> None:
+        with self._lock:
+            self._credit = min(self.burst, self._credit + 1)
+
+    def submit(self, function: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """Exécute la fonction sur un thread réutilisé, dans le contexte courant ; None si tous sont occupés"""
+        with self._lock:
+            if self._pool_pid != os.getpid():
+                # Les threads du processus parent n'existent pas après un fork
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="llm-hedge")
+                self._pool_pid = os.getpid()
+                self._busy = 0
+            if self._busy >= self.workers:
+                return None
+            self._busy += 1
+            pool = self._pool
+        # Les rappels de fin (décompte des tokens) voient aussi le client de la requête
+        future = pool.submit(contextvars.copy_context().run, function, *args)
+        future.add_done_callback(self._worker_done)
+        return future
+
+    def _worker_done(self, future: Future) -> None:
+        with self._lock:
+            self._busy -= 1
+
+    def record(self, tool: str, outcome: str) -> None:
+        with self._lock:
+            self.outcomes[outcome] += 1
+        LLM_HEDGES.inc(tool=tool, outcome=outcome)
+
+    def abandon(self) -> None:
+        with self._lock:
+            self.abandoned += 1
+
+    def wasted(self, tool: str, usage: Any) -> None:
+        """Compte les tokens d'une réponse écartée"""
+        tokens = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0) if usage is not None else 0
+        with self._lock:
+            self.wasted_tokens += tokens
+        LLM_HEDGE_WASTED_TOKENS.inc(tokens, tool=tool)
+
+    def request(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(kwargs, model=self.model) if self.model else kwargs
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hedged = self.outcomes["hedge_won"] + self.outcomes["primary_won"] + self.outcomes["failed"]
+            return {
+                "calls": self.calls,
+                "hedged": hedged,
+                "hedge_rate": round(hedged / self.calls, 4) if self.calls else 0.0,
+                **self.outcomes,
+                "abandoned": self.abandoned,
+                "wasted_tokens": self.wasted_tokens,
+                "budget": self.budget,
+                "delays": {tool: round(self.delay(tool), 3) for tool in sorted(self.tools)},
+                "model": self.model,
+                "separate_endpoint": self.clients is not None,
+            }
+
+
+def default_accept(response: Any) -> bool:
+    """Réponse exploitable : non tronquée, avec un contenu ou un appel de fonction"""
+    choices = getattr(response, "choices", None)
+    if not choices:
+        return False
+    choice = choices[0]
+    if getattr(choice, "finish_reason", None) == "length":
+        return False
+    message = choice.message
+    return bool(getattr(message, "content", None) or getattr(message, "tool_calls", None))
+
+
+def _is_timeout(error: Exception) -> bool:
+    import openai
+
+    return isinstance(error, openai.APITimeoutError)
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    import openai
+
+    return isinstance(error, openai.RateLimitError)
+
+
+def _is_client_error(error: Exception) -> bool:
+    """Réponse 4xx du fournisseur : la requête est en cause, pas le service"""
+    import openai
+
+    return isinstance(error, openai.APIStatusError) and 400 <= error.status_code < 500
+
+
+def _with_stream_usage(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Demande l'usage dans le dernier fragment du flux (absent de cette version du SDK)"""
+    extra_body = dict(kwargs.get("extra_body") or {})
+    extra_body.setdefault("stream_options", {"include_usage": True})
+    return dict(kwargs, extra_body=extra_body)
+
+
+def _chunk_usage(chunk: Any) -> Any:
+    """Usage du dernier fragment d'un flux (stream_options.include_usage), s'il est présent"""
+    usage = getattr(chunk, "usage", None)
+    if isinstance(usage, dict):
+        # Champ inconnu de cette version du SDK : il reste un dictionnaire
+        return types.SimpleNamespace(prompt_tokens=usage.get("prompt_tokens"),
+                                     completion_tokens=usage.get("completion_tokens"))
+    return usage
+
+
+class HeldStream:
+    """Réponse en streaming qui garde la place de l'ordonnanceur jusqu'à la fin du flux
+
+    `finish` est appelée une seule fois, avec l'usage du flux s'il est connu,
+    quand le flux est épuisé, interrompu par une erreur ou fermé.
+    """
+
+    def __init__(self, stream: Any, finish: Callable[[Any], None]):
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._finish = finish
+        self._usage = None
+        self._done = False
+
+    def _release(self) -> None:
+        if not self._done:
+            self._done = True
+            self._finish(self._usage)
+
+    def __iter__(self) -> "HeldStream":
+        return self
+
+    def __next__(self) -> Any:
+        try:
+            chunk = next(self._iterator)
+        except BaseException:
+            self._release()
+            raise
+        usage = _chunk_usage(chunk)
+        if usage is not None:
+            self._usage = usage
+        return chunk
+
+    def close(self) -> None:
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+    def __del__(self) -> None:
+        # Flux abandonné sans être fermé : la place ne doit pas être perdue
+        self._release()
+
+
+class AsyncHeldStream:
+    """Version asynchrone de HeldStream"""
+
+    def __init__(self, stream: Any, finish: Callable[[Any], None]):
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._finish = finish
+        self._usage = None
+        self._done = False
+
+    def _release(self) -> None:
+        if not self._done:
+            self._done = True
+            self._finish(self._usage)
+
+    def __aiter__(self) -> "AsyncHeldStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            chunk = await self._iterator.__anext__()
+        except BaseException:
+            self._release()
+            raise
+        usage = _chunk_usage(chunk)
+        if usage is not None:
+            self._usage = usage
+        return chunk
+
+    async def close(self) -> None:
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                await close()
+        finally:
+            self._release()
+
+    def __del__(self) -> None:
+        self._release()
+
+
+class Transport:
+    """Appels chat.completions avec délai par outil, nouvelles tentatives et disjoncteur"""
+
+    def __init__(self, clients: OpenAIClients,
+                 retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 scheduler: Optional[LLMScheduler] = None,
+                 models: Optional[Dict[str, List[str]]] = None,
+                 hedging: Optional[HedgePolicy] = None,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT):
+        self.clients = clients
+        self.connect_timeout = connect_timeout
+        self.scheduler = scheduler
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.timeouts = dict(DEFAULT_TOOL_TIMEOUTS, **(timeouts or {}))
+        # Modèles par outil : le premier, puis les modèles de repli
+        self.models = models or {}
+        self.hedging = hedging
+        self.retries = 0
+        self.fallbacks = 0
+        self.rate_limited = 0
+        self.usage = TokenUsage()
+
+    def timeout_for(self, tool: str) -> float:
+        return self.timeouts.get(tool, DEFAULT_TIMEOUT)
+
+    def _call_timeout(self, remaining: float) -> Any:
+        """Délai d'une tentative : le reste du délai de l'outil, connexion comprise en moins de connect_timeout"""
+        import httpx
+
+        return httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining))
+
+    def _on_error(self, tool: str, error: Exception, attempt: int, deadline: float) -> float:
+        """Retourne l'attente avant la prochaine tentative, ou relève l'erreur"""
+        if not self.retry.is_retryable(error):
+            if _is_client_error(error):
+                # Erreur de la requête (4xx) : le fournisseur a répondu, il n'est pas en cause
+                self.breaker.record_success()
+            raise error
+        if _is_rate_limit(error):
+            # Quota du fournisseur : il répond, le disjoncteur n'a pas à couper tous les outils
+            self.rate_limited += 1
+        else:
+            self.breaker.record_failure()
+        delay = self.retry.delay(attempt, error)
+        # Chaque modèle de repli a droit à au moins une tentative
+        max_retries = max(self.retry.max_retries, len(self.models.get(tool, ())) - 1)
+        if (attempt >= max_retries or time.monotonic() + delay >= deadline
+                or self.breaker.state == "open"):
+            raise error
+        self.retries += 1
+        logger.warning(f"Nouvel essai {attempt + 1} pour {tool} dans {delay:.2f} s: {str(error)}")
+        return delay
+
+    def _remaining(self, tool: str, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(tool, self.timeout_for(tool))
+        return remaining
+
+    def _request(self, tool: str, attempt: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Paramètres de la tentative, avec le modèle de l'outil ou son modèle de repli"""
+        tiers = self.models.get(tool)
+        if not tiers:
+            return kwargs
+        index = min(attempt, len(tiers) - 1)
+        if index and index == attempt:
+            self.fallbacks += 1
+            logger.warning(f"Repli sur le modèle {tiers[index]} pour {tool}")
+        return dict(kwargs, model=tiers[index])
+
+    def _acquire(self, tool: str) -> Tuple[Optional[float], Optional[str]]:
+        """Quota et place de l'ordonnanceur : coût estimé et priorité de la place"""
+        if self.scheduler is None:
+            return None, None
+        return self.scheduler.acquire(tool)
+
+    async def _aacquire(self, tool: str) -> Tuple[Optional[float], Optional[str]]:
+        if self.scheduler is None:
+            return None, None
+        return await self.scheduler.aacquire(tool)
+
+    def _release(self, priority: Optional[str]) -> None:
+        if self.scheduler is not None and priority is not None:
+            self.scheduler.release(priority)
+
+    def _record(self, tool: str, cost: Optional[float], response: Any) -> None:
+        self._settle(tool, cost, getattr(response, "usage", None))
+
+    async def _arecord(self, tool: str, cost: Optional[float], response: Any) -> None:
+        usage = getattr(response, "usage", None)
+        self.usage.record(tool, usage)
+        if self.scheduler is not None:
+            await self.scheduler.asettle(tool, cost, usage)
+
+    def _settle(self, tool: str, cost: Optional[float], usage: Any) -> None:
+        self.usage.record(tool, usage)
+        if self.scheduler is not None:
+            self.scheduler.settle(tool, cost, usage)
+
+    def _discard(self, tool: str, response: Any) -> None:
+        """Réponse écartée au profit d'une autre : ses tokens restent dus"""
+        usage = getattr(response, "usage", None)
+        self.hedging.wasted(tool, usage)
+        if self.scheduler is not None:
+            self.scheduler.settle(tool, 0, usage)
+
+    def _discard_finished(self, tool: str, future: Future) -> None:
+        if future.exception() is None:
+            self._discard(tool, future.result())
+
+    def _reserve_hedge(self, tool: str) -> Optional[str]:
+        """Réserve une place et un crédit pour doubler l'appel ; retourne la priorité de la place"""
+        priority = current_priority()
+        # Un doublement ne fait jamais attendre une autre demande
+        if self.scheduler is not None and not self.scheduler.slots.try_acquire(priority):
+            self.hedging.record(tool, "no_slot")
+            return None
+        if not self.hedging.try_spend():
+            if self.scheduler is not None:
+                self.scheduler.slots.release(priority)
+            self.hedging.record(tool, "no_budget")
+            return None
+        return priority
+
+    def _release_hedge(self, priority: str) -> None:
+        if self.scheduler is not None:
+            self.scheduler.slots.release(priority)
+
+    def _invoke(self, clients: OpenAIClients, tool: str, kwargs: Dict[str, Any], timeout: float) -> Any:
+        start = time.monotonic()
+        with LLM_DURATION.time(tool=tool, outcome="ok"):
+            response = clients.client.chat.completions.create(timeout=self._call_timeout(timeout), **kwargs)
+        if self.hedging is not None:
+            self.hedging.latencies.observe(tool, time.monotonic() - start)
+        return response
+
+    async def _ainvoke(self, clients: OpenAIClients, tool: str, kwargs: Dict[str, Any], timeout: float) -> Any:
+        start = time.monotonic()
+        with LLM_DURATION.time(tool=tool, outcome="ok"):
+            response = await clients.async_client.chat.completions.create(timeout=self._call_timeout(timeout),
+                                                                           **kwargs)
+        if self.hedging is not None:
+            self.hedging.latencies.observe(tool, time.monotonic() - start)
+        return response
+
+    def _hedged(self, tool: str, kwargs: Dict[str, Any], timeout: float,
+                accept: Callable[[Any], bool]) -> Tuple[Any, Optional[Future]]:
+        """Double l'appel s'il tarde ; retourne la première réponse acceptée et l'appel initial s'il continue
+
+        Un appel synchrone ne peut pas être interrompu : le perdant se termine
+        sur son thread et ses tokens sont comptés comme perdus. Si c'est
+        l'appel initial, l'appelant garde sa place de l'ordonnanceur jusqu'à
+        sa fin. Sans doublement possible, l'appel reste sur le thread appelant.
+        """
+        policy = self.hedging
+        policy.on_call()
+        delay = policy.delay(tool)
+        if delay >= timeout or not policy.has_credit():
+            return self._invoke(self.clients, tool, kwargs, timeout), None
+        start = time.monotonic()
+        primary = policy.submit(self._invoke, self.clients, tool, kwargs, timeout)
+        if primary is None:
+            policy.record(tool, "no_worker")
+            return self._invoke(self.clients, tool, kwargs, timeout), None
+        if wait([primary], timeout=delay).done:
+            return primary.result(), None
+        priority = self._reserve_hedge(tool)
+        if priority is None:
+            return primary.result(), None
+        hedge = policy.submit(self._invoke, policy.clients or self.clients, tool, policy.request(kwargs),
+                              timeout - (time.monotonic() - start))
+        if hedge is None:
+            self._release_hedge(priority)
+            policy.refund()
+            policy.record(tool, "no_worker")
+            return primary.result(), None
+        hedge.add_done_callback(lambda _: self._release_hedge(priority))
+
+        roles = {primary: "primary", hedge: "hedge"}
+        pending = set(roles)
+        rejected: List[Any] = []
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                response = future.result()
+                if not accept(response):
+                    rejected.append(response)
+                    continue
+                policy.record(tool, f"{roles[future]}_won")
+                for other in rejected:
+                    self._discard(tool, other)
+                for loser in pending:
+                    policy.abandon()
+                    loser.add_done_callback(lambda future: self._discard_finished(tool, future))
+                return response, primary if primary in pending else None
+        policy.record(tool, "failed")
+        if rejected:
+            for other in rejected[1:]:
+                self._discard(tool, other)
+            return rejected[0], None
+        raise error
+
+    async def _ahedged(self, tool: str, kwargs: Dict[str, Any], timeout: float,
+                       accept: Callable[[Any], bool]) -> Any:
+        """Version coroutine de _hedged : l'appel perdant est annulé
+
+        Un appel annulé compte dans les latences de l'outil pour la durée
+        déjà écoulée, qui en est un minorant : sans cela, les appels les plus
+        lents, ceux qui perdent, disparaîtraient des mesures.
+        """
+        policy = self.hedging
+        policy.on_call()
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._ainvoke(self.clients, tool, kwargs, timeout))
+        roles = {primary: "primary"}
+        started = {primary: start}
+        decided = False
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=min(policy.delay(tool), timeout))
+            if done:
+                return primary.result()
+            priority = self._reserve_hedge(tool)
+            if priority is None:
+                return await primary
+
+            async def hedge_call() -> Any:
+                try:
+                    return await self._ainvoke(policy.clients or self.clients, tool, policy.request(kwargs),
+                                               timeout - (time.monotonic() - start))
+                finally:
+                    self._release_hedge(priority)
+
+            hedge = asyncio.ensure_future(hedge_call())
+            roles[hedge] = "hedge"
+            started[hedge] = time.monotonic()
+            pending = set(roles)
+            rejected: List[Any] = []
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    response = task.result()
+                    if not accept(response):
+                        rejected.append(response)
+                        continue
+                    policy.record(tool, f"{roles[task]}_won")
+                    decided = True
+                    for other in rejected:
+                        self._discard(tool, other)
+                    return response
+            policy.record(tool, "failed")
+            if rejected:
+                for other in rejected[1:]:
+                    self._discard(tool, other)
+                return rejected[0]
+            raise error
+        finally:
+            losers = [task for task in roles if not task.done()]
+            for task in losers:
+                # Ferme la connexion : le fournisseur interrompt la génération
+                policy.abandon()
+                task.cancel()
+                if decided:
+                    # Latence censurée : l'appel aurait duré au moins jusqu'ici
+                    policy.latencies.observe(tool, time.monotonic() - started[task])
+            if losers:
+                # Les places ne sont rendues qu'une fois les perdants terminés
+                await asyncio.wait(losers)
+
+    def create(self, tool: str, accept: Optional[Callable[[Any], bool]] = None, **kwargs: Any) -> Any:
+        """client.chat.completions.create avec la politique de l'outil
+
+        `accept` indique si une réponse est exploitable quand l'appel est
+        doublé (par défaut : non tronquée et non vide).
+        """
+        if kwargs.get("stream"):
+            kwargs = _with_stream_usage(kwargs)
+        try:
+            cost, priority = self._acquire(tool)
+            held = False
+            try:
+                deadline = time.monotonic() + self.timeout_for(tool)
+                attempt = 0
+                while True:
+                    probe = self.breaker.before_call()
+                    try:
+                        remaining = self._remaining(tool, deadline)
+                        request = self._request(tool, attempt, kwargs)
+                        try:
+                            if self.hedging is not None and self.hedging.applies(tool, request):
+                                response, loser = self._hedged(tool, request, remaining, accept or default_accept)
+                                if loser is not None:
+                                    # L'appel initial continue : la place est rendue à sa fin
+                                    held = True
+                                    loser.add_done_callback(lambda _: self._release(priority))
+                            else:
+                                response = self._invoke(self.clients, tool, request, remaining)
+                        except Exception as e:
+                            if _is_timeout(e):
+                                self.breaker.record_failure()
+                                raise DeadlineExceeded(tool, self.timeout_for(tool))
+                            time.sleep(self._on_error(tool, e, attempt, deadline))
+                            attempt += 1
+                            continue
+                        self.breaker.record_success()
+                        if kwargs.get("stream"):
+                            # La génération ne fait que commencer : la place est gardée jusqu'à la fin du flux
+                            held = True
+                            return HeldStream(response, self._stream_finisher(tool, cost, priority))
+                        self._record(tool, cost, response)
+                        return response
+                    finally:
+                        if probe:
+                            self.breaker.end_probe()
+            finally:
+                if not held:
+                    self._release(priority)
+        except Exception as e:
+            ERRORS.inc(stage="llm", type=type(e).__name__)
+            raise
+
+    async def acreate(self, tool: str, accept: Optional[Callable[[Any], bool]] = None, **kwargs: Any) -> Any:
+        """Version coroutine de create"""
+        if kwargs.get("stream"):
+            kwargs = _with_stream_usage(kwargs)
+        try:
+            cost, priority = await self._aacquire(tool)
+            held = False
+            try:
+                deadline = time.monotonic() + self.timeout_for(tool)
+                attempt = 0
+                while True:
+                    probe = self.breaker.before_call()
+                    try:
+                        remaining = self._remaining(tool, deadline)
+                        request = self._request(tool, attempt, kwargs)
+                        try:
+                            if self.hedging is not None and self.hedging.applies(tool, request):
+                                response = await self._ahedged(tool, request, remaining, accept or default_accept)
+                            else:
+                                response = await self._ainvoke(self.clients, tool, request, remaining)
+                        except Exception as e:
+                            if _is_timeout(e):
+                                self.breaker.record_failure()
+                                raise DeadlineExceeded(tool, self.timeout_for(tool))
+                            await asyncio.sleep(self._on_error(tool, e, attempt, deadline))
+                            attempt += 1
+                            continue
+                        self.breaker.record_success()
+                        if kwargs.get("stream"):
+                            held = True
+                            return AsyncHeldStream(response, self._stream_finisher(tool, cost, priority))
+                        await self._arecord(tool, cost, response)
+                        return response
+                    finally:
+                        if probe:
+                            self.breaker.end_probe()
+            finally:
+                if not held:
+                    self._release(priority)
+        except Exception as e:
+            ERRORS.inc(stage="llm", type=type(e).__name__)
+            raise
+
+    def _stream_finisher(self, tool: str, cost: Optional[float], priority: Optional[str]) -> Callable[[Any], None]:
+        """Fin d'un flux : ajuste les quotas d'après l'usage, puis rend la place"""
+        def finish(usage: Any) -> None:
+            try:
+                self._settle(tool, cost, usage)
+            finally:
+                self._release(priority)
+        return finish
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+            "rate_limited": self.rate_limited,
+            "models": self.models,
+            "circuit": self.breaker.stats(),
+            "timeouts": self.timeouts,
+            "tokens": self.usage.stats(),
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+            "hedging": self.hedging.stats() if self.hedging is not None else None,
+            "clients_created": self.clients.created,
+        }
+
+
+def describe_error(error: Exception) -> Dict[str, Any]:
+    """Réponse d'erreur d'un outil, avec le délai conseillé si le service est indisponible"""
+    import openai
+
+    if isinstance(error, CircuitOpen):
+        return {"error": str(error), "retry_after": round(error.retry_after, 1)}
+    if isinstance(error, Overloaded):
+        return {"error": error.message, "retry_after": error.retry_after}
+    if isinstance(error, openai.RateLimitError):
+        retry_after = RetryPolicy.retry_after(error)
+        return {"error": "Limite de débit du fournisseur atteinte", "retry_after": retry_after or 1}
+    return {"error": str(error)}
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("RECIPE_HTTP2", "0").lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("RECIPE_HTTP2 est activé mais le paquet h2 n'est pas installé, HTTP/1.1 est utilisé")
+        return False
+    return True
+
+
+def build_openai_clients(api_key: Optional[str], base_url: Optional[str] = None):
+    """Crée les clients OpenAI synchrone et asynchrone sur des pools httpx dimensionnés
+
+    Les nouvelles tentatives du SDK sont désactivées : elles sont gérées par
+    Transport, dans le délai de chaque outil.
+    """
+    if not api_key:
+        raise ValueError("La clé API OpenAI n'est pas définie. Veuillez créer un fichier .env avec OPENAI_API_KEY=votre_clé_api")
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("RECIPE_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("RECIPE_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("RECIPE_HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+    timeout = httpx.Timeout(DEFAULT_TIMEOUT, connect=float(os.getenv("RECIPE_CONNECT_TIMEOUT", str(DEFAULT_CONNECT_TIMEOUT))))
+    http2 = _http2_enabled()
+    base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+
+    client = OpenAI(
+        api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout,
+        http_client=httpx.Client(limits=limits, timeout=timeout, http2=http2),
+    )
+    async_client = AsyncOpenAI(
+        api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout,
+        http_client=httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2),
+    )
+    return client, async_client
+
+
+def build_hedge_clients_from_env(api_key: Optional[str]) -> Optional[OpenAIClients]:
+    """Clients vers le serveur des appels doublés (RECIPE_HEDGE_BASE_URL), s'il diffère"""
+    base_url = os.getenv("RECIPE_HEDGE_BASE_URL")
+    if not base_url:
+        return None
+    hedge_key = os.getenv("RECIPE_HEDGE_API_KEY") or api_key
+    return OpenAIClients(lambda: build_openai_clients(hedge_key, base_url))
+
+
+def build_hedging_from_env(clients: Optional[OpenAIClients] = None) -> Optional[HedgePolicy]:
+    """Construit la politique de doublement d'appels à partir des variables RECIPE_HEDGE_*"""
+    if os.getenv("RECIPE_HEDGE", "0").lower() not in ("1", "true", "yes"):
+        return None
+    tools = os.getenv("RECIPE_HEDGE_TOOLS")
+    return HedgePolicy(
+        tools=[tool.strip() for tool in tools.split(",") if tool.strip()] if tools else DEFAULT_HEDGE_TOOLS,
+        percentile=float(os.getenv("RECIPE_HEDGE_PERCENTILE", "95")),
+        initial_delay=float(os.getenv("RECIPE_HEDGE_DELAY", "2")),
+        min_samples=int(os.getenv("RECIPE_HEDGE_MIN_SAMPLES", "20")),
+        budget=float(os.getenv("RECIPE_HEDGE_BUDGET", "0.1")),
+        model=os.getenv("RECIPE_HEDGE_MODEL") or None,
+        clients=clients,
+        workers=int(os.getenv("RECIPE_HEDGE_WORKERS", "64")),
+    )
+
+
+def build_transport_from_env(clients: OpenAIClients, hedge_clients: Optional[OpenAIClients] = None) -> Transport:
+    """Construit la couche de transport à partir des variables d'environnement"""
+    timeouts = {}
+    models = {}
+    for tool in DEFAULT_TOOL_TIMEOUTS:
+        value = os.getenv(f"RECIPE_TIMEOUT_{tool.upper()}")
+        if value:
+            timeouts[tool] = float(value)
+        value = os.getenv(f"RECIPE_MODEL_{tool.upper()}")
+        if value:
+            models[tool] = [model.strip() for model in value.split(",") if model.strip()]
+    retry = RetryPolicy(
+        max_retries=int(os.getenv("RECIPE_MAX_RETRIES", "2")),
+        base_delay=float(os.getenv("RECIPE_RETRY_BASE_DELAY", "0.5")),
+        max_delay=float(os.getenv("RECIPE_RETRY_MAX_DELAY", "8")),
+    )
+    breaker = CircuitBreaker(
+        failure_threshold=int(os.getenv("RECIPE_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("RECIPE_BREAKER_RESET", "30")),
+    )
+    return Transport(clients, retry, breaker, timeouts, build_scheduler_from_env(), models,
+                     build_hedging_from_env(hedge_clients),
+                     connect_timeout=float(os.getenv("RECIPE_CONNECT_TIMEOUT", str(DEFAULT_CONNECT_TIMEOUT))))
@@ -0,0 +1,182 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const sendButton = document.getElementById('sendButton');
+    const userInput = document.getElementById('userInput');
+    const response = document.getElementById('response');
+    const error = document.getElementById('error');
+    const question = document.getElementById('question');
+    // Session de conversation : permet de retoucher les recettes déjà affichées
+    let sessionId = null;
+
+    function formatRecipe(recipe, index) {
+        let formattedResponse = '';
+        if (!recipe) return formattedResponse;
+
+        formattedResponse += `Recette ${index + 1}: ${recipe.title || 'Sans titre'}\n`;
+        formattedResponse += `Pour ${recipe.servings || '?'} personnes\n`;
+        formattedResponse += `Temps de préparation: ${recipe.prep_time || '?'}\n`;
+        formattedResponse += `Temps de cuisson: ${recipe.cook_time || '?'}\n`;
+        formattedResponse += `Difficulté: ${recipe.difficulty || '?'}\n\n`;
+
+        if (recipe.ingredients && Array.isArray(recipe.ingredients)) {
+            formattedResponse += 'Ingrédients:\n';
+            recipe.ingredients.forEach(ing => {
+                if (ing) {
+                    formattedResponse += `- ${ing.quantity || '?'} ${ing.unit || ''} de ${ing.name || '?'}\n`;
+                }
+            });
+        }
+
+        if (recipe.steps && Array.isArray(recipe.steps)) {
+            formattedResponse += '\nÉtapes:\n';
+            recipe.steps.forEach(step => {
+                if (step) {
+                    formattedResponse += `${step.step_number || '?'}. ${step.description || '?'}\n`;
+                }
+            });
+        }
+
+        if (recipe.tips && Array.isArray(recipe.tips)) {
+            formattedResponse += '\nConseils:\n';
+            recipe.tips.forEach(tip => {
+                if (tip) {
+                    formattedResponse += `- ${tip}\n`;
+                }
+            });
+        }
+
+        formattedResponse += '\n' + '-'.repeat(50) + '\n\n';
+        return formattedResponse;
+    }
+
+    function showError(message) {
+        error.textContent = 'Erreur: ' + message;
+        response.className = '';
+    }
+
+    function handleResult(data) {
+        if (data.error) {
+            showError(data.error);
+            response.textContent = '';
+            return;
+        }
+
+        if (data.type === 'recipes' && data.data && data.data.recipes && Array.isArray(data.data.recipes)) {
+            response.textContent = data.data.recipes.map(formatRecipe).join('');
+        } else if (data.type === 'analysis' && data.data && typeof data.data.analysis === 'string') {
+            // Recettes du garde-manger : la liste puis le détail de chacune
+            const recipes = Array.isArray(data.data.recipes) ? data.data.recipes : [];
+            response.textContent = data.data.analysis + '\n\n' + recipes.map(formatRecipe).join('');
+        } else if (data.type === 'substitutions' && data.data && typeof data.data.substitutions === 'string') {
+            response.textContent = data.data.substitutions;
+        } else {
+            response.textContent = 'Format de réponse inattendu. Voici la réponse brute:\n' + JSON.stringify(data, null, 2);
+        }
+        response.className = '';
+    }
+
+    // Traite un événement SSE reçu depuis /api/chat/stream
+    function handleEvent(rawEvent, state) {
+        let eventName = 'message';
+        let dataText = '';
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                eventName = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataText += line.slice(5).trim();
+            }
+        });
+        const data = dataText ? JSON.parse(dataText) : {};
+        console.log('Événement reçu:', eventName, data);
+
+        if (eventName === 'session') {
+            sessionId = data.session_id;
+        } else if (eventName === 'recipe') {
+            if (state.received === 0) {
+                response.textContent = '';
+                response.className = '';
+            }
+            state.received += 1;
+            response.textContent += formatRecipe(data.recipe, data.index);
+        } else if (eventName === 'result') {
+            handleResult(data);
+        } else if (eventName === 'error') {
+            showError(data.error);
+            if (state.received === 0) {
+                response.textContent = '';
+            }
+        }
+    }
+
+    async function sendMessage() {
+        const message = userInput.value;
+
+        if (!message) return;
+
+        // Afficher la question
+        question.textContent = 'Votre demande : ' + message;
+
+        response.textContent = 'Chargement...';
+        response.className = 'loading';
+        error.textContent = '';
+        userInput.value = '';
+
+        try {
+            console.log('Envoi de la requête...');
+            console.log('Message:', message);
+
+            const payload = { message: message };
+            if (sessionId) {
+                payload.session_id = sessionId;
+            }
+            const requestBody = JSON.stringify(payload);
+            console.log('Corps de la requête:', requestBody);
+
+            const res = await fetch('/api/chat/stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: requestBody
+            });
+
+            console.log('Réponse reçue:', res.status);
+
+            if (!res.ok) {
+                throw new Error(`HTTP error! status: ${res.status}`);
+            }
+
+            // Lecture du flux : chaque recette est affichée dès sa réception
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            const state = { received: 0 };
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary = buffer.indexOf('\n\n');
+                while (boundary !== -1) {
+                    handleEvent(buffer.slice(0, boundary), state);
+                    buffer = buffer.slice(boundary + 2);
+                    boundary = buffer.indexOf('\n\n');
+                }
+            }
+        } catch (error) {
+            console.error('Erreur complète:', error);
+            document.getElementById('error').textContent = 'Erreur: ' + error.message;
+            response.textContent = '';
+            response.className = '';
+        }
+    }
+
+    // Ajouter les écouteurs d'événements
+    sendButton.addEventListener('click', sendMessage);
+    userInput.addEventListener('keypress', function(e) {
+        if (e.key === 'Enter') {
+            sendMessage();
+        }
+    });
+});